@@ -0,0 +1,268 @@
+# Author: Sean Tyler
+# Description:  A batched NumPy representation of many BuildersGame positions, for training and bulk analysis.
+#               A batch of N positions is an N x 25 uint8 array of cell heights in square order (y * 5 + x), an
+#               N x 4 int8 array of builder squares (player 1's two then player 2's two, UNPLACED if not placed), an
+#               array of N sides to move (0 for x, 1 for o) and an array of N game states (see STATE_NAMES).
+#               Legal move counts, wins and feature planes are worked out for the whole batch at once with array
+#               operations over precomputed neighbour tables, rather than one BuildersGame at a time.
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from builders_game import BuildersGame, CELLS, COORDS, MAX_HEIGHT, NEIGHBORS, SIZE
+
+# Game states, as codes and as the strings of BuildersGame.get_current_state.
+UNFINISHED = 0
+X_WON = 1
+O_WON = 2
+STATE_NAMES = ("UNFINISHED", "X_WON", "O_WON")
+
+# ADJACENT[a, b] is True when cells a and b are one step apart (see NEIGHBORS).
+ADJACENT = np.array([[bool(NEIGHBORS[square] >> other & 1) for other in range(CELLS)] for square in range(CELLS)])
+# As floats, so that build counts are a matrix product NumPy hands to BLAS.  The counts are small enough to be exact.
+ADJACENT_COUNTS = ADJACENT.astype(np.float32)
+
+# The planes of feature_planes, each a 5 x 5 board seen by the side to move.
+FEATURE_PLANES = ("height 0", "height 1", "height 2", "height 3", "height 4", "own builders", "opponent builders",
+                  "own steps", "opponent steps", "x to move")
+
+
+def get_occupied(builders):
+    """Returns an N x 25 bool array of the cells holding a builder, from an N x 4 array of builder squares."""
+    occupied = np.zeros((len(builders), CELLS), dtype=bool)
+    rows = np.arange(len(builders))
+    for index in range(4):
+        squares = builders[:, index]
+        placed = squares >= 0
+        occupied[rows[placed], squares[placed]] = True
+    return occupied
+
+
+def get_steps(heights, squares, occupied):
+    """Returns an N x 25 bool array of the cells a builder on each of the N squares can step to: vacant neighbours
+    no more than one level higher or lower.  An UNPLACED builder has no steps."""
+    placed = squares >= 0
+    squares = np.where(placed, squares, 0).astype(np.intp)
+    height = heights[np.arange(len(heights)), squares].astype(np.int16)[:, None]
+    cells = heights.astype(np.int16)
+    # A builder on height 3 may step onto a dome, as in BuildersGame, though the game is over by then.
+    ceiling = np.where(height >= 3, MAX_HEIGHT, height + 1)
+    return ADJACENT[squares] & ~occupied & (cells >= height - 1) & (cells <= ceiling) & placed[:, None]
+
+
+def get_builds(heights, squares, occupied):
+    """Returns an N x 25 int16 array of how many cells a builder leaving each of the N squares could build on after
+    stepping to each cell: neighbours below the max height that are vacant once the builder has left."""
+    free = (heights < MAX_HEIGHT) & ~occupied
+    placed = squares >= 0
+    free[np.arange(len(heights))[placed], squares[placed]] = True
+    return (free.astype(np.float32) @ ADJACENT_COUNTS).astype(np.int16)
+
+
+def count_moves(heights, builders, turns, occupied=None):
+    """Returns an array of the number of moves the side to move has in each position, counting every (builder,
+    destination, build) triple, whatever the game state.  Positions with any builder unplaced have none.
+
+    Parameters
+    ----------
+    heights : numpy.ndarray
+        N x 25 cell heights.
+    builders : numpy.ndarray
+        N x 4 builder squares.
+    turns : numpy.ndarray
+        N sides to move, 0 for x and 1 for o.
+    occupied : numpy.ndarray
+        N x 25 occupancy, as from get_occupied.  Worked out from builders if None.
+    """
+    if occupied is None:
+        occupied = get_occupied(builders)
+    rows = np.arange(len(heights))
+    counts = np.zeros(len(heights), dtype=np.int32)
+    for offset in range(2):
+        squares = builders[rows, 2 * turns.astype(np.intp) + offset]
+        steps = get_steps(heights, squares, occupied)
+        counts += (steps * get_builds(heights, squares, occupied)).sum(axis=1, dtype=np.int32)
+    return np.where((builders >= 0).all(axis=1), counts, 0)
+
+
+def has_moves(heights, builders, turns, occupied=None):
+    """Returns a bool array of whether the side to move has any move in each position, whatever the game state.  A
+    builder that can step can always build, at least on the cell it left, so only steps are looked at.  Positions
+    with any builder unplaced have none."""
+    if occupied is None:
+        occupied = get_occupied(builders)
+    rows = np.arange(len(heights))
+    found = np.zeros(len(heights), dtype=bool)
+    for offset in range(2):
+        found |= get_steps(heights, builders[rows, 2 * turns.astype(np.intp) + offset], occupied).any(axis=1)
+    return found & (builders >= 0).all(axis=1)
+
+
+class BuildersBatch:
+    """A batch of BuildersGame positions held as NumPy arrays (see the module description).  The arrays are used as
+    given, not copied.
+
+    Parameters
+    ----------
+    heights : numpy.ndarray
+        N x 25 uint8 cell heights.
+    builders : numpy.ndarray
+        N x 4 int8 builder squares.
+    turns : numpy.ndarray
+        N uint8 sides to move, 0 for x and 1 for o.  All x if None.
+    states : numpy.ndarray
+        N uint8 game states (see STATE_NAMES).  All UNFINISHED if None.
+    """
+
+    def __init__(self, heights, builders, turns=None, states=None):
+        """Initializes the BuildersBatch class."""
+        if heights.ndim != 2 or heights.shape[1] != CELLS or builders.shape != (len(heights), 4):
+            raise ValueError("A batch needs N x " + str(CELLS) + " heights and N x 4 builders")
+        self._heights = heights
+        self._builders = builders
+        self._turns = np.zeros(len(heights), dtype=np.uint8) if turns is None else turns
+        self._states = np.zeros(len(heights), dtype=np.uint8) if states is None else states
+
+    def __len__(self):
+        return len(self._heights)
+
+    @classmethod
+    def from_games(cls, games):
+        """Returns a new batch holding the positions of a sequence of BuildersGame instances."""
+        games = list(games)
+        levels = np.array([game.get_levels()[1:MAX_HEIGHT + 1] for game in games], dtype=np.uint32)
+        levels = levels.reshape(len(games), MAX_HEIGHT)
+        bits = levels[:, :, None] >> np.arange(CELLS, dtype=np.uint32) & 1
+        heights = bits.sum(axis=1, dtype=np.uint8)
+        builders = np.array([game.get_builders() for game in games], dtype=np.int8).reshape(len(games), 4)
+        turns = np.array([game.get_turn() == 'o' for game in games], dtype=np.uint8)
+        states = np.array([STATE_NAMES.index(game.get_current_state()) for game in games], dtype=np.uint8)
+        return cls(heights, builders, turns, states)
+
+    def to_games(self):
+        """Returns a list of new BuildersGame instances, one per position.  Their move histories are empty."""
+        games = []
+        for heights, builders, turn, state in zip(self._heights.tolist(), self._builders.tolist(),
+                                                  self._turns.tolist(), self._states.tolist()):
+            game = BuildersGame()
+            game.set_position(heights, builders, 'o' if turn else 'x', STATE_NAMES[state])
+            games.append(game)
+        return games
+
+    def get_heights(self):
+        """Returns the N x 25 array of cell heights.  Not a copy."""
+        return self._heights
+
+    def get_builders(self):
+        """Returns the N x 4 array of builder squares.  Not a copy."""
+        return self._builders
+
+    def get_turns(self):
+        """Returns the array of sides to move, 0 for x and 1 for o.  Not a copy."""
+        return self._turns
+
+    def get_states(self):
+        """Returns the array of game states (see STATE_NAMES).  Not a copy."""
+        return self._states
+
+    def get_occupied(self):
+        """Returns the N x 25 bool array of the cells holding a builder."""
+        return get_occupied(self._builders)
+
+    def count_legal_moves(self):
+        """Returns the number of legal moves of the side to move in each position, as BuildersGame.legal_moves
+        would yield: none once the game is over or before every builder is placed."""
+        counts = count_moves(self._heights, self._builders, self._turns)
+        return np.where(self._states == UNFINISHED, counts, 0)
+
+    def find_wins(self):
+        """Returns the state each position is won in by a builder standing on height 3 or higher: X_WON or O_WON,
+        or UNFINISHED if no builder is.  Player 1 is checked first."""
+        rows = np.arange(len(self._heights))[:, None]
+        builders = self._builders.astype(np.intp)
+        on_top = (self._heights[rows, np.where(builders >= 0, builders, 0)] >= 3) & (builders >= 0)
+        return np.where(on_top[:, :2].any(axis=1), X_WON,
+                        np.where(on_top[:, 2:].any(axis=1), O_WON, UNFINISHED)).astype(np.uint8)
+
+    def compute_states(self):
+        """Returns the game state of each position worked out from the position alone: won by a builder on height
+        3, else won by the player who just moved if the side to move has no moves, else UNFINISHED.  Positions with
+        a builder unplaced are UNFINISHED."""
+        states = self.find_wins()
+        placed = (self._builders >= 0).all(axis=1)
+        stuck = placed & (states == UNFINISHED) & ~has_moves(self._heights, self._builders, self._turns)
+        return np.where(stuck, np.where(self._turns == 0, O_WON, X_WON), states).astype(np.uint8)
+
+    def feature_planes(self):
+        """Returns an N x 10 x 5 x 5 uint8 array of feature planes, as named in FEATURE_PLANES, seen by the side to
+        move: one-hot heights, each side's builders, the cells each side's builders can step to, and whether x is
+        to move."""
+        count = len(self._heights)
+        planes = np.zeros((count, len(FEATURE_PLANES), CELLS), dtype=np.uint8)
+        planes[:, :MAX_HEIGHT + 1] = self._heights[:, None, :] == np.arange(MAX_HEIGHT + 1)[None, :, None]
+        occupied = get_occupied(self._builders)
+        rows = np.arange(count)
+        turns = self._turns.astype(np.intp)
+        for side, plane in ((turns, 5), (1 - turns, 6)):
+            for offset in range(2):
+                squares = self._builders[rows, 2 * side + offset]
+                placed = squares >= 0
+                planes[rows[placed], plane, squares[placed]] = 1
+                planes[:, plane + 2] |= get_steps(self._heights, squares, occupied)
+        planes[:, 9] = (self._turns == 0)[:, None]
+        return planes.reshape(count, len(FEATURE_PLANES), SIZE, SIZE)
+
+
+def random_batch(count, plies, seed=None):
+    """Returns a batch of count positions, each reached by placing the builders at random and playing up to the
+    given number of random moves with BuildersGame, and the list of games.  For benchmarks and checks."""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = BuildersGame()
+        squares = rng.sample(range(CELLS), 4)
+        game.initial_placement(*COORDS[squares[0]], *COORDS[squares[1]], 'x')
+        game.initial_placement(*COORDS[squares[2]], *COORDS[squares[3]], 'o')
+        for _ in range(rng.randint(0, plies)):
+            moves = list(game.legal_moves())
+            if not moves:
+                break
+            init, destination, build = rng.choice(moves)
+            game.make_move(*init, *destination, *build)
+        games.append(game)
+    return BuildersBatch.from_games(games), games
+
+
+def main():
+    """Command line entry point.  Times the batch kernels against BuildersGame on random positions."""
+    parser = argparse.ArgumentParser(description="Time the batched builders game kernels on random positions.")
+    parser.add_argument("--positions", type=int, default=10000, help="positions in the batch (default 10000)")
+    parser.add_argument("--plies", type=int, default=20, help="most random moves per position (default 20)")
+    parser.add_argument("--seed", type=int, help="random seed")
+    args = parser.parse_args()
+
+    batch, games = random_batch(args.positions, args.plies, args.seed)
+    timings = []
+    start_time = time.perf_counter()
+    counts = batch.count_legal_moves()
+    timings.append(("count_legal_moves", time.perf_counter() - start_time))
+    start_time = time.perf_counter()
+    batch.compute_states()
+    timings.append(("compute_states", time.perf_counter() - start_time))
+    start_time = time.perf_counter()
+    batch.feature_planes()
+    timings.append(("feature_planes", time.perf_counter() - start_time))
+    start_time = time.perf_counter()
+    expected = [sum(1 for _ in game.legal_move_squares()) for game in games]
+    timings.append(("BuildersGame.legal_move_squares", time.perf_counter() - start_time))
+    for name, elapsed in timings:
+        print("%-32s %10.0f positions/s" % (name, len(batch) / max(elapsed, 1e-9)))
+    if counts.tolist() != expected:
+        raise SystemExit("Batch move counts differ from BuildersGame")
+
+
+if __name__ == "__main__":
+    main()
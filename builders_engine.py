@@ -0,0 +1,308 @@
+# Author: Sean Tyler
+# Description:  An alpha-beta search engine for BuildersGame, for use as a computer opponent.  Iterative deepening
+#               negamax over undoable moves (BuildersGame.push and pop), with a height plus mobility evaluation, a
+#               transposition table keyed by BuildersGame.get_canonical_key so that symmetric positions share
+#               entries, and a per-move time budget.  A table of solved positions (see builders_solver) may be
+#               given, so that solved positions are looked up rather than searched.
+
+import argparse
+import time
+
+from builders_game import BuildersGame, COORDS, INVERSE_SYMMETRIES, MAX_HEIGHT, NEIGHBORS, SYMMETRIES
+from builders_solver import LOSS, WIN, SolverTable
+from search import CHECK_INTERVAL, INFINITY, MATE_SCORE, MAX_PLY, SearchResult, SearchTimeout, \
+    score_from_table, score_to_table
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Score of a builder standing on each height.  A builder on height 3 has already won.
+HEIGHT_VALUES = (0, 30, 90, 0, 0)
+
+# Score per cell a player's builders can step to, over the opponent's.
+MOBILITY_WEIGHT = 4
+
+# Score per vacant height 3 cell next to a player's builder on height 2, over the opponent's.  The side to move wins
+# with any one of these, so the weight only matters for the opponent's.
+THREAT_WEIGHT = 150
+
+# Moves are stored in the transposition table as builder * 625 + destination * 25 + build, with the squares mapped
+# onto the canonical position (see BuildersGame.get_canonical_form).
+MOVE_BASE = 25
+
+
+def count_bits(mask):
+    """Returns the number of set bits of a mask."""
+    return bin(mask).count("1")
+
+
+def move_to_args(move):
+    """Converts a (builder, destination, build) square move to the six make_move arguments."""
+    init, destination, build = move
+    return COORDS[init] + COORDS[destination] + COORDS[build]
+
+
+class BuildersSearcher:
+    """An iterative deepening alpha-beta searcher over a BuildersGame position.  Moves are made and unmade on the
+    game with push and pop, so the game is left as it was after each search.
+
+    Parameters
+    ----------
+    game : BuildersGame
+        The game whose current position is searched.  Both players must have placed their builders.
+    table : TranspositionTable
+        The transposition table to use, which may be shared between searches.  A 16 MB table is made if None.
+    solved : SolverTable
+        A table of solved positions to look positions up in, or None.
+    """
+
+    def __init__(self, game, table=None, solved=None):
+        """Initializes the BuildersSearcher class."""
+        self._game = game
+        self._table = TranspositionTable(16) if table is None else table
+        self._solved = solved
+        self._nodes = 0
+        self._node_limit = None
+        self._deadline = None
+        self._pv = [[] for _ in range(MAX_PLY + 1)]
+        self._killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        # History heuristic scores, by move, for moves that caused a cutoff.
+        self._history = dict()
+
+    def search(self, max_depth=None, time_limit=None, node_limit=None):
+        """Searches the position with iterative deepening and returns a SearchResult for the deepest completed
+        depth.  Stops at whichever limit is reached first.  With no limits at all, searches to depth 4.  The best
+        move is a (builder, destination, build) square triple; see move_to_args.
+
+        Parameters
+        ----------
+        max_depth : int
+            The deepest depth to search, in plies.
+        time_limit : float
+            The time budget, in seconds.
+        node_limit : int
+            The node budget.
+        """
+        if max_depth is None:
+            max_depth = 4 if time_limit is None and node_limit is None else MAX_PLY
+        self._nodes = 0
+        self._node_limit = node_limit
+        self._deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self._killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self._table.new_search()
+
+        result = SearchResult(None, 0, 0, 0, [])
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                break
+            pv = list(self._pv[0])
+            result = SearchResult(pv[0] if pv else None, score, depth, self._nodes, pv)
+
+            # No need to search deeper once there are no moves or a forced win or loss has been found.
+            if not pv or abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+
+        # If the budget ran out before depth 1 was done, fall back on the best move found so far, or else the first
+        # in search order, so that a move is returned whenever there is one.  Its score is unknown.
+        if result.get_best_move() is None and result.get_depth() == 0:
+            moves = list(self._game.legal_move_squares())
+            if moves:
+                move = self._pv[0][0] if self._pv[0] else self.order_moves(moves, 0)[0]
+                result = SearchResult(move, 0, 0, self._nodes, [move])
+        return result
+
+    def negamax(self, depth, alpha, beta, ply):
+        """Returns the score of the position for the side to move, searched to the given depth within the
+        alpha-beta window.  Fills in the principal variation from this ply down."""
+        self._nodes += 1
+        if self._nodes % CHECK_INTERVAL == 0:
+            self.check_budget()
+
+        pv_move = self._pv[ply][0] if self._pv[ply] else None
+        self._pv[ply] = []
+        game = self._game
+        moves = list(game.legal_move_squares())
+
+        # A player who cannot move loses, and one who can step up onto height 3 wins.
+        if not moves:
+            return -MATE_SCORE + ply
+        levels = game.get_levels()
+        for move in moves:
+            if levels[3] >> move[1] & 1:
+                self._pv[ply] = [move]
+                return MATE_SCORE - ply - 1
+
+        key = symmetry = None
+        if self._solved is not None and ply > 0:
+            key, symmetry = game.get_canonical_key()
+            entry = self._solved.probe(key)
+            # Win and loss distances are capped so the scores are still recognised as forced.
+            if entry is not None and entry[0] == WIN:
+                return MATE_SCORE - min(ply + entry[1], MAX_PLY)
+            if entry is not None and entry[0] == LOSS:
+                return -MATE_SCORE + min(ply + entry[1], MAX_PLY)
+        if depth == 0 or ply >= MAX_PLY:
+            return self.evaluate()
+
+        if key is None:
+            key, symmetry = game.get_canonical_key()
+        entry = self._table.probe(key)
+        if entry is not None:
+            stored_depth, bound, score, stored_move = entry
+            if stored_move is not None:
+                squares = INVERSE_SYMMETRIES[symmetry]
+                pv_move = (squares[stored_move // (MOVE_BASE * MOVE_BASE)],
+                           squares[stored_move // MOVE_BASE % MOVE_BASE], squares[stored_move % MOVE_BASE])
+            if stored_depth >= depth and ply > 0:
+                score = score_from_table(score, ply)
+                if bound == EXACT or bound == LOWER and score >= beta or bound == UPPER and score <= alpha:
+                    if pv_move is not None and bound == EXACT:
+                        self._pv[ply] = [pv_move]
+                    return score
+
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = None
+        for move in self.order_moves(moves, ply, pv_move):
+            game.push(move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.pop()
+
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self._pv[ply] = [move] + self._pv[ply + 1]
+                if alpha >= beta:
+                    self.store_killer(move, ply, depth)
+                    break
+
+        if best <= original_alpha:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        squares = SYMMETRIES[symmetry]
+        move = (squares[best_move[0]] * MOVE_BASE + squares[best_move[1]]) * MOVE_BASE + squares[best_move[2]]
+        self._table.store(key, depth, bound, score_to_table(best, ply), move)
+        return best
+
+    def order_moves(self, moves, ply, pv_move=None):
+        """Sorts moves so the likeliest to cause a cutoff are searched first: the principal variation move, then
+        killer moves, then moves that climb, by history score."""
+        levels = self._game.get_levels()
+        killers = self._killers[ply]
+        scored = []
+        for move in moves:
+            if move == pv_move:
+                score = 3 * INFINITY
+            elif move == killers[0] or move == killers[1]:
+                score = INFINITY
+            else:
+                score = self._history.get(move, 0)
+                # Stepping up is usually better than stepping down.
+                if levels[2] >> move[1] & 1:
+                    score += 2000
+                elif levels[1] >> move[1] & 1:
+                    score += 1000
+            scored.append((score, move))
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        return [move for score, move in scored]
+
+    def store_killer(self, move, ply, depth):
+        """Records a move that caused a cutoff as a killer at this ply, and credits its history score."""
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self._history[move] = self._history.get(move, 0) + depth * depth
+
+    def evaluate(self):
+        """Returns the static score of the position for the side to move: the heights its builders stand on, the
+        cells they can step to and the winning steps they threaten, over the opponent's."""
+        game = self._game
+        levels = game.get_levels()
+        builders = game.get_builders()
+        occupied = game.get_occupied()
+        score = 0
+        first = 0 if game.get_turn() == 'x' else 2
+        for index, square in enumerate(builders):
+            height = 0
+            while levels[height + 1] >> square & 1:
+                height += 1
+            steps = NEIGHBORS[square] & levels[max(height - 1, 0)] & ~levels[height + 2] & ~occupied
+            value = HEIGHT_VALUES[height] + MOBILITY_WEIGHT * count_bits(steps)
+            if height == 2:
+                value += THREAT_WEIGHT * count_bits(steps & levels[3] & ~levels[MAX_HEIGHT])
+            score += value if first <= index < first + 2 else -value
+        return score
+
+    def get_table(self):
+        """Returns the searcher's transposition table, e.g. to export its hit-rate counters."""
+        return self._table
+
+    def check_budget(self):
+        """Raises SearchTimeout if the node or time budget has run out."""
+        if self._node_limit is not None and self._nodes >= self._node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+
+def parse_numbers(text, count):
+    """Parses comma separated integers, such as "0,0,4,4", raising SystemExit unless there are count of them."""
+    numbers = [int(number) for number in text.split(",")]
+    if len(numbers) != count:
+        raise SystemExit("Expected " + str(count) + " numbers: " + text)
+    return numbers
+
+
+def main():
+    """Command line entry point.  Places the builders, plays the given moves and prints the engine's best move as
+    make_move arguments."""
+    parser = argparse.ArgumentParser(description="Search a builders game position for the best move.")
+    parser.add_argument("moves", nargs="*", help='moves to play after placement, as "x,y,x,y,x,y"')
+    parser.add_argument("--place-x", default="1,1,3,3", help="x player's builders as x,y,x,y (default 1,1,3,3)")
+    parser.add_argument("--place-o", default="1,3,3,1", help="o player's builders as x,y,x,y (default 1,3,3,1)")
+    parser.add_argument("--depth", type=int, help="deepest depth to search")
+    parser.add_argument("--time", type=float, default=1.0, help="time budget in seconds (default 1)")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB (default 16)")
+    parser.add_argument("--solved", help="table of solved positions to look up, from builders_solver")
+    args = parser.parse_args()
+
+    game = BuildersGame()
+    if not game.initial_placement(*parse_numbers(args.place_x, 4), 'x') or \
+            not game.initial_placement(*parse_numbers(args.place_o, 4), 'o'):
+        raise SystemExit("Illegal placement")
+    for text in args.moves:
+        if not game.make_move(*parse_numbers(text, 6)):
+            raise SystemExit("Illegal move: " + text)
+    if game.get_current_state() != "UNFINISHED":
+        raise SystemExit("The game is over: " + game.get_current_state())
+
+    start_time = time.perf_counter()
+    solved = None if args.solved is None else SolverTable(args.solved)
+    searcher = BuildersSearcher(game, TranspositionTable(args.hash), solved)
+    result = searcher.search(args.depth, args.time)
+    if solved is not None:
+        solved.close()
+    elapsed = time.perf_counter() - start_time
+    if result.get_best_move() is None:
+        print("No legal moves.")
+        return
+    print("best move %s  score %d  depth %d  nodes %d  %.2f s" % (
+        ",".join(str(number) for number in move_to_args(result.get_best_move())), result.get_score(),
+        result.get_depth(), result.get_nodes(), elapsed))
+    print("pv " + " ".join(",".join(str(number) for number in move_to_args(move)) for move in result.get_pv()))
+    stats = searcher.get_table().get_stats()
+    print("hash probes %d  hits %d (%.1f%%)  stores %d  replacements %d" % (stats["probes"], stats["hits"],
+                                                                            100 * stats["hit_rate"], stats["stores"],
+                                                                            stats["replacements"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,92 @@
 # Date: 12/01/2020
 # Description:  A class for a "builder game".
 
+# The 5x5 board is held as bitboards: bit y * 5 + x of a 25-bit mask stands for the cell at x,y.  Heights are
+# stored as one mask per level, where level k holds every cell at least k high, and builders as their square
+# numbers plus one occupancy mask.  The tables below are built once at import so legality checks become a few
+# bitwise operations.
+SIZE = 5
+CELLS = SIZE * SIZE
+FULL = (1 << CELLS) - 1
+MAX_HEIGHT = 4
+
+# A builder that has not been placed yet.
+UNPLACED = -1
+
+# The cells within one step (in any of the 8 directions) of each cell, not counting the cell itself.
+NEIGHBORS = []
+for _square in range(CELLS):
+    _mask = 0
+    for _dy in range(-1, 2):
+        for _dx in range(-1, 2):
+            _x = _square % SIZE + _dx
+            _y = _square // SIZE + _dy
+            if (_dx or _dy) and 0 <= _x < SIZE and 0 <= _y < SIZE:
+                _mask |= 1 << (_y * SIZE + _x)
+    NEIGHBORS.append(_mask)
+NEIGHBORS = tuple(NEIGHBORS)
+
+# The x,y coordinate of each square, as a tuple.
+COORDS = tuple((_square % SIZE, _square // SIZE) for _square in range(CELLS))
+
+# Heights are also kept packed as one base 5 number, 5 ** square per level of each square, which fits in 59 bits.
+# The position key folds it together with the builder squares and side to move (see get_position_key).
+HEIGHT_CODES = tuple(5 ** _square for _square in range(CELLS))
+FOLD_MULTIPLIER = 0x9E3779B97F4A7C15
+KEY_MASK = (1 << 64) - 1
+
+# The 8 symmetries of the board (rotations and reflections), as the square each square is mapped to, and the
+# inverse of each.  Symmetry 0 is the identity.
+_MAPS = (lambda x, y: (x, y), lambda x, y: (4 - x, y), lambda x, y: (x, 4 - y), lambda x, y: (4 - x, 4 - y),
+         lambda x, y: (y, x), lambda x, y: (4 - y, x), lambda x, y: (y, 4 - x), lambda x, y: (4 - y, 4 - x))
+SYMMETRIES = tuple(tuple(_map(*COORDS[_square])[1] * SIZE + _map(*COORDS[_square])[0] for _square in range(CELLS))
+                   for _map in _MAPS)
+INVERSE_SYMMETRIES = tuple(tuple(_symmetry.index(_square) for _square in range(CELLS)) for _symmetry in SYMMETRIES)
+
+# SYMMETRY_CODES[symmetry][row][bits] is the base 5 height code (see HEIGHT_CODES) of one level's cells in a row
+# of 5, given as 5 bits, after the symmetry maps them.  A level mask is mapped and encoded with 5 lookups.
+SYMMETRY_CODES = tuple(tuple(tuple(sum(HEIGHT_CODES[_symmetry[_row * SIZE + _i]] for _i in range(SIZE)
+                                       if _bits >> _i & 1)
+                                   for _bits in range(1 << SIZE))
+                             for _row in range(SIZE))
+                       for _symmetry in SYMMETRIES)
+
+
+def fold_key(code):
+    """Mixes a position code of any size down to a 64-bit key whose every bit depends on the whole code, so that
+    tables indexed by the key's low bits spread positions evenly."""
+    key = (code ^ code >> 64 ^ code >> 128) & KEY_MASK
+    key = (key ^ key >> 30) * 0xBF58476D1CE4E5B9 & KEY_MASK
+    key = (key ^ key >> 27) * 0x94D049BB133111EB & KEY_MASK
+    return key ^ key >> 31
+
+
+def to_square(xy_coord):
+    """Returns the square number, y * 5 + x, of an x,y coordinate on the board.  The off-board coordinate of an
+    unplaced builder, [-1, -1], gives UNPLACED, and any other off-board coordinate gives None."""
+    x, y = xy_coord
+    if 0 <= x < SIZE and 0 <= y < SIZE:
+        return y * SIZE + x
+    if x == -1 and y == -1:
+        return UNPLACED
+    return None
+
+
+def cell_square(x, y):
+    """Returns the square number of a cell the way the old list of lists board indexed it, so negative coordinates
+    from -5 count back from the far edge, and anything else off the board raises IndexError."""
+    if not -SIZE <= x < SIZE or not -SIZE <= y < SIZE:
+        raise IndexError("cell out of range")
+    return (y % SIZE) * SIZE + x % SIZE
+
+
+def to_xy(square):
+    """Returns the x,y coordinate of a square number, as a list."""
+    if square == UNPLACED:
+        return [-1, -1]
+    return [square % SIZE, square // SIZE]
+
+
 class BuildersGame:
     """A class for a builder's game, where each player takes turns moving one of two of their builders around a 5x5
     board.  Each player must move a builder into an adjacent square that is within 1 level of their current square,
@@ -10,8 +96,21 @@ class BuildersGame:
 
     Attributes
     ----------
-    _board (list of list of int):
-        5x5 list of lists to represent the game board.  Columns and rows range from 0 to 4
+    _levels (list of int):
+        Height layer bitmasks.  _levels[k] has a bit set for every cell at least k high, so _levels[0] is the full
+        board, and the list is padded with empty masks above level 4 so that _levels[height + 2] is always valid.
+
+    _builders (list of int):
+        Square numbers of the four builders, player 1's two then player 2's two, or UNPLACED.
+
+    _occupied (int):
+        Bitmask of the cells holding a builder.
+
+    _height_code (int):
+        Every cell's height packed as one base 5 number, kept up to date for get_position_key.
+
+    _history (list):
+        A (builder, destination, build, state) record of each move made, for pop to undo.
 
     _current_state (string):
         Can be one of three - UNFINISHED, X_WON, O_WON
@@ -19,15 +118,41 @@ class BuildersGame:
     _turn (bool):
         True for player 1, false for player 2.
 
-    _player_1_xy
-    _player_2_xy (list[[int, int], [int, int]]):
-        x,y coordinate of both builders [xy, xy]
-
     Methods
     -------
     get_current_state (string):
         Returns one of three strings representing the state of the game: UNFINISHED, X_WON, O_WON
 
+    get_turn (string):
+        Returns the player whose turn it is, either 'x' or 'o'.
+
+    legal_moves (string):
+        Yields every legal move as a (builder, destination, build) triple of x,y tuples.
+
+            string: player to list moves for, either 'x' or 'o'.  Defaults to the player whose turn it is.
+
+    legal_move_squares (string):
+        As legal_moves, but yields triples of square numbers (y * 5 + x), as used by push.
+
+    push (tuple):
+        Makes a move given as square numbers without checking it, so that it can be undone with pop.  For searches.
+
+    pop ():
+        Undoes the last move made, by push or make_move.
+
+    get_position_key (int):
+        Returns a 64-bit key of the position, for transposition tables.
+
+    get_canonical_form (tuple):
+        Returns the exact code of the position's representative under the board's symmetries and builder swaps, and
+        the symmetry that maps the position onto it.
+
+    get_canonical_key (tuple):
+        As get_canonical_form, but with the code folded to 64 bits, for transposition tables.
+
+    set_position (list, list, string, string):
+        Replaces the position with the given cell heights, builder squares, player to move and game state.
+
     initial_placement (int, int, int, int, string):
         Places each player's builders on the board.
 
@@ -69,20 +194,55 @@ class BuildersGame:
     """
     def __init__(self):
         """Constructs the BuildersGame class."""
-        self._board = [None] * 5
-        # A 5 length list of lists length 5, to create a 5x5 board.
-        for column in range(5):
-            self._board[column] = [0] * 5
+        self._levels = [FULL] + [0] * (MAX_HEIGHT + 2)
+        self._builders = [UNPLACED] * 4
+        self._occupied = 0
+        self._height_code = 0
+        self._history = []
         self._current_state = "UNFINISHED"
         self._turn = True
-        # Initial builder coordinates are set out of bounds so that we can check for initial placement later.
-        self._player_1_xy = [[-1, -1], [-1, -1]]
-        self._player_2_xy = [[-1, -1], [-1, -1]]
+
+    def set_position(self, heights, builders, turn='x', state="UNFINISHED"):
+        """Replaces the position with the given one.  Clears the move history.
+
+        Parameters
+        ----------
+        heights : list
+            The 25 cell heights, 0 to 4, in square order (y * 5 + x).
+        builders : list
+            The square numbers of the four builders, player 1's two then player 2's two, or UNPLACED.
+        turn : string
+            The player to move, 'x' or 'o'.
+        state : string
+            The state of the game, as returned by get_current_state.
+        """
+        if len(heights) != CELLS or any(not 0 <= height <= MAX_HEIGHT for height in heights):
+            raise ValueError("A position must have " + str(CELLS) + " heights from 0 to " + str(MAX_HEIGHT))
+        placed = [square for square in builders if square != UNPLACED]
+        if len(builders) != 4 or len(set(placed)) != len(placed) or any(not 0 <= square < CELLS for square in placed):
+            raise ValueError("A position must have four builders on different squares, or UNPLACED")
+        self._levels = [FULL] + [0] * (MAX_HEIGHT + 2)
+        self._height_code = 0
+        for square, height in enumerate(heights):
+            for level in range(1, height + 1):
+                self._levels[level] |= 1 << square
+            self._height_code += height * HEIGHT_CODES[square]
+        self._builders = [int(square) for square in builders]
+        self._occupied = 0
+        for square in placed:
+            self._occupied |= 1 << square
+        self._history = []
+        self._current_state = state
+        self._turn = turn == 'x'
 
     def get_current_state(self):
         """Returns the current game state"""
         return self._current_state
 
+    def get_turn(self):
+        """Returns the player whose turn it is, 'x' or 'o'."""
+        return 'x' if self._turn else 'o'
+
     def initial_placement(self, builder_1_x, builder_1_y, builder_2_x, builder_2_y, player):
         """Commits the initial builder placement for both players."""
 
@@ -90,26 +250,24 @@ class BuildersGame:
         if 0 <= builder_1_x <= 4 and 0 <= builder_1_y <= 4 and 0 <= builder_2_x <= 4 and 0 <= builder_2_y <= 4:
 
             # Make sure builders aren't placed on the same spot
-            if builder_1_x != builder_2_x or builder_1_y != builder_2_y:
+            square_1 = builder_1_y * SIZE + builder_1_x
+            square_2 = builder_2_y * SIZE + builder_2_x
+            if square_1 != square_2:
 
                 # Make sure each player is placing their own builders.
                 if self._turn and player == 'x' or not self._turn and player == 'o':
 
                     # Make sure the chosen spots are vacant.
-                    if self.__check_vacant([builder_1_x, builder_1_y]) and self.__check_vacant([builder_2_x, builder_2_y]):
-
-                        # Make sure the player hasn't already placed their own builders.
-                        if self._turn and self._player_1_xy == [[-1, -1], [-1, -1]]:
-
-                            # Commit the placements and switch turns.
-                            self._player_1_xy = [[builder_1_x, builder_1_y], [builder_2_x, builder_2_y]]
-                            self._turn = not self._turn
-                            return True
-
-                        elif not self._turn and self._player_2_xy == [[-1, -1], [-1, -1]]:
-
-                            # Commit the placements and switch turns.
-                            self._player_2_xy = [[builder_1_x, builder_1_y], [builder_2_x, builder_2_y]]
+                    placed = 1 << square_1 | 1 << square_2
+                    if not self._occupied & placed:
+
+                        # Make sure the player hasn't already placed their own builders, then commit the
+                        # placements and switch turns.
+                        first = 0 if self._turn else 2
+                        if self._builders[first] == UNPLACED and self._builders[first + 1] == UNPLACED:
+                            self._builders[first] = square_1
+                            self._builders[first + 1] = square_2
+                            self._occupied |= placed
                             self._turn = not self._turn
                             return True
         return False
@@ -118,223 +276,218 @@ class BuildersGame:
         """Makes the move for the player.  Returns false if a valid move is not made.  If no valid moves can
         be made, ends the game in the other player's favor.
         """
-        # Make sure the current player can even make a valid move
-
-        # Set pertinent variables for relevant function calls.
-        xy_init = [col_init, row_init]
-        xy_destination = [col_destination, row_destination]
-        xy_build = [col_build, row_build]
+        # Set pertinent squares for relevant function calls.  Off-board coordinates give None.
+        init = to_square([col_init, row_init])
+        destination = to_square([col_destination, row_destination])
+        build = to_square([col_build, row_build])
 
         # Check that the game hasn't ended, that players have made initial builder placements, and that the
         # correct player is moving according to whose turn it is.
-        if self._current_state == "UNFINISHED" and self.__check_initial_placement() and self.__check_turn(xy_init):
+        if self._current_state == "UNFINISHED" and self.__check_initial_placement() and self.__check_turn(init):
 
             # Check that the destination square is vacant and that it's a valid movement.
-            if self.__check_vacant(xy_destination) and self.__check_valid_move(xy_init, xy_destination, xy_build):
+            if destination is not None and build is not None and destination >= 0 and build >= 0 and \
+                    self.__check_vacant(destination) and self.__check_valid_move(init, destination, build):
 
-                # Commit the valid moves.
-                self.__move_builder(xy_init, xy_destination)
-                self.__build_cell(xy_build)
+                # Commit the valid moves, which also switches which player's turn it is.
+                winner = "X_WON" if self._turn else "O_WON"
+                self.push((init, destination, build))
 
                 # Check for winning conditions. (Builder on 3 or higher tower or other player has no moves.)
-                if self.__check_height(xy_destination):
-
-                    if self._turn:
-                        self._current_state = "X_WON"
-                    else:
-                        self._current_state = "O_WON"
-
-                else:
-
-                    if self._turn:
-                        if not self.__check_for_valid_moves(1):
-                            self._current_state = "X_WON"
-                    else:
-                        if not self.__check_for_valid_moves(0):
-                            self._current_state = "O_WON"
-
-                # Switch which player's turn it is.
-                self._turn = not self._turn
+                if self.__check_height(destination) or next(self.legal_moves(), None) is None:
+                    self._current_state = winner
                 return True
 
         # Invalid move returns false without switching turns.
         return False
 
-    def __check_turn(self, builder):
+    def __check_turn(self, square):
         """Returns false if a player is not moving their own builder or no builder at all"""
-        if self._turn:
-
-            if builder == self._player_1_xy[0] or builder == self._player_1_xy[1]:
-                return True
-
-        else:
-
-            if builder == self._player_2_xy[0] or builder == self._player_2_xy[1]:
-                return True
-
-        return False
-
-    def __move_builder(self, xy_init, xy_destination):
-        """Moves the selected builder to the destination spot"""
-        # Match the given coordinates to the builder, then move that builder.
-        for builder in range(2):
-
-            if (self._player_1_xy[builder]) == xy_init:
-                self._player_1_xy[builder] = xy_destination
+        if square is None:
+            return False
+        first = 0 if self._turn else 2
+        return square == self._builders[first] or square == self._builders[first + 1]
 
-            if (self._player_2_xy[builder]) == xy_init:
-                self._player_2_xy[builder] = xy_destination
+    def __move_builder(self, init, destination):
+        """Moves the builder on the init square to the destination square"""
+        self._builders[self._builders.index(init)] = destination
+        self._occupied ^= 1 << init | 1 << destination
 
     def __check_initial_placement(self):
         """Makes sure initial placement has happened."""
-        # Check that each player's builders have diff coordinates than initial -1, -1
-        if self._player_1_xy[0] == [-1, -1] or self._player_1_xy[1] == [-1, -1]:
-            return False
+        return UNPLACED not in self._builders
 
-        if self._player_2_xy[0] == [-1, -1] or self._player_2_xy[1] == [-1, -1]:
-            return False
+    def push(self, move):
+        """Makes a move without checking that it is valid, and records how to undo it with pop.  The builder is
+        moved, the cell built on and the turn switched, but the game state is left as it is.
 
-        return True
-
-    def __build_cell(self, xy_coord):
-        """ "Builds" a tower at the selected cell (adds 1 to the cell's value)"""
-        self._board[xy_coord[1]][xy_coord[0]] += 1
-
-    def __check_build(self, xy_coord_init, xy_coord_builder, xy_coord):
-        """Checks to see if a tower can be constructed and is within builder range."""
-
-        # Make sure tower isn't at max height and that the square is vacant (exception: If the builder
-        # that is about to move occupies the build square, that's valid.)
-        if self.get_cell(xy_coord) < 4 and (self.__check_vacant(xy_coord) or xy_coord_init == xy_coord):
-
-            if abs(xy_coord[0] - xy_coord_builder[0]) <= 1 and abs(xy_coord[1] - xy_coord_builder[1]) <= 1:
-
-                # Can't build on own square
-                if xy_coord_builder != xy_coord:
-
-                    return True
-
-        return False
-
-    def __check_vacant(self, xy_coord):
+        Parameters
+        ----------
+        move : tuple
+            The (builder, destination, build) square numbers of the move (see to_square).
+        """
+        init, destination, build = move
+        self._history.append((init, destination, build, self._current_state))
+        self.__move_builder(init, destination)
+        self.__build_cell(build)
+        self._turn = not self._turn
+
+    def pop(self):
+        """Undoes the most recent move, restoring the builder, the cell's height, the turn and the game state."""
+        init, destination, build, state = self._history.pop()
+        self._turn = not self._turn
+        self._current_state = state
+        levels = self._levels
+        bit = 1 << build
+        level = MAX_HEIGHT
+        while not levels[level] & bit:
+            level -= 1
+        levels[level] ^= bit
+        self._height_code -= HEIGHT_CODES[build]
+        self.__move_builder(destination, init)
+
+    def get_position_key(self):
+        """Returns a 64-bit key of the position: the heights packed in base 5, folded together with the four builder
+        squares and the side to move.  For transposition tables."""
+        builders = self._builders
+        code = ((builders[0] + 1) | (builders[1] + 1) << 5 | (builders[2] + 1) << 10 | (builders[3] + 1) << 15 |
+                (not self._turn) << 20)
+        return fold_key(self._height_code ^ code * FOLD_MULTIPLIER)
+
+    def get_canonical_form(self):
+        """Returns (code, symmetry) for the position's canonical representative, the same for every position that
+        only differs by a rotation or reflection of the board (see SYMMETRIES) or by which of a player's two
+        builders is which.  The code packs the mapped heights in base 5, then each player's builder squares in
+        order and the side to move, and is the smallest over all 8 symmetries.  The symmetry is the index of one
+        that maps this position onto the representative, for mapping moves to and from it."""
+        levels = self._levels[1:MAX_HEIGHT + 1]
+        builders = self._builders
+        best = None
+        best_symmetry = 0
+        for symmetry in range(8):
+            rows = SYMMETRY_CODES[symmetry]
+            code = 0
+            for level in levels:
+                code += (rows[0][level & 31] + rows[1][level >> 5 & 31] + rows[2][level >> 10 & 31] +
+                         rows[3][level >> 15 & 31] + rows[4][level >> 20])
+            squares = SYMMETRIES[symmetry]
+            x_0, x_1, o_0, o_1 = (squares[square] if square >= 0 else UNPLACED for square in builders)
+            code = code << 20 | min(x_0, x_1) + 1 << 15 | max(x_0, x_1) + 1 << 10 | min(o_0, o_1) + 1 << 5 | \
+                max(o_0, o_1) + 1
+            if best is None or code < best:
+                best = code
+                best_symmetry = symmetry
+        return best << 1 | (not self._turn), best_symmetry
+
+    def get_canonical_key(self):
+        """Returns (key, symmetry): the canonical code of get_canonical_form folded to 64 bits, for transposition
+        tables and caches shared by symmetric positions, and the symmetry that maps this position onto it."""
+        code, symmetry = self.get_canonical_form()
+        return fold_key(code), symmetry
+
+    def get_levels(self):
+        """Returns the list of height layer masks (see _levels).  Not a copy."""
+        return self._levels
+
+    def get_builders(self):
+        """Returns the square numbers of the four builders, player 1's two then player 2's two.  Not a copy."""
+        return self._builders
+
+    def get_occupied(self):
+        """Returns the bitmask of the cells holding a builder."""
+        return self._occupied
+
+    def __build_cell(self, square):
+        """ "Builds" a tower at the selected cell (sets the cell in the next level up)"""
+        levels = self._levels
+        bit = 1 << square
+        level = 1
+        while levels[level] & bit:
+            level += 1
+        levels[level] |= bit
+        self._height_code += HEIGHT_CODES[square]
+
+    def __height(self, square):
+        """Returns the height of a square, from its height layer masks."""
+        levels = self._levels
+        height = 0
+        while levels[height + 1] >> square & 1:
+            height += 1
+        return height
+
+    def __reachable(self, square):
+        """Returns the mask of cells a builder on the square may step to by height and distance alone: neighbours
+        no more than one level higher or lower."""
+        height = self.__height(square)
+        return NEIGHBORS[square] & self._levels[max(height - 1, 0)] & ~self._levels[height + 2]
+
+    def __buildable(self, init, destination):
+        """Returns the mask of cells a builder moving from init to destination may build on: neighbours of the
+        destination below the max height that are vacant once the builder has left init."""
+        return NEIGHBORS[destination] & ~self._levels[MAX_HEIGHT] & ~(self._occupied & ~(1 << init))
+
+    def __check_vacant(self, square):
         """Checks that a cell a player is moving a builder to is vacant.  Returns True if
         vacant, False if occupied."""
-        # If either of the players' builders is a cell, return False (not vacant)
-        for i in range(2):
-            if xy_coord == self._player_1_xy[i] or xy_coord == self._player_2_xy[i]:
-                return False
-        return True
-
-    def __check_for_valid_moves(self, player):
-        """Checks adjacent spaces for valid moves.  If none, the other player wins."""
-        # Iterate over all 8 spaces around a builder for a spot to move to, then all 8 spaces around the destination for
-        # a build spot. Then plug all of that into the check_valid_moves func to see if a player can make a move.
-        # If no spaces return valid, they lose.
-        
-        # Check moves around first builder, then second builder.
-        for build in range(2):
-
-            for x_offset in range(-1, 2):
-
-                for y_offset in range(-1, 2):
-
-                    # The cell we're already in isn't a valid space to move to, so skip.
-                    if x_offset == 0 and y_offset == 0:
-                        continue
-
-                    if player == 0:
-                        destination = [self._player_1_xy[build][0] + x_offset, self._player_1_xy[build][1] + y_offset]
-                    else:
-                        destination = [self._player_2_xy[build][0] + x_offset, self._player_2_xy[build][1] + y_offset]
-
-                    # If out of bounds, ignore checking for moves.
-                    if not 0 <= destination[0] <= 4 or not 0 <= destination[1] <= 4:
-                        continue
-
-                    # Now check valid build spaces
-                    for destination_x_offset in range(-1, 2):
-
-                        for destination_y_offset in range(-1, 2):
-
-                            # OUr destination space isn't a valid build space, so skip.
-                            if destination_x_offset == 0 and destination_y_offset == 0:
-                                continue
-
-                            build_cell = [destination[0] + destination_x_offset, destination[1] + destination_y_offset]
-
-                            # Can't build out of bounds.
-                            if not 0 <= build_cell[0] <= 4 or not 0 <= build_cell[1] <= 4:
-                                continue
-
-                            # Plug into the valid move func and see if the cell works.
-                            if player == 0:
-                                if self.__check_valid_move(self._player_1_xy[build], destination, build_cell):
-                                    return True
-                            else:
-                                if self.__check_valid_move(self._player_2_xy[build], destination, build_cell):
-                                    return True
-        # No valid moves found
-        return False
-
-    def __check_valid_move(self, xy_coord_init, xy_coord_destination, xy_build):
+        return not self._occupied >> square & 1
+
+    def legal_moves(self, player=None):
+        """Yields every move the player can legally make, as (builder, destination, build) triples of x,y tuples,
+        so that make_move(*builder, *destination, *build) succeeds for the player to move.  Moves are worked out
+        lazily from the neighbour masks, so asking only for the first one is cheap.  Nothing is yielded once the
+        game is over or before both players have placed their builders."""
+        for init, destination, build in self.legal_move_squares(player):
+            yield COORDS[init], COORDS[destination], COORDS[build]
+
+    def legal_move_squares(self, player=None):
+        """Yields every move the player can legally make, as (builder, destination, build) triples of square
+        numbers, in the same order as legal_moves.  For push."""
+        if self._current_state != "UNFINISHED" or not self.__check_initial_placement():
+            return
+        if player is None:
+            player = self.get_turn()
+        first = 0 if player == 'x' else 2
+        for init in self._builders[first:first + 2]:
+            steps = self.__reachable(init) & ~self._occupied
+            while steps:
+                step = steps & -steps
+                steps ^= step
+                destination = step.bit_length() - 1
+                builds = self.__buildable(init, destination)
+                while builds:
+                    build = builds & -builds
+                    builds ^= build
+                    yield init, destination, build.bit_length() - 1
+
+    def __check_valid_move(self, init, destination, build):
         """Returns true if a builder can be moved from its spot to another spot.  False
         if any of the prohibiting rules blocks the movement.
         """
+        # Check the height difference and distance of the step, then that a tower can be constructed.
+        return bool(self.__reachable(init) >> destination & 1 and self.__buildable(init, destination) >> build & 1)
 
-        # Make sure all move values are on the board.
-        for i in range(2):
-
-            if xy_coord_init[i] > 4 or xy_coord_init[i] < 0:
-                return False
-            if xy_coord_destination[i] > 4 or xy_coord_destination[i] < 0:
-                return False
-            if xy_build[i] > 4 or xy_build[i] < 0:
-                return False
-
-        # Check if the height difference permits the move.  Can't move onto towers 2 or more units in height diff.
-        if abs(self.get_cell(xy_coord_init) - self.get_cell(xy_coord_destination)) < 2:
-
-            # Check if the move is within one unit x and y in any direction.
-            if abs(xy_coord_init[0] - xy_coord_destination[0]) <= 1:
-
-                if abs(xy_coord_init[1] - xy_coord_destination[1]) <= 1:
-
-                    # Check that a tower can be constructed.
-                    if self.__check_build(xy_coord_init, xy_coord_destination, xy_build):
-                        return True
-
-        return False
-
-    def __check_height(self, xy_coord):
+    def __check_height(self, square):
         """Checks the height of the tower the builder moved to.  If >2, that player wins."""
-        if self.get_cell(xy_coord) > 2:
-            return True
-
-        return False
+        return bool(self._levels[3] >> square & 1)
 
     def get_cell(self, xy_coord):
         """Returns the "height" of the cell (int)"""
-        return self._board[xy_coord[1]][xy_coord[0]]
+        return self.__height(cell_square(xy_coord[0], xy_coord[1]))
 
     def get_row(self, row_num):
         """Returns the "height" of and entire row's cells.  For printing purposes."""
-        lst = list()
-        for i in range(len(self._board)):
-            lst.append(self._board[i][row_num])
-        return lst
+        return [self.__height(cell_square(row_num, i)) for i in range(SIZE)]
 
     def get_column(self, col_num):
         """Returns the "height" of an entire column's cells.  For printing purposes."""
-        lst = list()
-        for i in range(len(self._board)):
-            lst.append(self._board[col_num][i])
-        return lst
+        return [self.__height(cell_square(i, col_num)) for i in range(SIZE)]
 
     def build_pos(self, cell):
         """If a builder is in a cell, returns a string specifying which builder. For printing purposes."""
+        square = to_square(cell)
         for i in range(2):
-            if self._player_1_xy[i] == cell:
+            if self._builders[i] == square:
                 return "X" + str(i)
-            if self._player_2_xy[i] == cell:
+            if self._builders[2 + i] == square:
                 return "O" + str(i)
         return "  "
@@ -0,0 +1,409 @@
+# Author: Sean Tyler
+# Description:  A Monte Carlo tree search (UCT) player for BuildersGame.  Playouts run on a bare playout core that
+#               works on a handful of integers (the height layer masks, builder squares and occupancy) and a move
+#               buffer allocated once, rather than on BuildersGame objects.  The tree is kept between turns, and
+#               playouts can be spread over a process pool with root parallelism: each worker grows its own tree
+#               from the same position and their root statistics are summed.
+#
+#               A state is a list of [level 1, level 2, level 3, level 4, builder 0, builder 1, builder 2, builder 3,
+#               occupied, turn], with the masks and squares as in BuildersGame and turn 0 for x, 1 for o.  A move
+#               is one integer, (builder index * 25 + destination) * 25 + build.
+
+import argparse
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from builders_engine import parse_numbers
+from builders_game import BuildersGame, COORDS, FULL, NEIGHBORS
+
+OCCUPIED = 8
+TURN = 9
+
+# The most moves a player can have: two builders, eight steps each and eight cells to build on around each step.
+MAX_MOVES = 2 * 8 * 8
+
+# The UCT exploration constant.
+EXPLORATION = math.sqrt(2)
+
+
+def state_from_game(game):
+    """Returns the playout state of a BuildersGame whose builders have all been placed."""
+    levels = game.get_levels()
+    return levels[1:5] + list(game.get_builders()) + [game.get_occupied(), 0 if game.get_turn() == 'x' else 1]
+
+
+def to_game_move(state, move):
+    """Converts a playout move to a (builder, destination, build) square move, as used by BuildersGame.push and
+    builders_engine.move_to_args."""
+    return state[4 + move // 625], move // 25 % 25, move % 25
+
+
+def generate_moves(state, buffer):
+    """Fills the buffer with the moves of the player to move and returns how many there are.  If the player can
+    step onto height 3, only that winning move is given, as a negative count of -1."""
+    turn = state[TURN]
+    occupied = state[OCCUPIED]
+    level_1, level_2, level_3, level_4 = state[0], state[1], state[2], state[3]
+    levels = (FULL, level_1, level_2, level_3, level_4, 0, 0)
+    count = 0
+    for index in (2 * turn, 2 * turn + 1):
+        init = state[4 + index]
+        h = (level_1 >> init & 1) + (level_2 >> init & 1) + (level_3 >> init & 1)
+        steps = NEIGHBORS[init] & levels[h - 1 if h else 0] & ~levels[h + 2] & ~occupied
+        if steps & level_3:
+            step = steps & level_3
+            destination = (step & -step).bit_length() - 1
+            builds = NEIGHBORS[destination] & ~level_4 & ~(occupied & ~(1 << init))
+            buffer[0] = (index * 25 + destination) * 25 + (builds & -builds).bit_length() - 1
+            return -1
+        free = ~level_4 & ~(occupied & ~(1 << init))
+        while steps:
+            step = steps & -steps
+            steps ^= step
+            destination = step.bit_length() - 1
+            builds = NEIGHBORS[destination] & free
+            while builds:
+                build = builds & -builds
+                builds ^= build
+                buffer[count] = (index * 25 + destination) * 25 + build.bit_length() - 1
+                count += 1
+    return count
+
+
+def apply_move(state, move):
+    """Makes a move on a state in place: moves the builder, builds, and passes the turn."""
+    index = 4 + move // 625
+    destination = move // 25 % 25
+    build_bit = 1 << move % 25
+    state[OCCUPIED] ^= 1 << state[index] | 1 << destination
+    state[index] = destination
+    level = 0
+    while state[level] & build_bit:
+        level += 1
+    state[level] |= build_bit
+    state[TURN] ^= 1
+
+
+def playout(state, rng, buffer):
+    """Plays random moves from a state until the game ends, and returns the winner (0 for x, 1 for o).  The state
+    is changed in place.  A player who can step onto height 3 always does."""
+    while True:
+        count = generate_moves(state, buffer)
+        if count < 0:
+            return state[TURN]
+        if count == 0:
+            return state[TURN] ^ 1
+        apply_move(state, buffer[int(rng.random() * count)])
+
+
+class Node:
+    """A node of the search tree, for the position after its move.
+
+    Parameters
+    ----------
+    move : int
+        The move leading to the node, or None for the root.
+    parent : Node
+        The parent node, or None for the root.
+    mover : int
+        The player who made the move, 0 for x or 1 for o.
+    """
+    __slots__ = ("move", "parent", "mover", "children", "untried", "visits", "wins", "winner")
+
+    def __init__(self, move, parent, mover):
+        """Initializes the Node class."""
+        self.move = move
+        self.parent = parent
+        self.mover = mover
+        self.children = []
+        # The moves not yet expanded, or None until the node is first reached.
+        self.untried = None
+        self.visits = 0
+        self.wins = 0
+        # The winner, if the move ended the game by stepping onto height 3.
+        self.winner = None
+
+
+class MCTSResult:
+    """The result of a search: the most visited root move, and the statistics of every root move.
+
+    Parameters
+    ----------
+    best_move : tuple
+        The best (builder, destination, build) square move, or None if there are no legal moves.
+    stats : dict
+        The (visits, wins) of each root move, by playout move.
+    playouts : int
+        The number of playouts run.
+    seconds : float
+        The time taken.
+    """
+
+    def __init__(self, best_move, stats, playouts, seconds):
+        """Initializes the MCTSResult class."""
+        self._best_move = best_move
+        self._stats = stats
+        self._playouts = playouts
+        self._seconds = seconds
+
+    def get_best_move(self):
+        """Returns the best move as a (builder, destination, build) tuple of squares, or None."""
+        return self._best_move
+
+    def get_stats(self):
+        """Returns the (visits, wins) of each root move, by playout move."""
+        return self._stats
+
+    def get_win_rate(self):
+        """Returns the share of the best move's playouts that were won."""
+        visits, wins = max(self._stats.values(), default=(0, 0))
+        return wins / visits if visits else 0.0
+
+    def get_playouts(self):
+        """Returns the number of playouts run."""
+        return self._playouts
+
+    def get_playouts_per_sec(self):
+        """Returns the number of playouts run per second, across every worker."""
+        return self._playouts / self._seconds if self._seconds > 0 else 0.0
+
+
+class MCTS:
+    """A UCT searcher.  The tree is kept between searches, so after the game moves on, the part of the old tree
+    below the new position is reused.
+
+    Parameters
+    ----------
+    seed : int
+        The seed of the playouts' random choices.
+    exploration : float
+        The UCT exploration constant.
+    """
+
+    def __init__(self, seed=None, exploration=EXPLORATION):
+        """Initializes the MCTS class."""
+        self._rng = random.Random(seed)
+        self._exploration = exploration
+        self._buffer = [0] * MAX_MOVES
+        self._root = None
+        self._root_state = None
+
+    def search(self, game, playouts=None, time_limit=None):
+        """Searches a game's position and returns an MCTSResult.  With no limits, runs 1000 playouts."""
+        return self.search_state(state_from_game(game), playouts, time_limit)
+
+    def search_state(self, state, playouts=None, time_limit=None):
+        """Searches a playout state, stopping after the given number of playouts or time, whichever comes first."""
+        if playouts is None and time_limit is None:
+            playouts = 1000
+        start_time = time.perf_counter()
+        deadline = None if time_limit is None else start_time + time_limit
+        self.reuse(state)
+        root = self._root
+
+        count = 0
+        while playouts is None or count < playouts:
+            self.run_playout()
+            count += 1
+            if deadline is not None and count % 64 == 0 and time.perf_counter() >= deadline:
+                break
+
+        stats = {child.move: (child.visits, child.wins) for child in root.children}
+        best = max(root.children, key=lambda child: child.visits, default=None)
+        best_move = None if best is None else to_game_move(self._root_state, best.move)
+        return MCTSResult(best_move, stats, count, time.perf_counter() - start_time)
+
+    def reuse(self, state):
+        """Makes the tree's root the node for the given state: the current root, or one of its children or
+        grandchildren if the game has moved on by up to two moves, or else a new root."""
+        if self._root is not None:
+            for node, node_state in self.descendants(2):
+                if node_state == state:
+                    node.parent = None
+                    node.move = None
+                    self._root = node
+                    self._root_state = list(state)
+                    return
+        self._root = Node(None, None, state[TURN] ^ 1)
+        self._root_state = list(state)
+
+    def descendants(self, depth):
+        """Yields (node, state) for the root and its expanded descendants down to the given depth."""
+        level = [(self._root, self._root_state)]
+        for _ in range(depth + 1):
+            next_level = []
+            for node, state in level:
+                yield node, state
+                for child in node.children:
+                    child_state = list(state)
+                    apply_move(child_state, child.move)
+                    next_level.append((child, child_state))
+            level = next_level
+
+    def run_playout(self):
+        """Runs one round of selection, expansion, playout and backpropagation from the root."""
+        node = self._root
+        state = list(self._root_state)
+        buffer = self._buffer
+        log = math.log
+        exploration = self._exploration
+
+        # Select down through fully expanded nodes by UCT.
+        while node.untried is not None and not node.untried and node.children:
+            scale = exploration * math.sqrt(log(node.visits))
+            best = None
+            best_value = -1.0
+            for child in node.children:
+                value = child.wins / child.visits + scale / math.sqrt(child.visits)
+                if value > best_value:
+                    best = child
+                    best_value = value
+            node = best
+            apply_move(state, node.move)
+
+        # Expand one untried move, listing the moves when a node is first reached.
+        if node.untried is None:
+            count = generate_moves(state, buffer)
+            node.untried = buffer[:abs(count)]
+            if count < 0:
+                # A winning move is the only one worth trying, and the game ends with it.
+                child = Node(node.untried.pop(), node, state[TURN])
+                child.untried = []
+                child.winner = state[TURN]
+                node.children.append(child)
+        if node.untried:
+            move = node.untried.pop(int(self._rng.random() * len(node.untried)))
+            child = Node(move, node, state[TURN])
+            node.children.append(child)
+            node = child
+            apply_move(state, move)
+        elif node.children and node.children[0].winner is not None:
+            node = node.children[0]
+
+        winner = node.winner if node.winner is not None else playout(state, self._rng, buffer)
+        while node is not None:
+            node.visits += 1
+            if node.mover == winner:
+                node.wins += 1
+            node = node.parent
+
+
+# Per process state of a worker: its searcher, whose tree is kept between searches and whose move buffer is
+# allocated once.
+_worker_mcts = None
+
+
+def _init_worker(seed, exploration):
+    """Sets up a worker process with its own searcher."""
+    global _worker_mcts
+    _worker_mcts = MCTS(seed, exploration)
+
+
+def _search_worker(state, playouts, time_limit):
+    """Runs in a worker: searches a state on the worker's tree, reusing the part below it from earlier searches,
+    and returns its root statistics and playout count."""
+    result = _worker_mcts.search_state(state, playouts, time_limit)
+    return result.get_stats(), result.get_playouts()
+
+
+class ParallelMCTS:
+    """A root-parallel UCT searcher.  Each search is split into one task per worker, each growing its own tree
+    from the same position, and the visit and win counts of their root moves are summed to pick the move.  Each
+    worker is a pool of one process, so its tree stays in that process and is kept between searches like the
+    serial MCTS's: after the game moves on, the part of each tree below the new position is reused.  Worker i is
+    seeded from the seed and i, so a fixed seed gives repeatable searches.
+
+    Parameters
+    ----------
+    workers : int
+        The number of worker processes.  Defaults to the number of CPUs.
+    seed : int
+        The seed the workers' seeds are made from.
+    exploration : float
+        The UCT exploration constant.
+    """
+
+    def __init__(self, workers=None, seed=None, exploration=EXPLORATION):
+        """Initializes the ParallelMCTS class."""
+        self._workers = workers or os.cpu_count() or 1
+        # One single process pool per worker, so each task of a search goes to the process holding its tree.
+        self._pools = [ProcessPoolExecutor(1, initializer=_init_worker,
+                                           initargs=(None if seed is None else seed * 1000003 + index, exploration))
+                       for index in range(self._workers)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shuts down the worker processes."""
+        for pool in self._pools:
+            pool.shutdown()
+
+    def search(self, game, playouts=None, time_limit=None):
+        """Searches a game's position across the workers and returns an MCTSResult of the summed statistics.  The
+        playouts are split evenly between the workers.  With no limits, runs 1000 playouts in all."""
+        if playouts is None and time_limit is None:
+            playouts = 1000
+        state = state_from_game(game)
+        start_time = time.perf_counter()
+        share = None if playouts is None else -(-playouts // self._workers)
+        futures = [pool.submit(_search_worker, state, share, time_limit) for pool in self._pools]
+
+        stats = dict()
+        total = 0
+        for future in futures:
+            worker_stats, count = future.result()
+            total += count
+            for move, (visits, wins) in worker_stats.items():
+                summed = stats.get(move, (0, 0))
+                stats[move] = (summed[0] + visits, summed[1] + wins)
+        best = max(stats, key=lambda move: stats[move][0], default=None)
+        best_move = None if best is None else to_game_move(state, best)
+        return MCTSResult(best_move, stats, total, time.perf_counter() - start_time)
+
+
+def main():
+    """Command line entry point.  Places the builders, plays the given moves and prints the chosen move as make_move
+    arguments, with the playout rate."""
+    parser = argparse.ArgumentParser(description="Search a builders game position with Monte Carlo tree search.")
+    parser.add_argument("moves", nargs="*", help='moves to play after placement, as "x,y,x,y,x,y"')
+    parser.add_argument("--place-x", default="1,1,3,3", help="x player's builders as x,y,x,y (default 1,1,3,3)")
+    parser.add_argument("--place-o", default="1,3,3,1", help="o player's builders as x,y,x,y (default 1,3,3,1)")
+    parser.add_argument("--playouts", type=int, help="number of playouts (default 1000 if no time is given)")
+    parser.add_argument("--time", type=float, help="time budget in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for root parallelism (default 1)")
+    parser.add_argument("--seed", type=int, help="random seed")
+    args = parser.parse_args()
+
+    game = BuildersGame()
+    if not game.initial_placement(*parse_numbers(args.place_x, 4), 'x') or \
+            not game.initial_placement(*parse_numbers(args.place_o, 4), 'o'):
+        raise SystemExit("Illegal placement")
+    for text in args.moves:
+        if not game.make_move(*parse_numbers(text, 6)):
+            raise SystemExit("Illegal move: " + text)
+    if game.get_current_state() != "UNFINISHED":
+        raise SystemExit("The game is over: " + game.get_current_state())
+
+    if args.workers > 1:
+        with ParallelMCTS(args.workers, args.seed) as searcher:
+            result = searcher.search(game, args.playouts, args.time)
+    else:
+        result = MCTS(args.seed).search(game, args.playouts, args.time)
+    if result.get_best_move() is None:
+        print("No legal moves.")
+        return
+    init, destination, build = result.get_best_move()
+    print("best move %s  win rate %.3f  playouts %d  %.0f playouts/s" % (
+        ",".join(str(number) for number in COORDS[init] + COORDS[destination] + COORDS[build]),
+        result.get_win_rate(), result.get_playouts(), result.get_playouts_per_sec()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# Author: Sean Tyler
+# Description:  A lockstep simulator that plays thousands of BuildersGame games at once as NumPy array state (see
+#               builders_batch), for generating training data and stress-testing players far faster than looping
+#               over BuildersGame instances.  Each step takes one move per game as an N x 3 array of (builder,
+#               destination, build) square numbers, the same triples as BuildersGame.push, and applies the legal
+#               ones together.  Illegal moves, and moves in finished games, are masked out and leave their game as
+#               it was, as make_move would return False.  Legality and game ends follow BuildersGame.make_move, and
+#               check_against_game replays random games through both to confirm they agree.
+
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from builders_batch import ADJACENT, BuildersBatch, O_WON, UNFINISHED, X_WON, get_builds, get_occupied, get_steps, \
+    has_moves
+from builders_game import BuildersGame, CELLS, COORDS, MAX_HEIGHT, SIZE
+
+# The number of (builder, destination) pairs a player has to pick from: two builders times every cell.
+PAIRS = 2 * CELLS
+
+
+def pick_weighted(weights, rng):
+    """Returns, for each row of an N x K array of non-negative weights, a column picked at random in proportion to
+    its weight, or -1 for a row whose weights are all 0."""
+    totals = weights.sum(axis=1)
+    targets = np.floor(rng.random(len(weights)) * totals)
+    picks = (np.cumsum(weights, axis=1) <= targets[:, None]).sum(axis=1)
+    return np.where(totals > 0, picks, -1)
+
+
+class BatchSimulator:
+    """Plays a batch of games in lockstep.  The batch's arrays are advanced in place.
+
+    Parameters
+    ----------
+    batch : BuildersBatch
+        The positions to play on from.  Every builder should be placed.
+    seed : int
+        The seed of the random number generator used by random_moves.
+    """
+
+    def __init__(self, batch, seed=None):
+        """Initializes the BatchSimulator class."""
+        self._batch = batch
+        self._rng = np.random.default_rng(seed)
+        # The number of moves applied to each game.
+        self._plies = np.zeros(len(batch), dtype=np.int32)
+
+    @classmethod
+    def random_start(cls, count, seed=None):
+        """Returns a simulator of count new games with the builders placed on random distinct cells, x to move."""
+        rng = np.random.default_rng(seed)
+        builders = np.argsort(rng.random((count, CELLS)), axis=1)[:, :4].astype(np.int8)
+        batch = BuildersBatch(np.zeros((count, CELLS), dtype=np.uint8), builders)
+        return cls(batch, None if seed is None else seed + 1)
+
+    def __len__(self):
+        return len(self._batch)
+
+    def get_batch(self):
+        """Returns the batch of positions being played.  Not a copy."""
+        return self._batch
+
+    def get_plies(self):
+        """Returns the array of the number of moves applied to each game.  Not a copy."""
+        return self._plies
+
+    def count_unfinished(self):
+        """Returns the number of games still being played."""
+        return int((self._batch.get_states() == UNFINISHED).sum())
+
+    def legal_mask(self, moves, occupied=None):
+        """Returns a bool array of which of the N x 3 moves are legal in their games: the game is unfinished with
+        every builder placed, the builder is one of the mover's, the destination is a vacant neighbour no more than
+        one level higher or lower, and the build is a neighbour of the destination below the max height and vacant
+        once the builder has left.  Squares off the board, such as -1, are never legal."""
+        batch = self._batch
+        heights = batch.get_heights()
+        builders = batch.get_builders()
+        if occupied is None:
+            occupied = get_occupied(builders)
+        rows = np.arange(len(moves))
+        moves = moves.astype(np.intp)
+        on_board = ((moves >= 0) & (moves < CELLS)).all(axis=1)
+        init, destination, build = np.where(on_board[:, None], moves, 0).T
+        first = 2 * batch.get_turns().astype(np.intp)
+        own = (builders[rows, first] == init) | (builders[rows, first + 1] == init)
+        steps = get_steps(heights, init, occupied)[rows, destination]
+        buildable = ADJACENT[destination, build] & (heights[rows, build] < MAX_HEIGHT) & \
+            (~occupied[rows, build] | (build == init))
+        ready = (batch.get_states() == UNFINISHED) & (builders >= 0).all(axis=1)
+        return on_board & ready & own & steps & buildable
+
+    def step(self, moves):
+        """Applies one move to each game at once, given as an N x 3 array of (builder, destination, build) square
+        numbers, and returns the bool array of which were legal and applied.  A game is won by the mover if their
+        builder steps onto height 3 or the opponent is left with no moves, as in BuildersGame.make_move."""
+        batch = self._batch
+        heights = batch.get_heights()
+        builders = batch.get_builders()
+        turns = batch.get_turns()
+        states = batch.get_states()
+        occupied = get_occupied(builders)
+        legal = self.legal_mask(moves, occupied)
+        rows = np.flatnonzero(legal)
+        if not len(rows):
+            return legal
+
+        init, destination, build = moves[rows].astype(np.intp).T
+        mover = turns[rows].astype(np.intp)
+        column = 2 * mover + (builders[rows, 2 * mover + 1] == init)
+        builders[rows, column] = destination
+        heights[rows, build] += 1
+        winner = np.where(mover == 0, X_WON, O_WON).astype(np.uint8)
+        turns[rows] = 1 - mover
+        self._plies[rows] += 1
+
+        climbed = heights[rows, destination] >= 3
+        stuck = ~has_moves(heights[rows], builders[rows], turns[rows])
+        states[rows] = np.where(climbed | stuck, winner, UNFINISHED)
+        return legal
+
+    def random_moves(self):
+        """Returns an N x 3 array with a legal move for each game picked uniformly at random from all of its legal
+        moves, or a row of -1 for a game that is over."""
+        batch = self._batch
+        moves = np.full((len(batch), 3), -1, dtype=np.intp)
+        # Only the games still being played are worked on.
+        rows = np.flatnonzero((batch.get_states() == UNFINISHED) & (batch.get_builders() >= 0).all(axis=1))
+        heights = batch.get_heights()[rows]
+        builders = batch.get_builders()[rows]
+        occupied = get_occupied(builders)
+        active = np.arange(len(rows))
+        first = 2 * batch.get_turns()[rows].astype(np.intp)
+
+        # Weigh each (builder, destination) pair by the builds it allows, so that every move is as likely.
+        weights = np.zeros((len(rows), PAIRS), dtype=np.int32)
+        for offset in range(2):
+            squares = builders[active, first + offset]
+            steps = get_steps(heights, squares, occupied)
+            weights[:, offset * CELLS:(offset + 1) * CELLS] = steps * get_builds(heights, squares, occupied)
+        pairs = pick_weighted(weights, self._rng)
+        init = builders[active, first + pairs // CELLS].astype(np.intp)
+        destination = pairs % CELLS
+
+        free = (heights < MAX_HEIGHT) & ~occupied
+        free[active, init] = True
+        build = pick_weighted((ADJACENT[destination] & free).astype(np.int32), self._rng)
+        moves[rows] = np.stack([init, destination, build], axis=1)
+        return moves
+
+    def play_random(self, max_plies=None, record=False):
+        """Plays random moves in every game until they are all over, or for at most max_plies steps.  Returns the
+        list of (positions, moves) pairs of each step if record is True, where positions is a BuildersBatch copy of
+        the positions before the step's moves, and moves is the N x 3 array played (-1 rows for finished games).
+        Otherwise returns None."""
+        steps = []
+        while self.count_unfinished() and (max_plies is None or len(steps) < max_plies):
+            moves = self.random_moves()
+            if record:
+                batch = self._batch
+                steps.append((BuildersBatch(batch.get_heights().copy(), batch.get_builders().copy(),
+                                            batch.get_turns().copy(), batch.get_states().copy()), moves))
+            else:
+                steps.append(None)
+            self.step(moves)
+        return steps if record else None
+
+
+def check_against_game(count=200, seed=None, junk_rate=0.3):
+    """Plays random games in a BatchSimulator and the same moves in BuildersGame instances, and returns a list of
+    descriptions of every difference found, empty if they agree.  Each step, some games are given a random, mostly
+    illegal move instead, including squares off the board, to check that the simulator masks exactly the moves
+    make_move rejects.  After every step the simulator's positions, turns and game states must match the games'.
+
+    Parameters
+    ----------
+    count : int
+        The number of games to play.
+    seed : int
+        The random seed.
+    junk_rate : float
+        The share of moves replaced by random ones.
+    """
+    rng = random.Random(seed)
+    simulator = BatchSimulator.random_start(count, seed)
+    games = []
+    for squares in simulator.get_batch().get_builders().tolist():
+        game = BuildersGame()
+        game.initial_placement(*COORDS[squares[0]], *COORDS[squares[1]], 'x')
+        game.initial_placement(*COORDS[squares[2]], *COORDS[squares[3]], 'o')
+        games.append(game)
+
+    differences = []
+    for ply in range(4 * MAX_HEIGHT * CELLS):
+        if not simulator.count_unfinished():
+            break
+        moves = simulator.random_moves()
+        coordinates = [COORDS[init] + COORDS[destination] + COORDS[build] if init >= 0 else (-1, -1) * 3
+                       for init, destination, build in moves.tolist()]
+        for index, game in enumerate(games):
+            if rng.random() < junk_rate:
+                # Move one of the mover's builders half the time, so that more of the junk gets past the first check.
+                first = 0 if game.get_turn() == 'x' else 2
+                init = COORDS[rng.choice(game.get_builders()[first:first + 2])] if rng.random() < 0.5 else \
+                    (rng.randint(-1, SIZE), rng.randint(-1, SIZE))
+                coordinates[index] = init + tuple(rng.randint(-1, SIZE) for _ in range(4))
+                moves[index] = [y * SIZE + x if 0 <= x < SIZE and 0 <= y < SIZE else -1
+                                for x, y in zip(coordinates[index][::2], coordinates[index][1::2])]
+
+        applied = simulator.step(moves)
+        for index, game in enumerate(games):
+            if game.make_move(*coordinates[index]) != applied[index]:
+                differences.append("ply %d game %d: move %s legal in BuildersGame %s, in the simulator %s" % (
+                    ply, index, coordinates[index], not applied[index], bool(applied[index])))
+
+        expected = BuildersBatch.from_games(games)
+        batch = simulator.get_batch()
+        for name, actual, wanted in (("heights", batch.get_heights(), expected.get_heights()),
+                                     ("builders", batch.get_builders(), expected.get_builders()),
+                                     ("turn", batch.get_turns(), expected.get_turns()),
+                                     ("state", batch.get_states(), expected.get_states())):
+            for index in np.flatnonzero((actual != wanted).reshape(count, -1).any(axis=1)):
+                differences.append("ply %d game %d: %s %s, expected %s" % (ply, index, name, actual[index].tolist(),
+                                                                          wanted[index].tolist()))
+        if differences:
+            break
+    return differences
+
+
+def main():
+    """Command line entry point.  Checks the simulator against BuildersGame on random seeds, then times random games
+    played both ways."""
+    parser = argparse.ArgumentParser(description="Play builders games in lockstep with NumPy.")
+    parser.add_argument("--games", type=int, default=10000, help="games to play in lockstep (default 10000)")
+    parser.add_argument("--check-seeds", type=int, default=5, help="seeds to check against BuildersGame (default 5)")
+    parser.add_argument("--check-games", type=int, default=200, help="games per checked seed (default 200)")
+    parser.add_argument("--seed", type=int, default=0, help="first random seed (default 0)")
+    args = parser.parse_args()
+
+    for seed in range(args.seed, args.seed + args.check_seeds):
+        differences = check_against_game(args.check_games, seed)
+        for difference in differences[:10]:
+            print(difference, file=sys.stderr)
+        if differences:
+            raise SystemExit("Seed %d: the simulator differs from BuildersGame" % seed)
+        print("seed %d: %d games agree with BuildersGame" % (seed, args.check_games))
+
+    start_time = time.perf_counter()
+    simulator = BatchSimulator.random_start(args.games, args.seed)
+    simulator.play_random()
+    elapsed = time.perf_counter() - start_time
+    states = simulator.get_batch().get_states()
+    print("lockstep     %d games  %.0f games/s  x won %d  o won %d  mean length %.1f plies" % (
+        args.games, args.games / elapsed, (states == X_WON).sum(), (states == O_WON).sum(),
+        simulator.get_plies().mean()))
+
+    rng = random.Random(args.seed)
+    games = max(1, args.games // 20)
+    start_time = time.perf_counter()
+    for _ in range(games):
+        game = BuildersGame()
+        squares = rng.sample(range(CELLS), 4)
+        game.initial_placement(*COORDS[squares[0]], *COORDS[squares[1]], 'x')
+        game.initial_placement(*COORDS[squares[2]], *COORDS[squares[3]], 'o')
+        while game.get_current_state() == "UNFINISHED":
+            init, destination, build = rng.choice(list(game.legal_moves()))
+            game.make_move(*init, *destination, *build)
+    elapsed = time.perf_counter() - start_time
+    print("BuildersGame %d games  %.0f games/s" % (games, games / elapsed))
+
+
+if __name__ == "__main__":
+    main()
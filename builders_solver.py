@@ -0,0 +1,359 @@
+# Author: Sean Tyler
+# Description:  An exact solver for BuildersGame positions, and a compact on-disk table of its results for computer
+#               players to look up instead of searching.
+#
+#               Every move builds exactly one level, so a game can last no more plies than there are levels left to
+#               build, and no position can come round again.  The solver is a memoized negamax over the canonical
+#               positions (see BuildersGame.get_canonical_form) reachable from a starting position: the positions
+#               closest to the end are resolved first and every position is worked out once.  Each is labelled a
+#               win or loss for the side to move with its distance in plies to the end of the game under best play
+#               (shortest win, longest loss), or a draw-by-depth if a depth limit was given and neither side can
+#               force the game to end within it.
+#
+#               File layout: an 8 byte magic string, the slot count and entry count as little-endian unsigned 64
+#               bit integers, then an open-addressed hash table of one little-endian 64 bit word per slot.  A word
+#               holds the top 55 bits of the position's canonical key (see BuildersGame.get_canonical_key) and the
+#               packed result, laid out as
+#                   bits 0-6  distance in plies (for a draw, the depth searched)
+#                   bits 7-8  outcome (0 for an empty slot)
+#               The slot count is a power of two at least twice the entry count.  A position is looked for from slot
+#               key & (slots - 1), moving on a slot at a time until it is found or an empty slot is reached.
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+
+from builders_game import BuildersGame, CELLS, COORDS, MAX_HEIGHT, NEIGHBORS, fold_key
+
+# Outcomes, for the side to move.
+WIN = 1
+LOSS = 2
+DRAW = 3
+OUTCOME_NAMES = {WIN: "win", LOSS: "loss", DRAW: "draw"}
+
+TABLE_MAGIC = b"BGSOLVE1"
+HEADER = struct.Struct("<QQ")
+SLOT = struct.Struct("<Q")
+DISTANCE_BITS = 7
+VALUE_MASK = (1 << DISTANCE_BITS + 2) - 1
+
+
+def count_builds_left(game):
+    """Returns the number of levels that can still be built on the board, which bounds the plies left in the game."""
+    levels = game.get_levels()
+    return MAX_HEIGHT * CELLS - sum(bin(levels[level]).count("1") for level in range(1, MAX_HEIGHT + 1))
+
+
+def get_steps(game):
+    """Returns the mask of cells the side to move can step a builder onto.  There is always somewhere to build after
+    a step, at least on the cell stepped off, so the player has a move if and only if the mask is not empty."""
+    levels = game.get_levels()
+    builders = game.get_builders()
+    first = 0 if game.get_turn() == 'x' else 2
+    steps = 0
+    for square in builders[first:first + 2]:
+        height = (levels[1] >> square & 1) + (levels[2] >> square & 1) + (levels[3] >> square & 1)
+        steps |= NEIGHBORS[square] & levels[max(height - 1, 0)] & ~levels[height + 2]
+    return steps & ~game.get_occupied()
+
+
+class BuildersSolver:
+    """A memoized solver of BuildersGame positions.  Results are kept between calls to solve, so positions solved
+    from one starting position are reused from the next, and can all be written out with write_table.  Moves are
+    made and unmade on the game with push and pop, so the game is left as it was.
+    """
+
+    def __init__(self):
+        """Initializes the BuildersSolver class."""
+        self._game = None
+        # (outcome, distance) results keyed by canonical code.  Positions that end the game there and then, with an
+        # immediate win or no moves at all, are not stored, as they are cheaper to spot than to look up.
+        self._results = dict()
+        self._nodes = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def get_results(self):
+        """Returns the dict of (outcome, distance) results keyed by canonical code.  Not a copy."""
+        return self._results
+
+    def get_nodes(self):
+        """Returns the number of positions visited so far, including those found in the results."""
+        return self._nodes
+
+    def solve(self, game, max_depth=None):
+        """Solves the game's position and returns its (outcome, distance) for the side to move.
+
+        Parameters
+        ----------
+        game : BuildersGame
+            The game whose current position is solved.  Both players must have placed their builders, and the game
+            must not be over.
+        max_depth : int
+            The most plies to look ahead.  Positions that cannot be forced to an end within it are labelled DRAW.
+            Defaults to the number of levels left to build, which solves the position outright.
+        """
+        if game.get_current_state() != "UNFINISHED" or min(game.get_builders()) < 0:
+            raise ValueError("The game must be under way to be solved")
+        if max_depth is None:
+            max_depth = count_builds_left(game)
+        self._game = game
+        try:
+            return self.search(min(max_depth, (1 << DISTANCE_BITS) - 1))
+        finally:
+            self._game = None
+
+    def search(self, depth):
+        """Returns the (outcome, distance) of the position for the side to move, looking at most depth plies
+        ahead."""
+        self._nodes += 1
+        game = self._game
+        steps = get_steps(game)
+        if not steps:
+            return LOSS, 0
+        if steps & game.get_levels()[3]:
+            return WIN, 1
+        if depth == 0:
+            return DRAW, 0
+
+        code = game.get_canonical_form()[0]
+        result = self._results.get(code)
+        # Wins and losses are exact whatever depth found them, and are draws to a search not deep enough to see the
+        # game end.  A draw only holds for the depth it was searched to.
+        if result is not None:
+            if result[0] != DRAW:
+                return result if result[1] <= depth else (DRAW, depth)
+            if result[1] >= depth:
+                return DRAW, depth
+
+        shortest_win = None
+        longest_loss = 0
+        drawn = False
+        for move in game.legal_move_squares():
+            # Once a win is found, the other moves only need searching deep enough to find a shorter one.
+            limit = depth - 1 if shortest_win is None else shortest_win - 1
+            if limit < 0:
+                break
+            game.push(move)
+            try:
+                outcome, distance = self.search(limit)
+            finally:
+                game.pop()
+            if outcome == LOSS:
+                if shortest_win is None or distance < shortest_win:
+                    shortest_win = distance
+            elif outcome == WIN:
+                longest_loss = max(longest_loss, distance)
+            else:
+                drawn = True
+
+        if shortest_win is not None:
+            result = (WIN, shortest_win + 1)
+        elif drawn:
+            result = (DRAW, depth)
+        else:
+            result = (LOSS, longest_loss + 1)
+        self._results[code] = result
+        return result
+
+    def write_table(self, path):
+        """Writes the results to a table file for SolverTable, and returns the number of entries written."""
+        return write_table(path, self._results)
+
+
+def write_table(path, results):
+    """Writes a solver table file from a dict of (outcome, distance) results keyed by canonical code.  Returns the
+    number of entries written."""
+    slots = 2
+    while slots < 2 * len(results):
+        slots *= 2
+    mask = slots - 1
+    words = array("Q", bytes(8 * slots))
+    entries = 0
+    for code, (outcome, distance) in results.items():
+        key = fold_key(code)
+        word = key & ~VALUE_MASK | outcome << DISTANCE_BITS | distance
+        index = key & mask
+        while words[index] and (words[index] ^ key) & ~VALUE_MASK:
+            index = index + 1 & mask
+        entries += not words[index]
+        words[index] = word
+    if sys.byteorder == "big":
+        words.byteswap()
+    with open(path, "wb") as file:
+        file.write(TABLE_MAGIC)
+        file.write(HEADER.pack(slots, entries))
+        words.tofile(file)
+    return entries
+
+
+class SolverTable:
+    """A read-only, memory-mapped table of solved positions, as written by write_table.
+
+    Parameters
+    ----------
+    path : string
+        The path of the table file.
+    """
+
+    def __init__(self, path):
+        """Initializes the SolverTable class."""
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        start = len(TABLE_MAGIC) + HEADER.size
+        if size <= start:
+            self._file.close()
+            raise ValueError(path + " is not a solver table")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._slots, self._entries = HEADER.unpack_from(self._data, len(TABLE_MAGIC))
+        if self._data[:len(TABLE_MAGIC)] != TABLE_MAGIC or self._slots & self._slots - 1 or \
+                size != start + self._slots * SLOT.size:
+            self.close()
+            raise ValueError(path + " is not a solver table")
+        self._mask = self._slots - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._entries
+
+    def close(self):
+        """Unmaps and closes the table file."""
+        self._data.close()
+        self._file.close()
+
+    def probe(self, key):
+        """Looks up a canonical key.  Returns the (outcome, distance) stored for the position, or None if it is not
+        in the table."""
+        index = key & self._mask
+        offset = len(TABLE_MAGIC) + HEADER.size
+        while True:
+            word = SLOT.unpack_from(self._data, offset + index * SLOT.size)[0]
+            if not word:
+                return None
+            if not (word ^ key) & ~VALUE_MASK:
+                return word >> DISTANCE_BITS & 3, word & (1 << DISTANCE_BITS) - 1
+            index = index + 1 & self._mask
+
+    def probe_game(self, game):
+        """Returns the (outcome, distance) stored for the game's position, or None if it is not in the table."""
+        return self.probe(game.get_canonical_key()[0])
+
+    def choose_move(self, game):
+        """Returns the best move in the game's position by the table, as a (builder, destination, build) square
+        triple (see BuildersGame.push): a winning step if there is one, else the move leaving the opponent the
+        shortest loss, the soonest-ending draw or the longest win, in that order.  Returns None if there are no
+        moves, or none of the positions they lead to are in the table or end the game there and then."""
+        levels = game.get_levels()
+        best = None
+        best_rank = None
+        for move in game.legal_move_squares():
+            if levels[3] >> move[1] & 1:
+                return move
+            game.push(move)
+            try:
+                # Positions that end the game there and then are not in the table (see BuildersSolver.search).
+                steps = get_steps(game)
+                if not steps:
+                    result = (LOSS, 0)
+                elif steps & levels[3]:
+                    result = (WIN, 1)
+                else:
+                    result = self.probe_game(game)
+            finally:
+                game.pop()
+            if result is None:
+                continue
+            outcome, distance = result
+            if outcome == LOSS:
+                rank = (2, -distance)
+            elif outcome == DRAW:
+                rank = (1, -distance)
+            else:
+                rank = (0, distance)
+            if best_rank is None or rank > best_rank:
+                best = move
+                best_rank = rank
+        return best
+
+
+def setup_game(args):
+    """Returns a BuildersGame with the builders placed and the moves played from the parsed command line
+    arguments."""
+    game = BuildersGame()
+    placements = [[int(number) for number in text.split(",")] for text in (args.place_x, args.place_o)]
+    if any(len(numbers) != 4 for numbers in placements) or not game.initial_placement(*placements[0], 'x') or \
+            not game.initial_placement(*placements[1], 'o'):
+        raise SystemExit("Illegal placement")
+    for text in args.moves:
+        numbers = [int(number) for number in text.split(",")]
+        if len(numbers) != 6 or not game.make_move(*numbers):
+            raise SystemExit("Illegal move: " + text)
+    return game
+
+
+def main():
+    """Command line entry point, to solve positions into a table or look up a position in one."""
+    parser = argparse.ArgumentParser(description="Solve builders game positions, or query a table of them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    solve = commands.add_parser("solve", help="solve positions and write them to a table")
+    probe = commands.add_parser("probe", help="look up a position in a table")
+    for command in (solve, probe):
+        command.add_argument("moves", nargs="*", help='moves to play after placement, as "x,y,x,y,x,y"')
+        command.add_argument("--place-x", default="1,1,3,3", help="x player's builders as x,y,x,y (default 1,1,3,3)")
+        command.add_argument("--place-o", default="1,3,3,1", help="o player's builders as x,y,x,y (default 1,3,3,1)")
+    solve.add_argument("-o", "--output", required=True, help="table file to write")
+    solve.add_argument("--depth", type=int, help="most plies to look ahead (default: solve outright)")
+    solve.add_argument("--random", type=int, default=0, help="random moves to play before solving (default 0)")
+    solve.add_argument("--games", type=int, default=1, help="random positions to solve (default 1)")
+    solve.add_argument("--seed", type=int, help="random seed")
+    probe.add_argument("--table", required=True, help="table file to read")
+    args = parser.parse_args()
+
+    if args.command == "probe":
+        game = setup_game(args)
+        with SolverTable(args.table) as table:
+            result = table.probe_game(game)
+            if result is None:
+                print("Not in the table.")
+                return
+            print("%s in %d" % (OUTCOME_NAMES[result[0]], result[1]))
+            move = table.choose_move(game)
+            if move is not None:
+                print("best move " + ",".join(str(number) for square in move for number in COORDS[square]))
+        return
+
+    rng = random.Random(args.seed)
+    solver = BuildersSolver()
+    start_time = time.perf_counter()
+    for _ in range(args.games):
+        game = setup_game(args)
+        for _ in range(args.random):
+            moves = list(game.legal_moves())
+            if not moves or game.get_current_state() != "UNFINISHED":
+                break
+            init, destination, build = rng.choice(moves)
+            game.make_move(*init, *destination, *build)
+        if game.get_current_state() != "UNFINISHED":
+            print("game over: " + game.get_current_state())
+            continue
+        outcome, distance = solver.solve(game, args.depth)
+        print("%s in %d  (%d levels left to build)" % (OUTCOME_NAMES[outcome], distance, count_builds_left(game)))
+    elapsed = time.perf_counter() - start_time
+    entries = solver.write_table(args.output)
+    print("%d positions written to %s  nodes %d  %.2f s  %.0f nodes/s" % (
+        entries, args.output, solver.get_nodes(), elapsed, solver.get_nodes() / max(elapsed, 1e-9)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+# Author: Sean Tyler
+# Description:  An asyncio server hosting many concurrent JanggiGame and BuildersGame sessions over TCP, and a
+#               client for it.  Sessions live in memory; moves are validated in a thread pool and engine searches run
+#               in a process pool, so the event loop never waits on game code.
+#
+#               The protocol is one JSON object per line in each direction.  Each request has an "op" and an
+#               optional "id", which is echoed in its response along with "ok" (and "error" if it failed):
+#
+#                   {"op": "new", "game": "janggi" or "builders"}         -> session, version, state
+#                   {"op": "watch", "session": id}                       -> version, state; then diff events
+#                   {"op": "unwatch", "session": id}
+#                   {"op": "state", "session": id}                       -> version, state
+#                   {"op": "move", "session": id, "start": "c7", "end": "c6"}           (janggi)
+#                   {"op": "move", "session": id, "args": [x, y, x, y, x, y]}           (builders make_move)
+#                   {"op": "place", "session": id, "args": [x, y, x, y, "x" or "o"]}    (builders placement)
+#                                                                        -> version, diff
+#                   {"op": "engine", "session": id, "depth": 3, "time": 1.0, "play": false}   (janggi, depth up to
+#                                                                        MAX_ENGINE_DEPTH, time up to MAX_ENGINE_TIME)
+#                                                                        -> move, score, and diff if played
+#                   {"op": "close", "session": id}
+#
+#               A state is {"cells": [...], "turn": ..., "state": ...}.  Janggi cells are the piece letters of
+#               JanggiGame.get_placement in flat square order, and builders cells are "<height>" or
+#               "<height><builder>" (e.g. "2X0") indexed y * 5 + x.  After each change, a diff holding only what
+#               changed, {"cells": [[index, value], ...], "turn": ..., "state": ...}, is sent to the session's
+#               watchers as {"event": "diff", "session": id, "version": n, "diff": {...}}.
+
+import argparse
+import asyncio
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from builders_game import BuildersGame
+from janggi_engine import Searcher
+from janggi_game import JanggiGame
+from janggi_replay import SQUARE_PATTERN
+from transposition import TranspositionTable
+
+# Watchers whose unsent output grows past this many bytes are dropped, so a slow client cannot hold memory.
+MAX_WRITE_BUFFER = 1 << 20
+
+# The longest request line accepted, in bytes.
+MAX_LINE = 1 << 16
+
+# The deepest engine search and longest engine time a request may ask for, so that one request cannot hold an
+# engine worker for good.  Every search is bounded by MAX_ENGINE_TIME, whatever depth is asked for.
+MAX_ENGINE_DEPTH = 8
+MAX_ENGINE_TIME = 30.0
+
+# The transposition table size of each engine worker, in MB.
+ENGINE_HASH_MB = 16
+
+# Per process state of an engine worker: its transposition table, kept between requests.
+_engine_table = None
+
+
+def _init_engine_worker(hash_mb):
+    """Sets up an engine worker process with its own transposition table."""
+    global _engine_table
+    _engine_table = TranspositionTable(hash_mb)
+
+
+def _engine_move(state, depth, time_limit):
+    """Runs in an engine worker process: searches the binary position and returns (move text, score), or
+    (None, score) if there are no legal moves."""
+    game = JanggiGame.from_bytes(state)
+    result = Searcher(game, _engine_table).search(depth, time_limit)
+    move = result.get_best_move()
+    return (None if move is None else game.move_to_text(move)), result.get_score()
+
+
+def is_integer(value):
+    """Returns True if a decoded JSON value is an integer, and not a bool."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class RequestError(Exception):
+    """Raised while handling a request that cannot be carried out.  Its message is sent back to the client."""
+    pass
+
+
+class Session:
+    """A game hosted by the server, with the connections watching it.  Changes to the game are serialized by the
+    session's lock, and each one bumps the version sent with diffs.  Subclasses wrap a particular game class.
+
+    Parameters
+    ----------
+    session_id : string
+        The session's id.
+    game : object
+        The game being hosted.
+    """
+
+    def __init__(self, session_id, game):
+        """Initializes the Session class."""
+        self._id = session_id
+        self._game = game
+        self._lock = asyncio.Lock()
+        self._version = 0
+        self._watchers = set()
+        self._snapshot = self.snapshot()
+
+    def get_id(self):
+        """Returns the session's id."""
+        return self._id
+
+    def get_game(self):
+        """Returns the hosted game."""
+        return self._game
+
+    def get_lock(self):
+        """Returns the lock that must be held while the game is changed."""
+        return self._lock
+
+    def get_version(self):
+        """Returns the number of changes made to the game so far."""
+        return self._version
+
+    def get_watchers(self):
+        """Returns the set of connections watching the session."""
+        return self._watchers
+
+    def get_state(self):
+        """Returns the state as of the latest change."""
+        return self._snapshot
+
+    def snapshot(self):
+        """Returns the game's current state as a dict of cells, turn and state.  For subclasses."""
+        raise NotImplementedError
+
+    def apply(self, request):
+        """Carries out a move request on the game, returning True if it was legal.  Runs in the thread pool.  For
+        subclasses."""
+        raise NotImplementedError
+
+    def update(self):
+        """Takes a new snapshot after a change and returns the diff from the last one, bumping the version if
+        anything changed, or None if nothing did."""
+        old = self._snapshot
+        new = self.snapshot()
+        diff = dict()
+        cells = [[index, cell] for index, (before, cell) in enumerate(zip(old["cells"], new["cells"]))
+                 if before != cell]
+        if cells:
+            diff["cells"] = cells
+        for name in ("turn", "state"):
+            if old[name] != new[name]:
+                diff[name] = new[name]
+        if not diff:
+            return None
+        self._snapshot = new
+        self._version += 1
+        return diff
+
+
+class JanggiSession(Session):
+    """A session hosting a JanggiGame."""
+
+    def __init__(self, session_id):
+        """Initializes the JanggiSession class."""
+        super().__init__(session_id, JanggiGame())
+
+    def snapshot(self):
+        return {"cells": list(self._game.get_placement()),
+                "turn": self._game.get_player_turn(),
+                "state": self._game.get_game_state()}
+
+    def apply(self, request):
+        start = request.get("start")
+        end = request.get("end")
+        if not isinstance(start, str) or not isinstance(end, str) or not SQUARE_PATTERN.match(start) or \
+                not SQUARE_PATTERN.match(end):
+            raise RequestError('a janggi move needs "start" and "end" squares such as "c7"')
+        return self._game.make_move(start, end)
+
+
+class BuildersSession(Session):
+    """A session hosting a BuildersGame."""
+
+    def __init__(self, session_id):
+        """Initializes the BuildersSession class."""
+        super().__init__(session_id, BuildersGame())
+
+    def snapshot(self):
+        game = self._game
+        cells = []
+        for y in range(5):
+            for x in range(5):
+                cells.append(str(game.get_cell([x, y])) + game.build_pos([x, y]).strip())
+        return {"cells": cells, "turn": game.get_turn(), "state": game.get_current_state()}
+
+    def apply(self, request):
+        args = request.get("args")
+        if request["op"] == "place":
+            if not isinstance(args, list) or len(args) != 5 or not all(is_integer(arg) for arg in args[:4]) or \
+                    args[4] not in ('x', 'o'):
+                raise RequestError('a placement needs "args" of four coordinates and a player, "x" or "o"')
+            return self._game.initial_placement(*args)
+        if not isinstance(args, list) or len(args) != 6 or not all(is_integer(arg) for arg in args):
+            raise RequestError('a builders move needs "args" of six coordinates')
+        return self._game.make_move(*args)
+
+
+SESSION_CLASSES = {"janggi": JanggiSession, "builders": BuildersSession}
+
+
+class GameServer:
+    """The game server.  Holds every session in memory and serves the JSON lines protocol to any number of
+    connections.
+
+    Parameters
+    ----------
+    max_sessions : int
+        The most sessions that may be open at once.
+    move_workers : int
+        The number of threads validating and making moves.
+    engine_workers : int
+        The number of processes running engine searches.
+    """
+
+    def __init__(self, max_sessions=10000, move_workers=4, engine_workers=1):
+        """Initializes the GameServer class."""
+        self._max_sessions = max_sessions
+        self._sessions = dict()
+        self._ids = itertools.count(1)
+        self._move_pool = ThreadPoolExecutor(move_workers)
+        self._engine_workers = engine_workers
+        self._engine_pool = None
+        self._server = None
+        # The handler task of each open connection, by its writer, so they can be wound down on close.
+        self._connections = dict()
+
+    def get_sessions(self):
+        """Returns the dict of open sessions, by id."""
+        return self._sessions
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Starts listening for connections, returning the asyncio server.  A port of 0 picks a free port."""
+        self._server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE)
+        return self._server
+
+    async def close(self):
+        """Stops listening, disconnects every client, and shuts down the worker pools."""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._move_pool.shutdown()
+        if self._engine_pool is not None:
+            self._engine_pool.shutdown()
+
+    async def handle_connection(self, reader, writer):
+        """Serves one connection's requests in order until it disconnects, then stops it watching anything."""
+        watching = set()
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break
+                if not line:
+                    break
+                response = await self.handle_line(line, writer, watching)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session in watching:
+                session.get_watchers().discard(writer)
+            del self._connections[writer]
+            writer.close()
+
+    async def handle_line(self, line, writer, watching):
+        """Parses and carries out one request line, returning the response dict."""
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError("request is not valid JSON")
+            if not isinstance(request, dict):
+                raise RequestError("request must be a JSON object")
+            request_id = request.get("id")
+            response = await self.handle_request(request, writer, watching)
+        except RequestError as error:
+            response = {"ok": False, "error": str(error)}
+        else:
+            response["ok"] = True
+        if request_id is not None:
+            response["id"] = request_id
+        return response
+
+    async def handle_request(self, request, writer, watching):
+        """Carries out a parsed request and returns the response fields.  Raises RequestError if it fails."""
+        op = request.get("op")
+        if op == "new":
+            if len(self._sessions) >= self._max_sessions:
+                raise RequestError("too many sessions")
+            session_class = SESSION_CLASSES.get(request.get("game"))
+            if session_class is None:
+                raise RequestError('"game" must be one of ' + ", ".join(sorted(SESSION_CLASSES)))
+            session = session_class(str(next(self._ids)))
+            self._sessions[session.get_id()] = session
+            return {"session": session.get_id(), "version": 0, "state": session.get_state()}
+
+        session_id = request.get("session")
+        session = self._sessions.get(session_id) if isinstance(session_id, str) else None
+        if session is None:
+            raise RequestError("no such session")
+        if op == "state":
+            return {"version": session.get_version(), "state": session.get_state()}
+        if op == "watch":
+            session.get_watchers().add(writer)
+            watching.add(session)
+            return {"version": session.get_version(), "state": session.get_state()}
+        if op == "unwatch":
+            session.get_watchers().discard(writer)
+            watching.discard(session)
+            return {}
+        if op == "close":
+            del self._sessions[session.get_id()]
+            self.broadcast(session, {"event": "closed", "session": session.get_id()}, writer)
+            return {}
+        if op in ("move", "place"):
+            async with session.get_lock():
+                legal = await asyncio.get_running_loop().run_in_executor(self._move_pool, session.apply, request)
+                if not legal:
+                    raise RequestError("illegal move")
+                return self.publish(session, writer)
+        if op == "engine":
+            return await self.engine(session, request, writer)
+        raise RequestError("unknown op")
+
+    async def engine(self, session, request, writer):
+        """Searches a janggi session's position in the engine process pool, and plays the move if asked."""
+        if not isinstance(session, JanggiSession):
+            raise RequestError("the engine only plays janggi")
+        depth = request.get("depth")
+        time_limit = request.get("time")
+        if depth is not None and (not is_integer(depth) or not 1 <= depth <= MAX_ENGINE_DEPTH):
+            raise RequestError('"depth" must be a whole number from 1 to ' + str(MAX_ENGINE_DEPTH))
+        if time_limit is not None and (not isinstance(time_limit, (int, float)) or isinstance(time_limit, bool) or
+                                       not 0 < time_limit <= MAX_ENGINE_TIME):
+            raise RequestError('"time" must be a number of seconds up to ' + str(MAX_ENGINE_TIME))
+        if depth is None and time_limit is None:
+            depth = 3
+        if time_limit is None:
+            time_limit = MAX_ENGINE_TIME
+        if self._engine_pool is None:
+            self._engine_pool = ProcessPoolExecutor(self._engine_workers, initializer=_init_engine_worker,
+                                                    initargs=(ENGINE_HASH_MB,))
+
+        loop = asyncio.get_running_loop()
+        async with session.get_lock():
+            state = session.get_game().to_bytes()
+            move, score = await loop.run_in_executor(self._engine_pool, _engine_move, state, depth, time_limit)
+            response = {"move": move, "score": score}
+            if move is not None and request.get("play"):
+                start, end = move.split("-")
+                await loop.run_in_executor(self._move_pool, session.get_game().make_move, start, end)
+                response.update(self.publish(session, writer))
+        return response
+
+    def publish(self, session, writer):
+        """Sends a session's diff since its last change to its watchers, other than the connection that made the
+        change, and returns the response fields for that connection."""
+        diff = session.update() or dict()
+        if diff:
+            self.broadcast(session, {"event": "diff", "session": session.get_id(), "version": session.get_version(),
+                                     "diff": diff}, writer)
+        return {"version": session.get_version(), "diff": diff}
+
+    def broadcast(self, session, message, sender=None):
+        """Queues a message to every watcher of a session except the sender.  Watchers too far behind are
+        dropped."""
+        data = (json.dumps(message) + "\n").encode()
+        for watcher in list(session.get_watchers()):
+            if watcher is sender:
+                continue
+            if watcher.is_closing() or watcher.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                session.get_watchers().discard(watcher)
+                watcher.close()
+                continue
+            watcher.write(data)
+
+
+class GameClient:
+    """An asyncio client for GameServer.  Responses are matched to requests by id, and events from watched
+    sessions are queued for get_event.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+    writer : asyncio.StreamWriter
+        The connection's streams, as from asyncio.open_connection.  Use GameClient.connect to open one.
+    """
+
+    def __init__(self, reader, writer):
+        """Initializes the GameClient class."""
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+        self._pending = dict()
+        self._events = asyncio.Queue()
+        self._listener = asyncio.get_running_loop().create_task(self.listen())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        """Opens a connection to a server and returns a client for it."""
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+        return cls(reader, writer)
+
+    async def listen(self):
+        """Reads lines from the server, resolving responses and queueing events, until the connection closes."""
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "event" in message:
+                    self._events.put_nowait(message)
+                elif message.get("id") in self._pending:
+                    self._pending.pop(message["id"]).set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self._pending.clear()
+
+    async def request(self, op, **fields):
+        """Sends a request and returns the server's response dict."""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        fields.update(op=op, id=request_id)
+        self._writer.write((json.dumps(fields) + "\n").encode())
+        await self._writer.drain()
+        return await future
+
+    async def get_event(self):
+        """Waits for and returns the next event from a watched session."""
+        return await self._events.get()
+
+    async def close(self):
+        """Closes the connection."""
+        self._writer.close()
+        self._listener.cancel()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(host, port, max_sessions, move_workers, engine_workers):
+    """Runs a game server until it is cancelled."""
+    server = GameServer(max_sessions, move_workers, engine_workers)
+    listener = await server.start(host, port)
+    print("Serving on " + ", ".join(str(sock.getsockname()) for sock in listener.sockets))
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Host Janggi and Builders game sessions over TCP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default 8765)")
+    parser.add_argument("--max-sessions", type=int, default=10000, help="most open sessions (default 10000)")
+    parser.add_argument("--move-workers", type=int, default=4, help="threads making moves (default 4)")
+    parser.add_argument("--engine-workers", type=int, default=1, help="engine search processes (default 1)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_sessions, args.move_workers, args.engine_workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Author: Sean Tyler
+# Description:  Timing benchmarks for JanggiGame move generation, check and checkmate detection.  Results can be
+#               saved as JSON and compared against a previous run, so speedups can be shown and regressions caught.
+
+import argparse
+import io
+import json
+import statistics
+import timeit
+
+from janggi_game import BoardRenderer, Cannon, Chariot, Elephant, General, Guard, Horse, Soldier
+from janggi_perft import load_position
+
+# Registered benchmarks, as (name, setup) pairs.  Each setup function returns the callable to be timed.
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Decorator registering a setup function as a named benchmark."""
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+@benchmark("compile_all_moves opening")
+def bench_compile_all_opening():
+    return load_position("opening").compile_all_moves
+
+
+@benchmark("compile_all_moves chariots open")
+def bench_compile_all_chariots():
+    return load_position("chariots open").compile_all_moves
+
+
+@benchmark("move_in_check opening")
+def bench_move_in_check():
+    game = load_position("opening")
+    piece = game.get_space(game.map_to_board("c7"))
+    start, end = game.map_to_board("c7"), game.map_to_board("c6")
+    return lambda: game.move_in_check(start, end, piece)
+
+
+@benchmark("move_in_check red in check")
+def bench_move_in_check_checked():
+    game = load_position("red in check")
+    piece = game.get_space(game.map_to_board("f2"))
+    start, end = game.map_to_board("f2"), game.map_to_board("e2")
+    return lambda: game.move_in_check(start, end, piece)
+
+
+@benchmark("determine_checkmate red in check")
+def bench_determine_checkmate_escape():
+    game = load_position("red in check")
+    return lambda: game.determine_checkmate("RED")
+
+
+@benchmark("determine_checkmate cannon mate")
+def bench_determine_checkmate_mate():
+    game = load_position("cannon mate")
+    return lambda: game.determine_checkmate("RED")
+
+
+@benchmark("print_board full frame")
+def bench_render_full():
+    game = load_position("chariots open")
+    renderer = BoardRenderer(io.StringIO())
+    return lambda: renderer.draw(game)
+
+
+@benchmark("print_board diff one move")
+def bench_render_diff():
+    game = load_position("chariots open")
+    renderer = BoardRenderer(io.StringIO())
+    move = game.get_legal_moves()[0]
+    renderer.draw(game, diff=True)
+    moved = [False]
+
+    def step():
+        # Alternate between the position and the one after a move, so every diff has cells to draw.
+        if moved[0]:
+            game.pop()
+        else:
+            game.push(move)
+        moved[0] = not moved[0]
+        renderer.draw(game, diff=True)
+    return step
+
+
+def bench_piece(piece_class):
+    """Returns a setup function timing compile_valid_moves for the first piece of a class in a midgame position."""
+    def setup():
+        game = load_position("cannons out")
+        for piece in game.get_pieces():
+            if isinstance(piece, piece_class):
+                return piece.compile_valid_moves
+    return setup
+
+
+for _piece_class in (Soldier, General, Guard, Horse, Cannon, Chariot, Elephant):
+    benchmark(_piece_class.__name__ + ".compile_valid_moves")(bench_piece(_piece_class))
+
+
+def run(name_filter=None, repeat=5):
+    """Runs the registered benchmarks whose names contain the filter, printing and returning the results as a dict
+    of name to {"min": seconds per call, "median": seconds per call, "calls": calls per round}."""
+    results = dict()
+    for name, setup in BENCHMARKS:
+        if name_filter is not None and name_filter not in name:
+            continue
+        timer = timeit.Timer(setup())
+        calls = timer.autorange()[0]
+        times = [total / calls for total in timer.repeat(repeat, calls)]
+        results[name] = {"min": min(times), "median": statistics.median(times), "calls": calls}
+        print("%-40s %12.1f us  (median %.1f us, %d calls x %d)"
+              % (name, min(times) * 1e6, statistics.median(times) * 1e6, calls, repeat))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of each result against a baseline run.  Returns the names that got slower than the
+    threshold (a fraction, e.g. 0.1 for 10%)."""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        change = results[name]["min"] / baseline[name]["min"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("%-40s %+8.1f%%%s" % (name, change * 100, flag))
+    return regressions
+
+
+def main():
+    """Command line entry point.  Exits with status 1 if a comparison finds a regression."""
+    parser = argparse.ArgumentParser(description="Time JanggiGame move generation.")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per benchmark (default 5)")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved by a previous run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fractional slowdown reported as a regression (default 0.1)")
+    args = parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
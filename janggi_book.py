@@ -0,0 +1,206 @@
+# Author: Sean Tyler
+# Description:  An opening book for JanggiGame.  A book is a file of fixed-size records sorted by position key
+#               (see JanggiGame.get_position_key), each holding one move played from that position and its weight.
+#               Books are memory-mapped and searched by binary search, so opening one is instant however large it
+#               is, and they are built from recorded games in the format read by janggi_replay.
+#
+#               File layout: an 8 byte magic string, then 16 byte records of (key, move, weight) as little-endian
+#               unsigned 64, 32 and 32 bit integers, sorted by key and then move.  A move is stored as
+#               start * SQUARES + end, using flat squares (see to_square).
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from janggi_game import JanggiGame, SQUARES
+from janggi_replay import SQUARE_PATTERN, read_games
+
+BOOK_MAGIC = b"JGBOOK01"
+RECORD = struct.Struct("<QII")
+
+
+class OpeningBook:
+    """A read-only, memory-mapped opening book.
+
+    Parameters
+    ----------
+    path : string
+        The path of the book file, as written by write_book.
+    """
+
+    def __init__(self, path):
+        """Initializes the OpeningBook class."""
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(BOOK_MAGIC) or (size - len(BOOK_MAGIC)) % RECORD.size:
+            self._file.close()
+            raise ValueError(path + " is not an opening book")
+        # An empty file cannot be memory-mapped, so a book with no records is read straight from the file.
+        if size > len(BOOK_MAGIC):
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = self._file.read()
+        if self._data[:len(BOOK_MAGIC)] != BOOK_MAGIC:
+            self.close()
+            raise ValueError(path + " is not an opening book")
+        self._records = (size - len(BOOK_MAGIC)) // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._records
+
+    def close(self):
+        """Unmaps and closes the book file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def get_key(self, index):
+        """Returns the position key of the record at the given index."""
+        return struct.unpack_from("<Q", self._data, len(BOOK_MAGIC) + index * RECORD.size)[0]
+
+    def get_moves(self, key):
+        """Returns a list of the (move, weight) pairs stored for a position key, where each move is a (start, end)
+        flat square tuple, or an empty list if the position is not in the book."""
+        # Binary search for the first record with this key.
+        low = 0
+        high = self._records
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+        offset = len(BOOK_MAGIC) + low * RECORD.size
+        for index in range(low, self._records):
+            record_key, move, weight = RECORD.unpack_from(self._data, offset)
+            if record_key != key:
+                break
+            moves.append((divmod(move, SQUARES), weight))
+            offset += RECORD.size
+        return moves
+
+    def choose_move(self, game, rng=None, best=False):
+        """Returns a book move for the game's position as a (start, end) tuple, or None if it is out of book.
+        Moves are picked at random in proportion to their weight, or the heaviest is picked if best is True.  Only
+        moves that are legal in the position are considered, in case of a position key collision.
+
+        Parameters
+        ----------
+        game : JanggiGame
+            The game whose position is looked up.
+        rng : random.Random
+            The random number generator to pick with.  Defaults to the random module.
+        best : bool
+            Whether to always pick the heaviest move.
+        """
+        legal_moves = set(game.get_legal_moves())
+        moves = [(move, weight) for move, weight in self.get_moves(game.get_position_key())
+                 if move in legal_moves and weight > 0]
+        if not moves:
+            return None
+        if best:
+            return max(moves, key=lambda entry: entry[1])[0]
+        rng = rng or random
+        pick = rng.uniform(0, sum(weight for move, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick <= 0:
+                return move
+        return moves[-1][0]
+
+
+def write_book(path, entries):
+    """Writes an opening book file from a dict of weights keyed by (position key, move), where each move is a
+    (start, end) flat square tuple.  Weights are capped to fit in 32 bits."""
+    records = sorted((key, move[0] * SQUARES + move[1], min(weight, 0xFFFFFFFF))
+                     for (key, move), weight in entries.items())
+    with open(path, "wb") as file:
+        file.write(BOOK_MAGIC)
+        for record in records:
+            file.write(RECORD.pack(*record))
+    return len(records)
+
+
+def count_book_moves(games, max_plies=20, entries=None):
+    """Replays recorded games from the opening and counts how often each move was played from each position, up to
+    the given ply.  A game is only followed up to its first illegal or badly formed move, and passes are not
+    counted.  Returns a dict of counts keyed by (position key, move), which may be passed back in to add more games.
+
+    Parameters
+    ----------
+    games : iterable
+        The (game id, move texts) pairs to replay, e.g. from janggi_replay.read_games.
+    max_plies : int
+        The number of plies from the opening to count.
+    entries : dict
+        The counts to add to.  A new dict is made if None.
+    """
+    if entries is None:
+        entries = dict()
+    for game_id, moves in games:
+        game = JanggiGame()
+        for text in moves[:max_plies]:
+            squares = text.split("-")
+            if len(squares) != 2 or not all(SQUARE_PATTERN.match(square) for square in squares):
+                break
+            key = game.get_position_key()
+            if not game.make_move(squares[0], squares[1]):
+                break
+            if squares[0] != squares[1]:
+                move = game.text_to_move(text)
+                entries[(key, move)] = entries.get((key, move), 0) + 1
+    return entries
+
+
+def build_book(paths, output, max_plies=20, min_count=1):
+    """Builds an opening book file from game record files.  Moves played fewer than min_count times from a
+    position are left out.  Returns the number of records written."""
+    entries = count_book_moves(read_games(paths), max_plies)
+    return write_book(output, {entry: count for entry, count in entries.items() if count >= min_count})
+
+
+def main():
+    """Command line entry point, to build a book or look up the book moves after a sequence of moves."""
+    parser = argparse.ArgumentParser(description="Build or query a Janggi opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from game record files")
+    build.add_argument("paths", nargs="+", help='game files to read, or "-" for standard input')
+    build.add_argument("-o", "--output", required=True, help="book file to write")
+    build.add_argument("--plies", type=int, default=20, help="plies from the opening to include (default 20)")
+    build.add_argument("--min-count", type=int, default=1, help="times a move must be played (default 1)")
+    probe = commands.add_parser("probe", help="list the book moves after the given moves")
+    probe.add_argument("book", help="book file to read")
+    probe.add_argument("moves", nargs="*", help='moves to play from the opening first, e.g. "c7-c6"')
+    args = parser.parse_args()
+
+    if args.command == "build":
+        records = build_book(args.paths, args.output, args.plies, args.min_count)
+        print("%d book records written to %s" % (records, args.output), file=sys.stderr)
+        return
+
+    game = JanggiGame()
+    for text in args.moves:
+        start, end = text.split("-")
+        if not game.make_move(start, end):
+            raise SystemExit("Illegal move: " + text)
+    with OpeningBook(args.book) as book:
+        moves = book.get_moves(game.get_position_key())
+        if not moves:
+            print("Out of book.")
+        for move, weight in sorted(moves, key=lambda entry: entry[1], reverse=True):
+            print("%s %d" % (game.move_to_text(move), weight))
+
+
+if __name__ == "__main__":
+    main()
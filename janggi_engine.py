@@ -0,0 +1,274 @@
+# Author: Sean Tyler
+# Description:  An alpha-beta search engine for JanggiGame, for use as a computer opponent or analysis tool.
+#               Iterative deepening negamax with a material plus mobility evaluation, captures-first, killer and
+#               history move ordering, and a time or node budget.  An opening book, if given, is consulted before
+#               searching.
+
+import argparse
+import time
+
+from janggi_book import OpeningBook
+from janggi_game import JanggiGame, ROWS, SQUARES
+from search import CHECK_INTERVAL, INFINITY, MATE_SCORE, MAX_PLY, SearchResult, SearchTimeout, \
+    score_from_table, score_to_table
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Material values of each piece type.  The General cannot be captured by a legal move, so it has no value.
+PIECE_VALUES = {"Soldier": 20, "Guard": 30, "Elephant": 30, "Horse": 50, "Cannon": 70, "Chariot": 130,
+                "General": 0}
+
+# Score per space a player's pieces can move to, over the opponent's.
+MOBILITY_WEIGHT = 1
+
+
+class Searcher:
+    """An iterative deepening alpha-beta searcher over a JanggiGame position.  Moves are made and unmade on the game
+    with push and pop, so the game is left as it was after each search.
+
+    Parameters
+    ----------
+    game : JanggiGame
+        The game whose current position is searched.
+    table : TranspositionTable
+        The transposition table to use, which may be shared between searches.  A 16 MB table is made if None.
+    book : OpeningBook
+        The opening book to play from while the position is in it, or None to always search.
+    """
+
+    def __init__(self, game, table=None, book=None):
+        """Initializes the Searcher class."""
+        self._game = game
+        self._table = TranspositionTable(16) if table is None else table
+        self._book = book
+        self._nodes = 0
+        self._node_limit = None
+        self._deadline = None
+        self._pv = [[] for _ in range(MAX_PLY + 1)]
+        self._killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        # History heuristic scores, indexed start * SQUARES + end, for quiet moves that caused a cutoff.
+        self._history = dict()
+
+    def search(self, max_depth=None, time_limit=None, node_limit=None):
+        """Searches the position with iterative deepening and returns a SearchResult for the deepest completed
+        depth.  Stops at whichever limit is reached first.  With no limits at all, searches to depth 4.  If the
+        position is in the opening book, a book move is returned instead, with a depth of 0 and no nodes searched.
+
+        Parameters
+        ----------
+        max_depth : int
+            The deepest depth to search, in plies.
+        time_limit : float
+            The time budget, in seconds.
+        node_limit : int
+            The node budget.
+        """
+        if self._book is not None:
+            move = self._book.choose_move(self._game)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, [move])
+
+        if max_depth is None:
+            max_depth = 4 if time_limit is None and node_limit is None else MAX_PLY
+        self._nodes = 0
+        self._node_limit = node_limit
+        self._deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self._killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self._table.new_search()
+
+        result = SearchResult(None, 0, 0, 0, [])
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                break
+            pv = list(self._pv[0])
+            result = SearchResult(pv[0] if pv else None, score, depth, self._nodes, pv)
+
+            # No need to search deeper once there are no moves or a forced mate has been found.
+            if not pv or abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+
+        # If the budget ran out before depth 1 was done, fall back on the best move found so far, or else the first
+        # in search order, so that a move is returned whenever there is one.  Its score is unknown.
+        if result.get_best_move() is None and result.get_depth() == 0:
+            moves = self._game.get_legal_moves()
+            if moves:
+                move = self._pv[0][0] if self._pv[0] else self.order_moves(moves, 0)[0]
+                result = SearchResult(move, 0, 0, self._nodes, [move])
+        return result
+
+    def search_move(self, move, depth, alpha=-INFINITY, beta=INFINITY, time_limit=None):
+        """Searches a single legal root move to the given depth within an alpha-beta window, for splitting the root
+        between workers.  Returns a tuple of (score, principal variation, nodes), or raises SearchTimeout if the
+        time limit runs out first."""
+        self._nodes = 0
+        self._node_limit = None
+        self._deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self._pv[1] = []
+        self._game.push(move)
+        try:
+            score = -self.negamax(depth - 1, -beta, -alpha, 1)
+        finally:
+            self._game.pop()
+        return score, [move] + self._pv[1], self._nodes
+
+    def negamax(self, depth, alpha, beta, ply):
+        """Returns the score of the position for the side to move, searched to the given depth within the
+        alpha-beta window.  Fills in the principal variation from this ply down."""
+        self._nodes += 1
+        if self._nodes % CHECK_INTERVAL == 0:
+            self.check_budget()
+
+        # The best move last found at this ply is tried first, then the variation is rebuilt from scratch.
+        pv_move = self._pv[ply][0] if self._pv[ply] else None
+        self._pv[ply] = []
+        if depth == 0 or ply >= MAX_PLY:
+            return self.evaluate()
+
+        # A stored result searched at least as deep can end the search here, except at the root where a move is
+        # needed.  Otherwise its best move is tried first.
+        game = self._game
+        key = game.get_position_key()
+        entry = self._table.probe(key)
+        if entry is not None:
+            stored_depth, bound, score, stored_move = entry
+            if stored_move is not None:
+                pv_move = divmod(stored_move, SQUARES)
+            if stored_depth >= depth and ply > 0:
+                score = score_from_table(score, ply)
+                if bound == EXACT or bound == LOWER and score >= beta or bound == UPPER and score <= alpha:
+                    if pv_move is not None and bound == EXACT:
+                        self._pv[ply] = [pv_move]
+                    return score
+
+        player = game.get_player_turn()
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = None
+        moves = game.get_legal_moves(player)
+
+        # No legal moves: mated if in check, otherwise the player can only pass, which scores as even.
+        if not moves:
+            return -MATE_SCORE + ply if game.is_in_check(player) else 0
+
+        for move in self.order_moves(moves, ply, pv_move):
+            game.push(move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.pop()
+
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self._pv[ply] = [move] + self._pv[ply + 1]
+                if alpha >= beta:
+                    if game.get_space([move[1] // ROWS, move[1] % ROWS]) is None:
+                        self.store_killer(move, ply, depth)
+                    break
+
+        if best <= original_alpha:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self._table.store(key, depth, bound, score_to_table(best, ply), best_move[0] * SQUARES + best_move[1])
+        return best
+
+    def order_moves(self, moves, ply, pv_move=None):
+        """Sorts moves so the likeliest to cause a cutoff are searched first: the principal variation move, then
+        captures by most valuable victim and least valuable attacker, then killer moves, then by history score."""
+        game = self._game
+        killers = self._killers[ply]
+        scored = []
+        for move in moves:
+            victim = game.get_space([move[1] // ROWS, move[1] % ROWS])
+            if move == pv_move:
+                score = 3 * INFINITY
+            elif victim is not None:
+                attacker = game.get_space([move[0] // ROWS, move[0] % ROWS])
+                score = 2 * INFINITY + 10 * PIECE_VALUES[victim.get_type()] - PIECE_VALUES[attacker.get_type()]
+            elif move == killers[0] or move == killers[1]:
+                score = INFINITY
+            else:
+                score = self._history.get(move[0] * SQUARES + move[1], 0)
+            scored.append((score, move))
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        return [move for score, move in scored]
+
+    def store_killer(self, move, ply, depth):
+        """Records a quiet move that caused a cutoff as a killer at this ply, and credits its history score."""
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        key = move[0] * SQUARES + move[1]
+        self._history[key] = self._history.get(key, 0) + depth * depth
+
+    def evaluate(self):
+        """Returns the static score of the position for the side to move: material plus mobility."""
+        game = self._game
+        player = game.get_player_turn()
+        opponent = "RED" if player == "BLUE" else "BLUE"
+        score = MOBILITY_WEIGHT * (game.get_mobility(player) - game.get_mobility(opponent))
+        for piece in game.get_pieces():
+            if piece.get_player() == player:
+                score += PIECE_VALUES[piece.get_type()]
+            else:
+                score -= PIECE_VALUES[piece.get_type()]
+        return score
+
+    def get_table(self):
+        """Returns the searcher's transposition table, e.g. to export its hit-rate counters."""
+        return self._table
+
+    def check_budget(self):
+        """Raises SearchTimeout if the node or time budget has run out."""
+        if self._node_limit is not None and self._nodes >= self._node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+
+def main():
+    """Command line entry point.  Plays the given moves from the opening and prints the engine's analysis."""
+    parser = argparse.ArgumentParser(description="Search a Janggi position for the best move.")
+    parser.add_argument("moves", nargs="*", help='moves to play from the opening first, e.g. "c7-c6"')
+    parser.add_argument("--depth", type=int, help="deepest depth to search")
+    parser.add_argument("--time", type=float, help="time budget in seconds")
+    parser.add_argument("--nodes", type=int, help="node budget")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB (default 16)")
+    parser.add_argument("--book", help="opening book file to play from before searching")
+    args = parser.parse_args()
+
+    game = JanggiGame()
+    for text in args.moves:
+        start, end = text.split("-")
+        if not game.make_move(start, end):
+            raise SystemExit("Illegal move: " + text)
+
+    book = None if args.book is None else OpeningBook(args.book)
+    start_time = time.perf_counter()
+    searcher = Searcher(game, TranspositionTable(args.hash), book)
+    result = searcher.search(args.depth, args.time, args.nodes)
+    elapsed = time.perf_counter() - start_time
+    if book is not None:
+        book.close()
+    if result.get_best_move() is None:
+        print("No legal moves.")
+        return
+    print("best move %s  score %d  depth %d  nodes %d  %.2f s" % (game.move_to_text(result.get_best_move()),
+                                                                   result.get_score(), result.get_depth(),
+                                                                   result.get_nodes(), elapsed))
+    print("pv " + " ".join(game.move_to_text(move) for move in result.get_pv()))
+    stats = searcher.get_table().get_stats()
+    print("hash probes %d  hits %d (%.1f%%)  stores %d  replacements %d" % (stats["probes"], stats["hits"],
+                                                                            100 * stats["hit_rate"], stats["stores"],
+                                                                            stats["replacements"]))
+
+
+if __name__ == "__main__":
+    main()
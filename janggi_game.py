@@ -1,6 +1,11 @@
 # Author: Sean Tyler
 # Description:  A Janggi game (Korean chess).  Work in progress.
 
+import random
+import sys
+from collections.abc import Set
+
+
 class Color:
     """A class of console colors, for printing purposes."""
     red_pieces = '\033[1;33;41m'
@@ -10,23 +15,378 @@ class Color:
     endc = '\033[m'
 
 
+# The board is stored as a flat array of 90 squares, numbered x * 10 + n for an [x,n] coordinate, so each column
+# of 10 rows is contiguous.  Occupancy is also kept as one integer bitboard per player, with bit i set when square
+# i holds a piece.  The tables below are built once at import so move path checks become a lookup and a mask.
+COLUMNS = 9
+ROWS = 10
+SQUARES = COLUMNS * ROWS
+
+
+def to_square(space):
+    """Converts an [x,n] coordinate into its flat board index."""
+    return space[0] * ROWS + space[1]
+
+
+def _build_between():
+    """Returns a flat table, indexed start * SQUARES + end, of the bitmask of squares strictly between two squares
+    on the same column or row.  Squares that do not share a line have an empty mask."""
+    between = [0] * (SQUARES * SQUARES)
+    for start in range(SQUARES):
+        x, n = divmod(start, ROWS)
+        for dx, dn in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            mask = 0
+            step_x, step_n = x + dx, n + dn
+            while 0 <= step_x < COLUMNS and 0 <= step_n < ROWS:
+                end = step_x * ROWS + step_n
+                between[start * SQUARES + end] = mask
+                mask |= 1 << end
+                step_x, step_n = step_x + dx, step_n + dn
+    return between
+
+
+def _build_blocks(offsets):
+    """Returns a dict, keyed start * SQUARES + end, of the bitmask of squares that block a stepping move.
+
+    Parameters
+    ----------
+    offsets : list
+        Tuples of (dx, dn, blocking offsets), where each blocking offset is a (dx, dn) relative to the start.
+    """
+    blocks = dict()
+    for start in range(SQUARES):
+        x, n = divmod(start, ROWS)
+        for dx, dn, path in offsets:
+            if 0 <= x + dx < COLUMNS and 0 <= n + dn < ROWS:
+                mask = 0
+                for px, pn in path:
+                    mask |= 1 << ((x + px) * ROWS + n + pn)
+                blocks[start * SQUARES + (x + dx) * ROWS + n + dn] = mask
+    return blocks
+
+
+def _sign(value):
+    """Returns 1 or -1 depending on the sign of a non-zero value."""
+    return 1 if value > 0 else -1
+
+
+def in_palace(space):
+    """Returns a string indicating which palace a provided [x,n] coordinate is in.  If none, returns None."""
+    if 3 <= space[0] <= 5:
+        if space[1] < 3:
+            return "RED"
+        if space[1] > 6:
+            return "BLUE"
+
+
+def move_in_palace(start, end):
+    """Returns True if a move begins and ends within a palace, and is along one of its lines.  See
+    JanggiGame.get_move_in_palace."""
+    if in_palace(start) == in_palace(end) and in_palace(start) is not None:
+
+        # Check diagonal lines according to rules.
+        if start[0] in [3, 5] and start[1] == 8 and end[0] == 4 and end[1] in [0, 2, 7, 9]:
+            return False
+        if start[0] == 4 and start[1] in [0, 2, 7, 9] and end[0] in [3, 5] and end[1] in [1, 8]:
+            return False
+        return True
+    return False
+
+
+def _build_step_table(allowed):
+    """Returns a tuple, indexed by square, of the (end square, 0) moves to the adjacent squares for which
+    allowed(start, end) is True, given [x,n] coordinates.  The 0 is the (empty) blocking mask, so every table has
+    the same (end, mask) entries."""
+    table = []
+    for start in range(SQUARES):
+        x, n = divmod(start, ROWS)
+        moves = []
+        for dx in (-1, 0, 1):
+            for dn in (-1, 0, 1):
+                if (dx or dn) and 0 <= x + dx < COLUMNS and 0 <= n + dn < ROWS and allowed([x, n], [x + dx, n + dn]):
+                    moves.append(((x + dx) * ROWS + n + dn, 0))
+        table.append(tuple(moves))
+    return tuple(table)
+
+
+def _soldier_allowed(player):
+    """Returns the move filter of a player's Soldiers: one space forward or sideways, or diagonally forward along a
+    palace line.  RED moves up the rows and BLUE down."""
+    def allowed(start, end):
+        if end[1] < start[1] if player == "RED" else end[1] > start[1]:
+            return False
+        distance = abs(start[0] - end[0]) + abs(start[1] - end[1])
+        return distance == 1 or distance == 2 and move_in_palace(start, end)
+    return allowed
+
+
+def _build_jump_table(blocks):
+    """Returns a tuple, indexed by square, of the (end square, blocking mask) moves in a blocks dict."""
+    table = [[] for _ in range(SQUARES)]
+    for key in sorted(blocks):
+        table[key // SQUARES].append((key % SQUARES, blocks[key]))
+    return tuple(tuple(moves) for moves in table)
+
+
+def _build_rays():
+    """Returns a tuple, indexed by square, of the four orthogonal rays leaving it, each a tuple of squares in order
+    outward from the square."""
+    rays = []
+    for start in range(SQUARES):
+        x, n = divmod(start, ROWS)
+        square_rays = []
+        for dx, dn in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            ray = []
+            step_x, step_n = x + dx, n + dn
+            while 0 <= step_x < COLUMNS and 0 <= step_n < ROWS:
+                ray.append(step_x * ROWS + step_n)
+                step_x, step_n = step_x + dx, step_n + dn
+            square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return tuple(rays)
+
+
+def _build_sources(table):
+    """Returns the reverse of a move table: a tuple, indexed by end square, of the (start square, blocking mask)
+    moves that reach it.  For working out which pieces attack a square."""
+    sources = [[] for _ in range(SQUARES)]
+    for start in range(SQUARES):
+        for end, block in table[start]:
+            sources[end].append((start, block))
+    return tuple(tuple(moves) for moves in sources)
+
+
+def _build_sensitive(rays, horse_sources, elephant_sources):
+    """Returns a tuple, indexed by a General's square, of the mask of squares whose occupancy can change whether
+    that square is attacked: every square on its rays (chariot lines and cannon screens) and the legs of every
+    horse and elephant move onto it."""
+    sensitive = []
+    for square in range(SQUARES):
+        mask = 0
+        for ray in rays[square]:
+            for step in ray:
+                mask |= 1 << step
+        for start, block in horse_sources[square] + elephant_sources[square]:
+            mask |= block
+        sensitive.append(mask)
+    return tuple(sensitive)
+
+
+def _build_zobrist():
+    """Returns the Zobrist keys used for position hashing: a dict keyed (player, piece type) of 90 random 64-bit keys,
+    one per square, and the key toggled when it is RED's turn.  The generator is seeded so keys are stable between
+    runs and processes."""
+    generator = random.Random(0x4A414E474749)
+    pieces = dict()
+    for player in ("BLUE", "RED"):
+        for piece_type in ("Soldier", "Cannon", "Guard", "General", "Elephant", "Horse", "Chariot"):
+            pieces[(player, piece_type)] = tuple(generator.getrandbits(64) for _ in range(SQUARES))
+    return pieces, generator.getrandbits(64)
+
+
+# One letter per piece type for compact positions: upper case for BLUE pieces, lower case for RED.
+PIECE_CODES = {"Soldier": "P", "Cannon": "C", "Guard": "A", "General": "K", "Elephant": "B", "Horse": "N",
+               "Chariot": "R"}
+
+# Game state and side to move tokens of the FEN-like text format, and the piece letters in the order of their
+# 4-bit codes in the binary format (0 is empty, 8 is added for RED pieces).
+STATE_CODES = {"UNFINISHED": "-", "BLUE_WON": "B", "RED_WON": "R"}
+TURN_CODES = {"BLUE": "b", "RED": "r"}
+BINARY_PIECES = "PCAKBNR"
+BINARY_STATES = ("UNFINISHED", "BLUE_WON", "RED_WON")
+
+BETWEEN = _build_between()
+ZOBRIST_PIECES, ZOBRIST_RED_TURN = _build_zobrist()
+
+# A horse steps one space orthogonally (which can be blocked) and then one diagonally.
+HORSE_BLOCKS = _build_blocks([(dx, dn, [(_sign(dx), 0) if abs(dx) > abs(dn) else (0, _sign(dn))])
+                              for dx in (-2, -1, 1, 2) for dn in (-2, -1, 1, 2) if abs(dx) != abs(dn)])
+
+# An elephant steps one space orthogonally and then two diagonally, and can be blocked on either of the first two.
+ELEPHANT_BLOCKS = _build_blocks([(dx, dn, [(_sign(dx), 0), (2 * _sign(dx), _sign(dn))] if abs(dx) > abs(dn) else
+                                  [(0, _sign(dn)), (_sign(dx), 2 * _sign(dn))])
+                                 for dx in (-3, -2, 2, 3) for dn in (-3, -2, 2, 3) if abs(dx) != abs(dn)])
+
+# Per-square move tables, built once at import.  Each entry is a tuple of (end square, blocking mask) candidate
+# moves, already filtered for the board edge and the palace lines, so compiling a piece's moves only has to test
+# the mask against the occupancy and the end square's occupant.  Generals and Guards share a table.
+PALACE_MOVES = _build_step_table(move_in_palace)
+SOLDIER_MOVES = {"RED": _build_step_table(_soldier_allowed("RED")),
+                 "BLUE": _build_step_table(_soldier_allowed("BLUE"))}
+HORSE_MOVES = _build_jump_table(HORSE_BLOCKS)
+ELEPHANT_MOVES = _build_jump_table(ELEPHANT_BLOCKS)
+RAYS = _build_rays()
+
+# Reverse tables, for finding the attackers of a square from the square itself, and the squares around each General
+# square that can block or unblock an attack on it (see JanggiGame.generate_legal_moves).
+PALACE_SOURCES = _build_sources(PALACE_MOVES)
+SOLDIER_SOURCES = {"RED": _build_sources(SOLDIER_MOVES["RED"]), "BLUE": _build_sources(SOLDIER_MOVES["BLUE"])}
+HORSE_SOURCES = _build_sources(HORSE_MOVES)
+ELEPHANT_SOURCES = _build_sources(ELEPHANT_MOVES)
+GENERAL_SENSITIVE = _build_sensitive(RAYS, HORSE_SOURCES, ELEPHANT_SOURCES)
+
+
+class MoveView(Set):
+    """An immutable, set-backed view of moves, for the results of JanggiGame.get_all_moves.  Membership tests take an
+    [x,n] space (list or tuple) and are O(1), and iterating yields [x,n] lists.
+
+    Parameters
+    ----------
+    squares : iterable
+        The flat squares of the moves.
+    """
+
+    def __init__(self, squares):
+        """Initializes the MoveView class."""
+        self._squares = frozenset(squares)
+
+    def __contains__(self, space):
+        try:
+            return space[0] * ROWS + space[1] in self._squares
+        except (TypeError, IndexError):
+            return False
+
+    def __iter__(self):
+        for square in self._squares:
+            yield [square // ROWS, square % ROWS]
+
+    def __len__(self):
+        return len(self._squares)
+
+    def __repr__(self):
+        return "MoveView(" + repr(sorted(self)) + ")"
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        """Set operations between views return a frozenset of (x, n) tuples, as [x,n] lists cannot be hashed."""
+        return frozenset(tuple(space) for space in iterable)
+
+
+# The renderer print_board uses when none is given, made on first use.
+_default_renderer = None
+
+
+class BoardRenderer:
+    """Renders a JanggiGame board for the console.  Each frame is assembled into one string and written with a
+    single write.  The line art between ranks, the rank and file labels and each piece's colored cell are built once,
+    when the renderer is made.
+
+    In full mode the frame is exactly what print_board has always printed.  In diff mode, after a first full frame,
+    only the cells that changed since the last frame are written, using ANSI cursor moves relative to the line just
+    below the board, where the cursor is left after every frame.
+
+    Parameters
+    ----------
+    stream : file
+        The stream to write frames to.  Defaults to standard output at the time of each draw.
+    """
+
+    def __init__(self, stream=None):
+        """Initializes the BoardRenderer class."""
+        self._stream = stream
+        self._empty = Color.empty + "   " + Color.endc
+        self._link = Color.board + "--" + Color.endc
+        self._ranks = [str(n + 1) + " " if n + 1 < 10 else str(n + 1) for n in range(ROWS)]
+        self._lines = dict()
+        for n in range(1, ROWS):
+            if n < 3 or n > ROWS-3:
+                if n == 2 or n == 9:
+                    art = r"   |    |    |    | \  |  / |    |    |    | "
+                else:
+                    art = r"   |    |    |    | /  |  \ |    |    |    | "
+            else:
+                art = "   |    |    |    |    |    |    |    |    | "
+            self._lines[n] = Color.board + art + Color.endc + "\n"
+        self._files = "   a    b    c    d    e    f    g    h    i\n"
+        self._colors = {"RED": Color.red_pieces, "BLUE": Color.blue_pieces}
+        self._pieces = dict()
+        self._cells = None
+
+    def get_cells(self, game):
+        """Returns the rendered cell of every square of the game's board, in flat square order."""
+        cells = []
+        for piece in game.get_board():
+            if piece is None:
+                cells.append(self._empty)
+                continue
+            key = (piece.get_player(), piece.get_marker())
+            cell = self._pieces.get(key)
+            if cell is None:
+                cell = self._pieces[key] = self._colors[key[0]] + key[1] + Color.endc
+            cells.append(cell)
+        return cells
+
+    def render(self, game):
+        """Returns the full frame of the game's board, and remembers its cells for the next diff."""
+        cells = self._cells = self.get_cells(game)
+        link = self._link
+        parts = []
+        for n in range(ROWS-1, -1, -1):
+            parts.append(self._ranks[n] + link.join(cells[n::ROWS]) + "\n")
+            if n > 0:
+                parts.append(self._lines[n])
+        parts.append(self._files)
+        return "".join(parts)
+
+    def render_diff(self, game):
+        """Returns the cursor moves and cells that redraw only what changed since the last frame, or the full frame
+        if there was none.  The cursor is expected to be where the last frame left it."""
+        if self._cells is None:
+            return self.render(game)
+        cells = self.get_cells(game)
+        parts = []
+        height = 0
+        for square, cell in enumerate(cells):
+            if cell is self._cells[square] or cell == self._cells[square]:
+                continue
+            # Rank n is drawn 2 * n + 2 lines above the cursor, and file x at column 3 + 5 * x.
+            up = 2 * (square % ROWS) + 2
+            if up > height:
+                parts.append("\033[%dA" % (up - height))
+            elif up < height:
+                parts.append("\033[%dB" % (height - up))
+            parts.append("\033[%dG" % (3 + 5 * (square // ROWS)) + cell)
+            height = up
+        if height:
+            parts.append("\033[%dB" % height)
+        if parts:
+            parts.append("\r")
+        self._cells = cells
+        return "".join(parts)
+
+    def draw(self, game, diff=False):
+        """Writes the game's board to the stream in a single write, as a full frame or, in diff mode, as the changes
+        since the last frame."""
+        stream = sys.stdout if self._stream is None else self._stream
+        stream.write(self.render_diff(game) if diff else self.render(game))
+
+    def reset(self):
+        """Forgets the last frame, so the next diff draws the full board, e.g. after the screen is cleared."""
+        self._cells = None
+
+
 class JanggiGame:
     """A Janggi Game class."""
 
     def __init__(self):
         """Initializes the JanggiGame class."""
-        self._board = []
-        self._red_moves = []
-        self._blue_moves = []
+        self._board = [None] * SQUARES
+        self._occupied = {"BLUE": 0, "RED": 0}
+        self._pieces = []
+        # Attack maps, keyed by flat square index, counting how many of the player's pieces can move there.
+        self._attacks = {"BLUE": dict(), "RED": dict()}
         self._generals = [None, None]
+        # Undo records for push/pop, most recent last.
+        self._history = []
+        # Results of get_all_moves and get_piece_moves, keyed by query, each stored with the position version it was
+        # computed for.  Any change to the board through assign_space or clear_space bumps the version.
+        self._version = 0
+        self._move_cache = dict()
         self._player_turn = "BLUE"
         self._game_state = "UNFINISHED"
-        for x in range(9):
-            self._board.append([])
-            for y in range(10):
-                self._board[x].append(None)
         self.new_game()
         self.compile_all_moves()
+        self._position_key = self.compute_position_key()
 
     def set_general(self, general, player):
         """Sets the game's private general var.  For querying check conditions."""
@@ -37,15 +397,21 @@ class JanggiGame:
 
     def get_space(self, space):
         """Returns the piece at a spot on the board provided a [x,n] coordinate, or None if none."""
-        return self._board[space[0]][space[1]]
+        return self._board[space[0] * ROWS + space[1]]
+
+    def get_occupied(self, player=None):
+        """Returns the occupancy bitboard of a player's pieces, or of all pieces if no player is given."""
+        if player is None:
+            return self._occupied["BLUE"] | self._occupied["RED"]
+        return self._occupied[player]
+
+    def get_board(self):
+        """Returns the board as a flat list of 90 squares (see to_square), each a piece or None.  Not a copy."""
+        return self._board
 
     def get_in_palace(self, space):
         """Returns a string indicating which palace a provided [x,n] coordinate is in.  If none, returns None. """
-        if 3 <= space[0] <= 5:
-            if space[1] < 3:
-                return "RED"
-            if space[1] > 6:
-                return "BLUE"
+        return in_palace(space)
 
     def get_move_in_palace(self, start, end):
         """Returns True if a move begins and ends within a palace.  For pieces with certain move restrictions.
@@ -57,19 +423,16 @@ class JanggiGame:
         end : list
             The space the piece is moving to, in the form [x,n], for [alphabetic column, numeric row]
         """
-        if self.get_in_palace(start) == self.get_in_palace(end) and self.get_in_palace(start) is not None:
-
-            # Check diagonal lines according to rules.
-            if start[0] in [3, 5] and start[1] == 8 and end[0] == 4 and end[1] in [0, 2, 7, 9]:
-                return False
-            if start[0] == 4 and start[1] in [0, 2, 7, 9] and end[0] in [3, 5] and end[1] in [1, 8]:
-                return False
-            return True
-        return False
+        return move_in_palace(start, end)
 
     def clear_space(self, space):
         """Sets a space to empty.  For after moving a piece, etc."""
-        self._board[space[0]][space[1]] = None
+        square = space[0] * ROWS + space[1]
+        piece = self._board[square]
+        if piece is not None:
+            self._occupied[piece.get_player()] &= ~(1 << square)
+            self._board[square] = None
+            self._version += 1
 
     def assign_space(self, space, piece):
         """Sets a specified space as occupied by the specified piece, for initial board setup or moving a piece.
@@ -82,16 +445,449 @@ class JanggiGame:
             The piece object subclass (soldier, General) that should occupy the space.
         """
 
-        self._board[space[0]][space[1]] = piece
+        self.clear_space(space)
+        if piece is not None:
+            square = space[0] * ROWS + space[1]
+            self._board[square] = piece
+            self._occupied[piece.get_player()] |= 1 << square
+            self._version += 1
+
+    def add_piece(self, piece):
+        """Registers a piece with the game, so that its moves are tracked in the attack maps."""
+        self._pieces.append(piece)
+
+    def push(self, move):
+        """Makes a move without checking that it is valid, and records how to undo it with pop.  Captures, the
+        attack maps and the turn are all updated.
+
+        Parameters
+        ----------
+        move : tuple
+            The (start, end) flat square indices of the move (see to_square), or None to pass.
+        """
+        if move is None:
+            self._history.append((None, None, None, None, None, self._game_state))
+            self.switch_turn()
+            return
+
+        start, end = move
+        piece = self._board[start]
+        captured = self._board[end]
+        keys = ZOBRIST_PIECES[(piece.get_player(), piece.get_type())]
+        self._position_key ^= keys[start] ^ keys[end]
+        if captured is not None:
+            self._position_key ^= ZOBRIST_PIECES[(captured.get_player(), captured.get_type())][end]
+            self._pieces.remove(captured)
+            self.count_attacks(captured, -1)
+        start_space = [start // ROWS, start % ROWS]
+        end_space = [end // ROWS, end % ROWS]
+        self.clear_space(start_space)
+        self.assign_space(end_space, piece)
+        piece.set_position(end_space)
+        changed = self.update_attacks([start_space, end_space])
+        self._history.append((start_space, end_space, piece, captured, changed, self._game_state))
+        self.switch_turn()
+
+    def commit(self, move):
+        """Makes a move like push, but keeps no record to undo it, so moves of normal play do not grow the undo
+        stack.  Records pushed before it are kept, and must not be popped past it.
+
+        Parameters
+        ----------
+        move : tuple
+            The (start, end) flat square indices of the move (see to_square), or None to pass.
+        """
+        self.push(move)
+        self._history.pop()
+
+    def pop(self):
+        """Undoes the most recent push, restoring the captured piece, positions, turn, game state and attack maps.
+        Only the pieces recompiled by the push are touched."""
+        start, end, piece, captured, changed, state = self._history.pop()
+        self.switch_turn()
+        self._game_state = state
+        if piece is None:
+            return
+
+        keys = ZOBRIST_PIECES[(piece.get_player(), piece.get_type())]
+        self._position_key ^= keys[to_square(start)] ^ keys[to_square(end)]
+        if captured is not None:
+            self._position_key ^= ZOBRIST_PIECES[(captured.get_player(), captured.get_type())][to_square(end)]
+
+        # Put back the moves each recompiled piece had before the push.
+        for changed_piece, moves in changed:
+            self.count_attacks(changed_piece, -1)
+            changed_piece.set_moves(moves)
+            self.count_attacks(changed_piece, 1)
+
+        self.assign_space(start, piece)
+        piece.set_position(start)
+        self.assign_space(end, captured)
+        if captured is not None:
+            self._pieces.append(captured)
+            self.count_attacks(captured, 1)
+
+    def count_attacks(self, piece, sign):
+        """Adds (sign 1) or removes (sign -1) a piece's current moves to its player's attack map."""
+        attacks = self._attacks[piece.get_player()]
+        for key in piece.get_move_squares():
+            count = attacks.get(key, 0) + sign
+            if count:
+                attacks[key] = count
+            else:
+                del attacks[key]
+
+    def update_attacks(self, spaces):
+        """Recompiles the moves of only those pieces whose lines pass through one of the changed spaces, and
+        updates the attack maps to match.
+
+        Parameters
+        ----------
+        spaces : list
+            The spaces whose occupancy changed, as a list of [x,n] coordinates.
+
+        Returns a list of (piece, previous moves) for each recompiled piece, so the update can be undone.
+        """
+        changed = []
+        for piece in self._pieces:
+            for space in spaces:
+                if piece.watches(space):
+                    changed.append((piece, piece.get_move_squares()))
+                    self.count_attacks(piece, -1)
+                    piece.compile_valid_moves()
+                    self.count_attacks(piece, 1)
+                    break
+        return changed
+
+    def is_attacked(self, space, player):
+        """Returns True if any of the player's pieces can move to the given [x,n] space."""
+        return space[0] * ROWS + space[1] in self._attacks[player]
+
+    def get_mobility(self, player):
+        """Returns the number of distinct spaces the player's pieces can move to."""
+        return len(self._attacks[player])
 
     def get_game_state(self):
         """Returns the state of the game.  "UNFINISHED if still playing, or RED WON or BLUE WON if respective
         player has won."""
         return self._game_state
 
+    def get_player_turn(self):
+        """Returns the player whose turn it is, "BLUE" or "RED"."""
+        return self._player_turn
+
+    def get_pieces(self, player=None):
+        """Returns a list of the pieces in play, or only the given player's pieces."""
+        if player is None:
+            return list(self._pieces)
+        return [piece for piece in self._pieces if piece.get_player() == player]
+
+    def get_placement(self):
+        """Returns the piece placement as a 90 character string in flat square order (see to_square), with one
+        piece letter per square (see PIECE_CODES) or "." for an empty square."""
+        placement = ["."] * SQUARES
+        for piece in self._pieces:
+            code = PIECE_CODES[piece.get_type()]
+            placement[to_square(piece.get_position())] = code if piece.get_player() == "BLUE" else code.lower()
+        return "".join(placement)
+
+    def set_position(self, placement, player_turn="BLUE", game_state="UNFINISHED"):
+        """Replaces the position with the given piece placement, as returned by get_placement.  Clears the move
+        history.
+
+        Parameters
+        ----------
+        placement : string
+            90 characters in flat square order, one piece letter or "." per square.
+        player_turn : string
+            The player to move, "BLUE" or "RED".
+        game_state : string
+            The state of the game, as returned by get_game_state.
+        """
+        if len(placement) != SQUARES:
+            raise ValueError("A placement must have " + str(SQUARES) + " squares")
+        # Check and move generation look up each side's General, so a position needs exactly one of each.
+        for code, player in (("K", "BLUE"), ("k", "RED")):
+            if placement.count(code) != 1:
+                raise ValueError(player + " must have exactly one General, not " + str(placement.count(code)))
+        self._board = [None] * SQUARES
+        self._occupied = {"BLUE": 0, "RED": 0}
+        self._pieces = []
+        self._generals = [None, None]
+        self._history = []
+        # Results of get_all_moves and get_piece_moves, keyed by query, each stored with the position version it was
+        # computed for.  Any change to the board through assign_space or clear_space bumps the version.
+        self._version = 0
+        self._move_cache = dict()
+        self._player_turn = player_turn
+        self._game_state = game_state
+        for square in range(SQUARES):
+            code = placement[square]
+            if code != ".":
+                if code.upper() not in PIECE_CLASSES:
+                    raise ValueError("Unknown piece letter " + code)
+                player = "BLUE" if code.isupper() else "RED"
+                PIECE_CLASSES[code.upper()]([square // ROWS, square % ROWS], player, self)
+        self.compile_all_moves()
+        self._position_key = self.compute_position_key()
+
+    def to_fen(self):
+        """Returns the position as FEN-like text: the ranks from row 10 down to row 1, each listing columns a to i
+        with a piece letter (see PIECE_CODES) or a digit counting empty squares, separated by "/".  Then the side to
+        move ("b" or "r") and the game state ("-" unfinished, "B" BLUE won, "R" RED won).  For example the opening
+        is "RNBA1ABNR/4K4/1C5C1/P1P1P1P1P/9/9/p1p1p1p1p/1c5c1/4k4/rnba1abnr b -", BLUE being on rows 7 to 10."""
+        placement = self.get_placement()
+        ranks = []
+        for n in range(ROWS - 1, -1, -1):
+            rank = ""
+            empty = 0
+            for x in range(COLUMNS):
+                code = placement[x * ROWS + n]
+                if code == ".":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += code
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        return "/".join(ranks) + " " + TURN_CODES[self._player_turn] + " " + STATE_CODES[self._game_state]
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Returns a new game set up from FEN-like text, as returned by to_fen.  The opening setup is skipped, so
+        this is much cheaper than making a game and editing it."""
+        fields = fen.split()
+        ranks = fields[0].split("/")
+        if len(ranks) != ROWS:
+            raise ValueError("A position must have " + str(ROWS) + " ranks: " + fen)
+        placement = ["."] * SQUARES
+        for index, rank in enumerate(ranks):
+            n = ROWS - 1 - index
+            x = 0
+            for code in rank:
+                if code.isdigit():
+                    x += int(code)
+                else:
+                    if x >= COLUMNS:
+                        raise ValueError("Rank " + str(n + 1) + " is too long: " + fen)
+                    placement[x * ROWS + n] = code
+                    x += 1
+            if x != COLUMNS:
+                raise ValueError("Rank " + str(n + 1) + " does not have " + str(COLUMNS) + " columns: " + fen)
+
+        # A missing turn or state field defaults to BLUE to move in an unfinished game, but an unknown one is an error.
+        if len(fields) > 3:
+            raise ValueError("Unexpected fields after the game state: " + fen)
+        turns = {code: player for player, code in TURN_CODES.items()}
+        states = {code: state for state, code in STATE_CODES.items()}
+        if len(fields) > 1 and fields[1] not in turns:
+            raise ValueError("Unknown side to move " + fields[1] + ": " + fen)
+        if len(fields) > 2 and fields[2] not in states:
+            raise ValueError("Unknown game state " + fields[2] + ": " + fen)
+        player_turn = turns[fields[1]] if len(fields) > 1 else "BLUE"
+        game_state = states[fields[2]] if len(fields) > 2 else "UNFINISHED"
+        game = cls.__new__(cls)
+        game.set_position("".join(placement), player_turn, game_state)
+        return game
+
+    def to_bytes(self):
+        """Returns the position as 46 bytes: a header byte holding the side to move (bit 0) and the game state
+        (bits 1-2, an index into BINARY_STATES), then one 4-bit piece code per square in flat square order."""
+        codes = [0] * SQUARES
+        for piece in self._pieces:
+            code = BINARY_PIECES.index(PIECE_CODES[piece.get_type()]) + 1
+            codes[to_square(piece.get_position())] = code if piece.get_player() == "BLUE" else code + 8
+        header = (1 if self._player_turn == "RED" else 0) | BINARY_STATES.index(self._game_state) << 1
+        return bytes([header]) + bytes(codes[square] << 4 | codes[square + 1] for square in range(0, SQUARES, 2))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Returns a new game set up from the binary format returned by to_bytes."""
+        if len(data) != 1 + SQUARES // 2:
+            raise ValueError("A binary position must be " + str(1 + SQUARES // 2) + " bytes")
+        if data[0] >> 1 >= len(BINARY_STATES):
+            raise ValueError("Unknown binary game state header " + str(data[0]))
+        placement = []
+        for byte in data[1:]:
+            for code in (byte >> 4, byte & 15):
+                if code == 0:
+                    placement.append(".")
+                elif code <= len(BINARY_PIECES):
+                    placement.append(BINARY_PIECES[code - 1])
+                elif 9 <= code < 9 + len(BINARY_PIECES):
+                    placement.append(BINARY_PIECES[code - 9].lower())
+                else:
+                    raise ValueError("Unknown binary piece code " + str(code))
+        game = cls.__new__(cls)
+        game.set_position("".join(placement), "RED" if data[0] & 1 else "BLUE", BINARY_STATES[data[0] >> 1])
+        return game
+
+    def __reduce__(self):
+        """Pickles and copies the game as its compact binary position, rather than its graph of Piece objects.
+        The move history is not kept."""
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    def get_legal_moves(self, player=None):
+        """Returns a list of the (start, end) flat square moves the player (default, the player to move) can make
+        without leaving their General in check.  Passing is not included."""
+        return list(self.generate_legal_moves(player))
+
+    def has_legal_move(self, player=None):
+        """Returns True if the player (default, the player to move) has at least one legal move, stopping at the
+        first one found."""
+        for move in self.generate_legal_moves(player):
+            return True
+        return False
+
+    def is_stalemate(self, player=None):
+        """Returns True if the player is not in check but has no legal moves.  The player can still pass, so this
+        does not end the game."""
+        if player is None:
+            player = self._player_turn
+        return not self.is_in_check(player) and not self.has_legal_move(player)
+
+    def generate_legal_moves(self, player=None):
+        """Yields the (start, end) flat square moves the player (default, the player to move) can make without
+        leaving their General in check.  The position must not be changed while iterating.
+
+        Rather than trying every move, checks and pins are worked out from the General's square.  A move can only
+        expose the General if it starts or ends on one of the squares whose occupancy matters to attacks on it (its
+        rays, which covers chariot lines and cannon screens, and horse and elephant legs).  All other moves are legal
+        unless the General is in check, when they are only legal if they capture a checking piece.  Moves of the
+        General itself, and moves touching those squares, are tested by trying them on the bare board array."""
+        if player is None:
+            player = self._player_turn
+        opponent = "RED" if player == "BLUE" else "BLUE"
+        general = self._generals[1] if player == "RED" else self._generals[0]
+        if general is None:
+            # Without a General, nothing can be pinned or checked.
+            for piece in self.get_pieces(player):
+                start = to_square(piece.get_position())
+                for end in piece.get_move_squares():
+                    yield start, end
+            return
+
+        general_square = to_square(general.get_position())
+        if self._board[general_square] is not general:
+            # A General that has been captured (after its player passed in check) is still checked for on its last
+            # square, as is_in_check does.  Nothing is known about that square, so every move is tried.
+            for piece in self.get_pieces(player):
+                start = to_square(piece.get_position())
+                for end in piece.get_move_squares():
+                    if not self.is_attacked_after(start, end, general_square, opponent):
+                        yield start, end
+            return
+
+        sensitive = GENERAL_SENSITIVE[general_square]
+        checkers = 0
+        if self.is_in_check(player):
+            for square in self.get_attackers(general_square, opponent):
+                checkers |= 1 << square
+
+        for piece in self.get_pieces(player):
+            start = to_square(piece.get_position())
+            start_sensitive = sensitive >> start & 1
+            for end in piece.get_move_squares():
+                if piece is general:
+                    if not self.is_attacked_after(start, end, end, opponent):
+                        yield start, end
+                elif start_sensitive or sensitive >> end & 1:
+                    if not self.is_attacked_after(start, end, general_square, opponent):
+                        yield start, end
+                elif not checkers or checkers == 1 << end:
+                    # Capturing the only checking piece, from off its lines, always resolves check.
+                    yield start, end
+
+    def is_attacked_after(self, start, end, square, player):
+        """Returns True if the square would be attacked by the player's pieces after the piece on start moves to
+        end.  The move is only made on the board array and occupancy, not the pieces or attack maps."""
+        board = self._board
+        occupied = self._occupied
+        piece = board[start]
+        captured = board[end]
+        mover = piece.get_player()
+        board[start] = None
+        board[end] = piece
+        occupied[mover] ^= 1 << start | 1 << end
+        if captured is not None:
+            occupied[captured.get_player()] ^= 1 << end
+        attacked = bool(self.get_attackers(square, player, True))
+        board[start] = piece
+        board[end] = captured
+        occupied[mover] ^= 1 << start | 1 << end
+        if captured is not None:
+            occupied[captured.get_player()] ^= 1 << end
+        return attacked
+
+    def get_attackers(self, square, player, first=False):
+        """Returns a list of the squares of the player's pieces that could move to the square, worked out backwards
+        from the square with the move tables and the board array rather than from the attack maps.
+
+        Parameters
+        ----------
+        square : int
+            The flat square attacked.
+        player : string
+            The attacking player.
+        first : bool
+            If True, stops at the first attacker found.
+        """
+        board = self._board
+        occupied = self._occupied["BLUE"] | self._occupied["RED"]
+        target = board[square]
+        if target is not None and target.get_player() == player:
+            return []
+        attackers = []
+        for sources, types in ((PALACE_SOURCES[square], ("General", "Guard")),
+                               (SOLDIER_SOURCES[player][square], ("Soldier",)),
+                               (HORSE_SOURCES[square], ("Horse",)),
+                               (ELEPHANT_SOURCES[square], ("Elephant",))):
+            for start, block in sources:
+                piece = board[start]
+                if piece is not None and not block & occupied and piece.get_player() == player and \
+                        piece.get_type() in types:
+                    attackers.append(start)
+                    if first:
+                        return attackers
+
+        for ray in RAYS[square]:
+            # A Chariot attacks if it is the first piece along the ray.  A Cannon attacks if exactly one of its
+            # own pieces is between it and the square; the other player's pieces do not count.
+            screens = 0
+            chariot_line = True
+            for start in ray:
+                piece = board[start]
+                if piece is None:
+                    continue
+                if piece.get_player() != player:
+                    chariot_line = False
+                    continue
+                if chariot_line and piece.get_type() == "Chariot" or screens == 1 and piece.get_type() == "Cannon":
+                    attackers.append(start)
+                    if first:
+                        return attackers
+                chariot_line = False
+                screens += 1
+                if screens == 2:
+                    break
+        return attackers
+
+    def move_to_text(self, move):
+        """Converts a (start, end) flat square move to text in the form "c7-c6"."""
+        return self.board_to_map([move[0] // ROWS, move[0] % ROWS]) + "-" + \
+            self.board_to_map([move[1] // ROWS, move[1] % ROWS])
+
+    def text_to_move(self, text):
+        """Converts text in the form "c7-c6" to a (start, end) flat square move."""
+        start, end = text.split("-")
+        return to_square(self.map_to_board(start)), to_square(self.map_to_board(end))
+
     def make_move(self, alphanum_start, alphanum_end):
         """Makes the specified move.  Returns True if move is successful. Returns False if invalid move, wrong player's
-        turn, or game over.
+        turn, or game over.  The move is committed, and cannot be undone with pop.
 
         Paramaters
         ----------
@@ -101,7 +897,7 @@ class JanggiGame:
             Coordinates for the specified piece to attempt to move to, as a list.
         """
         if alphanum_start == alphanum_end:
-            self.switch_turn()
+            self.commit(None)
             return True
 
         # Convert board spaces from alphanumeric to corresponding list indices.
@@ -119,14 +915,11 @@ class JanggiGame:
                 # noinspection PyUnresolvedReferences
                 if piece.get_player() == self._player_turn:
 
-                    # Ask the piece if the move is valid.
-                    piece.compile_valid_moves()
+                    # Ask the piece if the move is valid.  Its moves are kept current by update_attacks.
                     if piece.move(start, end):
 
                         if not self.move_in_check(start, end, piece):
-                            self.clear_space(start)
-                            self.assign_space(end, piece)
-                            piece.set_position(end)
+                            self.commit((to_square(start), to_square(end)))
                             self.end_turn()
                             return True
 
@@ -135,43 +928,28 @@ class JanggiGame:
 
     def move_in_check(self, start, end, piece):
         """Finds out of a player made a move in check that didn't break check, or moved into check."""
-        # Move the piece
-        previous = self.get_space(end)
-        self.clear_space(start)
-        self.assign_space(end, piece)
-        piece.set_position(end)
-
-        # Store whether move was free of check.
-        self.compile_all_moves()
-        valid = self.is_in_check(self._player_turn)
-
-        # Revert move
-        self.assign_space(start, piece)
-        piece.set_position(start)
-        self.assign_space(end, previous)
-        self.compile_all_moves()
+        player = piece.get_player()
+        general = self._generals[1] if player == "RED" else self._generals[0]
+        if general is None:
+            return False
 
-        return valid
+        # Try the move on the board array, and see if the mover's General (wherever it ends up) is attacked.
+        opponent = "RED" if player == "BLUE" else "BLUE"
+        start = to_square(start)
+        end = to_square(end)
+        return self.is_attacked_after(start, end, end if piece is general else to_square(general.get_position()),
+                                      opponent)
 
     def end_turn(self):
-        """Ends a players turn."""
-        self.switch_turn()
+        """Ends a players turn, once push has handed the move to the opponent.  Checks if the opponent is mated."""
         if self.is_in_check(self._player_turn):
             self.determine_checkmate(self._player_turn)
-        self.compile_all_moves()
 
     def determine_checkmate(self, player):
-        """Runs through every piece that belongs to the player in check.  If no move returns as valid, game
+        """Asks the legal move generator for a move of the player in check.  If there are none, game
         is over and opposing player wins."""
-
-        # Goes through every space, if we find one of the checked player's pieces, find simulate every move it can
-        # make.  If one of those moves breaks check, return False signalling no checkmate.  Otherwise, game over.
-        for column in self._board:
-            for piece in column:
-                if piece is not None and piece.get_player() == player:
-                    for move in piece.get_moves():
-                        if not self.move_in_check(piece.get_position(), move, piece):
-                            return False
+        if self.has_legal_move(player):
+            return False
         self._game_state = "RED_WON" if player == "BLUE" else "BLUE_WON"
         return True
 
@@ -181,46 +959,60 @@ class JanggiGame:
             self._player_turn = "BLUE"
         else:
             self._player_turn = "RED"
+        self._position_key ^= ZOBRIST_RED_TURN
+
+    def get_position_key(self):
+        """Returns the 64-bit Zobrist key of the position (piece placement and side to move).  For transposition
+        tables, repetition detection and caching."""
+        return self._position_key
+
+    def compute_position_key(self):
+        """Computes the Zobrist key of the position from scratch.  make_move, push, pop and switch_turn keep the
+        key current incrementally, so this is only needed after editing the board directly."""
+        key = ZOBRIST_RED_TURN if self._player_turn == "RED" else 0
+        for piece in self._pieces:
+            key ^= ZOBRIST_PIECES[(piece.get_player(), piece.get_type())][to_square(piece.get_position())]
+        return key
 
     def compile_all_moves(self):
-        """Compiles list of all moves each player can make."""
-        self._blue_moves = list()
-        self._red_moves = list()
-
-        # Go through every space, if a piece is there, ask it what it can do, then add what is returns
-        # to that player's potential moves.  For determining check/mate.
-        for column in self._board:
-            for piece in column:
-                if piece is not None:
-                    piece.compile_valid_moves()
-                    for move in piece.get_moves():
-                        if piece.get_player() == "BLUE":
-                            if move not in self._blue_moves:
-                                self._blue_moves.append(move)
-                        else:
-                            if move not in self._red_moves:
-                                self._red_moves.append(move)
+        """Rebuilds every piece's moves and both players' attack maps from scratch.  After setup, moves are kept
+        current incrementally by update_attacks."""
+        self._attacks = {"BLUE": dict(), "RED": dict()}
+        self._version += 1
+
+        # Go through every piece, ask it what it can do, then count what it returns in that player's attack map.
+        # For determining check/mate.
+        for piece in self._pieces:
+            piece.compile_valid_moves()
+            self.count_attacks(piece, 1)
 
     def get_all_moves(self, player=None):
-        """Returns the list of all moves a player's pieces can commit,
-        or if provided a player, that player's moves only."""
+        """Returns a MoveView of all moves a player's pieces can commit,
+        or if provided a player, that player's moves only.  Cached until the board next changes."""
+        if player is not None and player != "RED":
+            player = "BLUE"
+        cached = self._move_cache.get(player)
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
 
-        self.compile_all_moves()
         if player is None:
-            moves = self._blue_moves
-            for move in self._red_moves:
-                if move not in self._blue_moves:
-                    self._blue_moves.append(move)
-            return moves
+            moves = MoveView(self._attacks["BLUE"].keys() | self._attacks["RED"].keys())
         else:
-            if player == "RED":
-                return self._red_moves
-            else:
-                return self._blue_moves
+            moves = MoveView(self._attacks[player])
+        self._move_cache[player] = (self._version, moves)
+        return moves
 
     def get_piece_moves(self, space):
-        """Returns a list of a specific piece's moves.  For debugging."""
-        return [self.board_to_map(i) for i in self.get_space(self.map_to_board(space)).get_moves()]
+        """Returns a tuple of a specific piece's moves, in algebraic form.  For debugging.  Cached until the board
+        next changes."""
+        cached = self._move_cache.get(space)
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+
+        square = to_square(self.map_to_board(space))
+        moves = tuple(self.board_to_map([end // ROWS, end % ROWS]) for end in self._board[square].get_move_squares())
+        self._move_cache[space] = (self._version, moves)
+        return moves
 
     def is_in_check(self, player):
         """Requests the check status of the specified player's General."""
@@ -299,38 +1091,21 @@ class JanggiGame:
 
         piece_class(space, color, self)
 
-    def print_board(self):
-        """Prints the board to console."""
-        for n in range(len(self._board[0])-1, -1, -1):
-            if n+1 < 10:
-                line = str(n+1) + " "
-            else:
-                line = str(n + 1)
-            for x in range(0, len(self._board)):
+    def print_board(self, renderer=None):
+        """Prints the board to console, in a single write.
 
-                piece = self.get_space([x, n])
-                if piece is None:
-                    line += Color.empty + "   " + Color.endc
-                else:
-                    if piece.get_player() == "RED":
-                        line += Color.red_pieces + piece.get_marker() + Color.endc
-                    else:
-                        line += Color.blue_pieces + piece.get_marker() + Color.endc
-
-                if x < len(self._board)-1:
-                    line += Color.board + "--" + Color.endc
-            print(line)
-            if n > 0:
-                board_line = Color.board
-                if n < 3 or n > len(self._board[0])-3:
-                    if n == 2 or n == 9:
-                        board_line += r"   |    |    |    | \  |  / |    |    |    | "
-                    else:
-                        board_line += r"   |    |    |    | /  |  \ |    |    |    | "
-                else:
-                    board_line += "   |    |    |    |    |    |    |    |    | "
-                print(board_line + Color.endc)
-        print("   a    b    c    d    e    f    g    h    i")
+        Parameters
+        ----------
+        renderer : BoardRenderer
+            The renderer to draw with, e.g. one in diff mode for a live display.  A shared full mode renderer is
+            used if None.
+        """
+        global _default_renderer
+        if renderer is None:
+            if _default_renderer is None:
+                _default_renderer = BoardRenderer()
+            renderer = _default_renderer
+        renderer.draw(self)
 
 
 class Piece:
@@ -338,20 +1113,30 @@ class Piece:
     def __init__(self, space, player, game):
         """Initializes a board piece.  For extension into specific piece types."""
         self._game = game
-        self._game.assign_space(space, self)
         self._position = space
+        self._square = to_square(space)
         self._player = player
+        self._game.assign_space(space, self)
         self._marker = "X"
+        # Valid moves as flat squares, compiled from the subclass's per-square move table.
         self._moves = []
+        self._table = None
+        # How many spaces away (in any direction) a change on the board can affect this piece's moves.
+        self._reach = 1
         if self._player == "RED":
             self._opponent = "BLUE"
         else:
             self._opponent = "RED"
+        self._game.add_piece(self)
 
     def get_player(self):
         """Returns the player the piece belongs to."""
         return self._player
 
+    def get_type(self):
+        """Returns the name of the piece type, e.g. "Soldier"."""
+        return self._type
+
     def get_position(self):
         """Returns the pieces position in [x,n] format"""
         return self._position
@@ -359,35 +1144,54 @@ class Piece:
     def set_position(self, space):
         """Sets the piece's private coordinate tracker, a list in the form [x,n]"""
         self._position = space
+        self._square = to_square(space)
 
     def move(self, start, end):
         """Checks multiple conditions ("vacant spot, or pieces that can be captured, no blocking pieces, etc.).  If
         pass, moves piece to new position, and removes captured piece if applicable."""
         if start == end:
             return True
-        if end in self._moves:
+        if to_square(end) in self._moves:
 
             return True
         return False
 
     def get_moves(self):
-        """Returns the set of valid moves each piece can make, to check win conditions."""
+        """Returns the set of valid moves each piece can make, to check win conditions, as [x,n] coordinates."""
+        return [[square // ROWS, square % ROWS] for square in self._moves]
+
+    def get_move_squares(self):
+        """Returns the piece's valid moves as flat squares.  Not a copy."""
         return self._moves
 
+    def set_moves(self, moves):
+        """Sets the piece's list of valid moves, as flat squares.  For restoring moves compiled before a move was
+        undone."""
+        self._moves = moves
+
+    def watches(self, space):
+        """Returns True if a change to the given [x,n] space could change this piece's valid moves."""
+        return abs(space[0] - self._position[0]) <= self._reach and abs(space[1] - self._position[1]) <= self._reach
+
     def compile_valid_moves(self):
         """Compiles a list of valid moves.  The JanggiGame class will retrieve this from each piece to check
-        which players can move where, and for Generals, to determine check and game over conditions."""
-        self._moves = list()
-        for move in self.potential_moves():
-            if self.check_on_board(move):
-                if self.check_move_path(self._position, move):
-                    piece = self._game.get_space(move)
-                    if piece is None or piece is not None and self._player != piece.get_player():
-                        self._moves.append(move)
+        which players can move where, and for Generals, to determine check and game over conditions.
+
+        Candidate moves come from the subclass's precomputed table for the piece's square, so this only tests
+        each candidate's blocking mask and end square."""
+        board = self._game.get_board()
+        occupied = self._game.get_occupied()
+        moves = []
+        for end, block in self._table[self._square]:
+            if not block & occupied:
+                piece = board[end]
+                if piece is None or piece.get_player() != self._player:
+                    moves.append(end)
+        self._moves = moves
 
     def potential_moves(self):
-        """Returns a list of theoretical moves ignoring board position and other pieces.  Implemented in subclass"""
-        pass
+        """Returns a list of theoretical moves ignoring other pieces, from the subclass's move table."""
+        return [[end // ROWS, end % ROWS] for end, block in self._table[self._square]]
 
     def check_on_board(self, space):
         """Returns true if the space is within the borders of the game board.
@@ -424,17 +1228,8 @@ class Soldier(Piece):
         super(Soldier, self).__init__(space, player, game)
         self._type = "Soldier"
         self._marker = " S "
-
-    def potential_moves(self):
-        """Compiles a list of valid moves for the Soldier class."""
-        moves = list()
-
-        # Any adjacent square is added, with restrictions added in check_move_path below and move_in_palace
-        # in game class.
-        for x in range(3):
-            for n in range(3):
-                moves.append([self._position[0]+x-1, self._position[1]+n-1])
-        return moves
+        # Any adjacent square forward or sideways, or diagonally forward along palace lines.
+        self._table = SOLDIER_MOVES[self._player]
 
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Soldiers' move restrictions.
@@ -483,18 +1278,9 @@ class General(Piece):
         super(General, self).__init__(space, player, game)
         self._type = "General"
         self._marker = " G "
+        self._table = PALACE_MOVES
         self._game.set_general(self, self._player)
 
-    def potential_moves(self):
-        moves = list()
-
-        # Returns all adjacent spaces.  Restrictions are handled by the check_move_path function below and
-        # get_move_in_palace of game class.
-        for x in range(3):
-            for n in range(3):
-                moves.append([self._position[0] + x - 1, self._position[1] + n - 1])
-        return moves
-
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Generals' move restrictions.
 
@@ -511,10 +1297,8 @@ class General(Piece):
         return False
 
     def in_check(self):
-        """Asks the game class if the Guard's position is in the opponent's list of valid moves.  If so, check."""
-        if self._position in self._game.get_all_moves(self._opponent):
-            return True
-        return False
+        """Asks the game class if the General's position is in the opponent's attack map.  If so, check."""
+        return self._game.is_attacked(self._position, self._opponent)
 
 
 class Guard(Piece):
@@ -537,16 +1321,7 @@ class Guard(Piece):
         super(Guard, self).__init__(space, player, game)
         self._type = "Guard"
         self._marker = "GRD"
-
-    def potential_moves(self):
-        """Adds all potential moves for the Guard class."""
-
-        # Every adjacent square is added as a potential move.
-        moves = list()
-        for x in range(3):
-            for n in range(3):
-                moves.append([self._position[0] + x - 1, self._position[1] + n - 1])
-        return moves
+        self._table = PALACE_MOVES
 
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Generals' move restrictions.
@@ -585,22 +1360,8 @@ class Horse(Piece):
         super(Horse, self).__init__(space, player, game)
         self._type = "Horse"
         self._marker = " H "
-
-    def potential_moves(self):
-        """Compiles a list of potential move spots for the Horse.  Disregards board position and move validity."""
-        moves = list()
-
-        # Horse moves orthogonally once and diagonally once, either 2 up/down 1 over or 2 over and 1 up/down.
-        # Loop through, adding each 2/3 or 3/2 combo, both positive and negative.
-        for x in range(-2, 3):
-            if x == 0:
-                continue
-            for n in range(-2, 3):
-                if n == 0:
-                    continue
-                if abs(x) != abs(n):
-                    moves.append([self._position[0] + x, self._position[1] + n])
-        return moves
+        self._table = HORSE_MOVES
+        self._reach = 2
 
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Generals' move restrictions.
@@ -614,16 +1375,8 @@ class Horse(Piece):
         """
         # Checks the orthogonal portion of the move.  Diagonal movement cannot be "blocked" except at end space,
         # which is already checked in the general move function.
-
-        # If x movement is greater than n movement, check x direction orthogonal
-        if abs(start[0] - end[0]) > abs(start[1] - end[1]):
-            if self._game.get_space([start[0] + (1 if start[0] < end[0] else -1), start[1]]) is not None:
-                return False
-        # If n movement is greater, check n orthogonal
-        else:
-            if self._game.get_space([start[0], start[1] + (1 if start[1] < end[1] else -1)]) is not None:
-                return False
-        return True
+        block = HORSE_BLOCKS[(start[0] * ROWS + start[1]) * SQUARES + end[0] * ROWS + end[1]]
+        return not block & self._game.get_occupied()
 
 
 class Cannon(Piece):
@@ -648,18 +1401,30 @@ class Cannon(Piece):
         self._type = "Cannon"
         self._marker = " C "
 
+    def watches(self, space):
+        """Any space on the same column or row can block or screen the Cannon."""
+        return space[0] == self._position[0] or space[1] == self._position[1]
+
     def potential_moves(self):
-        """Compiles a list of valid moves.  The JanggiGame class will retrieve this from each piece to check
-        which players can move where, and for the Generals, to determine check and game over conditions."""
-        moves = []
+        """Returns every space on the Cannon's column and row, from its precomputed rays."""
+        return [[end // ROWS, end % ROWS] for ray in RAYS[self._square] for end in ray]
 
-        # Potential cannon moves in any orthogonal line, so as long as x or n coordinates match, its a potential
-        # move spot.
-        for x in range(0, 10):
-            for n in range(0, 11):
-                if x == self._position[0] or n == self._position[1]:
-                    moves.append([x, n])
-        return moves
+    def compile_valid_moves(self):
+        """Compiles the Cannon's valid moves by walking its precomputed rays.  Spaces past exactly one ally
+        "screen" can be moved to, up to the second ally.  Opposing pieces in between are ignored."""
+        board = self._game.get_board()
+        moves = []
+        for ray in RAYS[self._square]:
+            allies = 0
+            for end in ray:
+                piece = board[end]
+                if piece is not None and piece.get_player() == self._player:
+                    allies += 1
+                    if allies == 2:
+                        break
+                elif allies == 1:
+                    moves.append(end)
+        self._moves = moves
 
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Cannons' move restrictions.  End spot validity is checked in general
@@ -672,39 +1437,12 @@ class Cannon(Piece):
         end : list
             The space the piece is moving to, in the form [x,n], for [alphabetic column, numeric row]
         """
-        # Cannon must have one ally "screen" between move spaces.
-        ally = False
-        x = start[0]
-        n = start[1]
-
-        # Loop through in between spaces, checking for MAX one ally and no other pieces blocking.
-        while x != end[0] or n != end[1]:
-            piece = self._game.get_space([x, n])
-
-            # If we find a piece between self and end space, check if its ally.  If so, check if we've already
-            # found an ally.  If so, return False.  If not, mark we have an ally. (Cannon move will fail if there is
-            # not a ONE ally screen between start and end spots)
-            if piece is not None:
-                if piece is not self and piece.get_player() == self._player:
-                    if ally is False:
-                        ally = True
-                    else:
-                        return False
-
-            # Increment towards end space and repeat loop
-            if n > end[1]:
-                n = n - 1
-            elif n < end[1]:
-                n = n + 1
-            if x > end[0]:
-                x = x - 1
-            elif x < end[0]:
-                x = x + 1
-
-        # If we reach the end space and there wasn't an ally screen, return False.
-        if ally is False:
-            return False
-        return True
+        # Cannon must have exactly ONE ally "screen" between move spaces.  Opposing pieces in between are ignored.
+        allies = BETWEEN[(start[0] * ROWS + start[1]) * SQUARES + end[0] * ROWS + end[1]] & \
+            self._game.get_occupied(self._player)
+
+        # Clearing the lowest set bit leaves nothing only if there was a single ally.
+        return allies != 0 and allies & (allies - 1) == 0
 
 
 class Chariot(Piece):
@@ -728,17 +1466,29 @@ class Chariot(Piece):
         self._type = "Chariot"
         self._marker = "CHT"
 
+    def watches(self, space):
+        """Any space on the same column or row can block or screen the Chariot."""
+        return space[0] == self._position[0] or space[1] == self._position[1]
+
     def potential_moves(self):
-        """Compiles a list of valid moves.  The JanggiGame class will retrieve this from each piece to check
-        which players can move where, and for the Generals, to determine check and game over conditions."""
-        moves = []
+        """Returns every space on the Chariot's column and row, from its precomputed rays."""
+        return [[end // ROWS, end % ROWS] for ray in RAYS[self._square] for end in ray]
 
-        # Chariot can move to any space orthogonally, so if x or n value matches, add to potential moves.
-        for x in range(0, 10):
-            for n in range(0, 11):
-                if x == self._position[0] or n == self._position[1]:
-                    moves.append([x, n])
-        return moves
+    def compile_valid_moves(self):
+        """Compiles the Chariot's valid moves by walking its precomputed rays up to the first piece, which can be
+        captured if it is an opponent's."""
+        board = self._game.get_board()
+        moves = []
+        for ray in RAYS[self._square]:
+            for end in ray:
+                piece = board[end]
+                if piece is None:
+                    moves.append(end)
+                else:
+                    if piece.get_player() != self._player:
+                        moves.append(end)
+                    break
+        self._moves = moves
 
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Chariots' move restrictions.
@@ -751,28 +1501,9 @@ class Chariot(Piece):
             The space the piece is moving to, in the form [x,n], for [alphabetic column, numeric row]
         """
 
-        # Loop through from start to second-to-end space.
-        x = start[0]
-        n = start[1]
-        while x != end[0] or n != end[1]:
-
-            # Simple check for chariot, if any space is blocked by a piece that isn't the end space, return False.
-            piece = self._game.get_space([x, n])
-            if piece is not None:
-                if piece is not self:
-                    return False
-
-            # Increment x or n towards end space
-            if n > end[1]:
-                n = n - 1
-            elif n < end[1]:
-                n = n + 1
-            if x > end[0]:
-                x = x - 1
-            elif x < end[0]:
-                x = x + 1
-
-        return True
+        # Simple check for chariot, if any space between start and end is blocked by a piece, return False.
+        return not BETWEEN[(start[0] * ROWS + start[1]) * SQUARES + end[0] * ROWS + end[1]] & \
+            self._game.get_occupied()
 
 
 class Elephant(Piece):
@@ -795,22 +1526,8 @@ class Elephant(Piece):
         super(Elephant, self).__init__(space, player, game)
         self._type = "Elephant"
         self._marker = " E "
-
-    def potential_moves(self):
-        """Returns potential moves for the Elephant.  Does not screen invalid moves."""
-        moves = list()
-
-        #  Elephant can similar to horse, with one orthogonal move but two diagonal.  This means each combo of
-        # 3,2 or 2,3, both positive and negative, is a potential spot.
-        for x in range(-3, 4):
-            if x == 0:
-                continue
-            for n in range(-3, 4):
-                if n == 0:
-                    continue
-                if abs(x) == 3 and abs(n) == 2 or abs(n) == 3 and abs(x) == 2:
-                    moves.append([self._position[0] + x, self._position[1] + n])
-        return moves
+        self._table = ELEPHANT_MOVES
+        self._reach = 3
 
     def check_move_path(self, start, end):
         """Checks the validity of a move given the Elephants' move restrictions.
@@ -823,18 +1540,10 @@ class Elephant(Piece):
             The space the piece is moving to, in the form [x,n], for [alphabetic column, numeric row]
         """
 
-        # Check orthogonal moves the same as horse.
-        if abs(start[0] - end[0]) > abs(start[1] - end[1]):
-            orthogonal = [start[0] + (1 if start[0] < end[0] else -1), start[1]]
-        else:
-            orthogonal = [start[0], start[1] + (1 if start[1] < end[1] else -1)]
-
-        # Now check diagonal, which is a matter of selecting the diagonal one step both ways in the direction
-        # from start to end.
-        diagonal = [orthogonal[0] + (1 if start[0] < end[0] else -1),
-                    orthogonal[1] + (1 if start[1] < end[1] else -1)]
+        # The orthogonal step and the first diagonal step are both looked up in one mask.
+        block = ELEPHANT_BLOCKS[(start[0] * ROWS + start[1]) * SQUARES + end[0] * ROWS + end[1]]
+        return not block & self._game.get_occupied()
 
-        if self._game.get_space(orthogonal) is not None or self._game.get_space(diagonal) is not None:
-            return False
 
-        return True
+# The piece class for each letter of PIECE_CODES.
+PIECE_CLASSES = {"P": Soldier, "C": Cannon, "A": Guard, "K": General, "B": Elephant, "N": Horse, "R": Chariot}
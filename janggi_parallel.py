@@ -0,0 +1,176 @@
+# Author: Sean Tyler
+# Description:  Parallel root search for JanggiGame analysis.  Root moves are spread across a pool of worker
+#               processes, each with its own engine and transposition table.  Positions are sent to workers in
+#               the 46 byte binary format of JanggiGame.to_bytes rather than as pickled Piece objects.
+
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from janggi_engine import Searcher
+from janggi_game import JanggiGame
+from search import INFINITY, MATE_SCORE, MAX_PLY, SearchResult, SearchTimeout
+from transposition import TranspositionTable
+
+# Per process state of a worker: its transposition table, kept between tasks so later iterations reuse it, and the
+# id of the root search it last worked on, so the table is aged once per search like the serial Searcher's.
+_worker_table = None
+_worker_search = None
+
+
+def _init_worker(hash_mb):
+    """Sets up a worker process with its own transposition table."""
+    global _worker_table
+    _worker_table = TranspositionTable(hash_mb)
+
+
+def _search_root_move(search_id, state, move, depth, alpha, deadline):
+    """Runs in a worker: rebuilds the position from its binary state and searches one root move until the deadline,
+    a time.time() value or None.  The deadline is absolute so that a move left waiting in the pool only gets the
+    time that is left when it starts.  The first task of a new search id ages the worker's table with new_search.
+    Returns a tuple of (move, score, principal variation, nodes), with a score of None if the time ran out."""
+    global _worker_search
+    if search_id != _worker_search:
+        _worker_table.new_search()
+        _worker_search = search_id
+    time_limit = None if deadline is None else deadline - time.time()
+    if time_limit is not None and time_limit <= 0:
+        return move, None, [], 0
+    game = JanggiGame.from_bytes(state)
+    searcher = Searcher(game, _worker_table)
+    try:
+        score, pv, nodes = searcher.search_move(move, depth, alpha, INFINITY, time_limit)
+    except SearchTimeout:
+        return move, None, [], 0
+    return move, score, pv, nodes
+
+
+class ParallelSearcher:
+    """An iterative deepening root-splitting searcher.  At each depth the best move so far is searched first to set
+    the alpha bound, then the remaining root moves are searched in parallel against it.  The remaining moves are
+    all submitted at once with that bound, so a better score found by one of them does not tighten the bound of
+    the others.
+
+    Parameters
+    ----------
+    workers : int
+        The number of worker processes.  Defaults to the number of CPUs.
+    hash_mb : float
+        The transposition table size of each worker, in MB.
+    """
+
+    def __init__(self, workers=None, hash_mb=16):
+        """Initializes the ParallelSearcher class."""
+        self._workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(self._workers, initializer=_init_worker, initargs=(hash_mb,))
+        # The number of searches started, sent with each task as its search id.
+        self._searches = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shuts down the worker processes."""
+        self._pool.shutdown()
+
+    def search(self, game, max_depth=None, time_limit=None):
+        """Searches the game's position and returns a SearchResult for the deepest completed depth.  With no limits,
+        searches to depth 4.  The game itself is not changed.
+
+        Parameters
+        ----------
+        game : JanggiGame
+            The game whose position is searched.
+        max_depth : int
+            The deepest depth to search, in plies.
+        time_limit : float
+            The time budget, in seconds.
+        """
+        if max_depth is None:
+            max_depth = 4 if time_limit is None else MAX_PLY
+        # A wall clock deadline, as the workers are other processes.
+        deadline = None if time_limit is None else time.time() + time_limit
+        self._searches += 1
+        search_id = self._searches
+        state = game.to_bytes()
+        root_moves = game.get_legal_moves()
+        result = SearchResult(None, 0, 0, 0, [])
+        if not root_moves:
+            return result
+
+        nodes = 0
+        for depth in range(1, max_depth + 1):
+            if deadline is not None and time.time() >= deadline:
+                break
+
+            # Search the best move so far on its own first, so the others get a useful alpha bound.
+            first = self._pool.submit(_search_root_move, search_id, state, root_moves[0], depth, -INFINITY, deadline)
+            move, best_score, best_pv, first_nodes = first.result()
+            if best_score is None:
+                break
+            nodes += first_nodes
+            scores = {move: best_score}
+
+            pending = {self._pool.submit(_search_root_move, search_id, state, other, depth, best_score, deadline)
+                       for other in root_moves[1:]}
+            timed_out = False
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    move, score, pv, move_nodes = future.result()
+                    if score is None:
+                        timed_out = True
+                        continue
+                    nodes += move_nodes
+                    scores[move] = score
+                    if score > best_score:
+                        best_score, best_pv = score, pv
+            if timed_out:
+                break
+
+            result = SearchResult(best_pv[0], best_score, depth, nodes, best_pv)
+            if abs(best_score) >= MATE_SCORE - MAX_PLY:
+                break
+
+            # Order the next iteration by this iteration's scores.  Moves that failed low keep their bound.
+            root_moves.sort(key=lambda root_move: scores.get(root_move, -INFINITY), reverse=True)
+            root_moves.remove(best_pv[0])
+            root_moves.insert(0, best_pv[0])
+        return result
+
+
+def main():
+    """Command line entry point.  Plays the given moves from the opening and prints the parallel analysis."""
+    parser = argparse.ArgumentParser(description="Search a Janggi position across several processes.")
+    parser.add_argument("moves", nargs="*", help='moves to play from the opening first, e.g. "c7-c6"')
+    parser.add_argument("--depth", type=int, help="deepest depth to search")
+    parser.add_argument("--time", type=float, help="time budget in seconds")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default, one per CPU)")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table MB per worker (default 16)")
+    args = parser.parse_args()
+
+    game = JanggiGame()
+    for text in args.moves:
+        start, end = text.split("-")
+        if not game.make_move(start, end):
+            raise SystemExit("Illegal move: " + text)
+
+    with ParallelSearcher(args.workers, args.hash) as searcher:
+        start_time = time.perf_counter()
+        result = searcher.search(game, args.depth, args.time)
+        elapsed = time.perf_counter() - start_time
+    if result.get_best_move() is None:
+        print("No legal moves.")
+        return
+    print("best move %s  score %d  depth %d  nodes %d  %.2f s  %.0f nodes/s"
+          % (game.move_to_text(result.get_best_move()), result.get_score(), result.get_depth(), result.get_nodes(),
+             elapsed, result.get_nodes() / elapsed))
+    print("pv " + " ".join(game.move_to_text(move) for move in result.get_pv()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Author: Sean Tyler
+# Description:  Perft (performance test) driver for JanggiGame move generation.  Counts the leaf nodes of the legal
+#               move tree to a given depth, for regression testing move generation against known counts (--verify)
+#               and measuring its speed.
+
+import argparse
+import time
+
+from janggi_game import JanggiGame
+
+# Stored test positions, as FEN-like text (see JanggiGame.to_fen).
+POSITIONS = {
+    "opening": "RNBA1ABNR/4K4/1C5C1/P1P1P1P1P/9/9/p1p1p1p1p/1c5c1/4k4/rnba1abnr b -",
+    "soldiers advanced": "RNBA1ABNR/4K4/1C5C1/P7P/2P1P1P2/2p1p1p2/p7p/1c5c1/4k4/rnba1abnr b -",
+    "chariots open": "1NBA1ABN1/4K4/1C5C1/1PP1P1PP1/R7R/r7r/1pp1p1pp1/1c5c1/4k4/1nba1abn1 b -",
+    "cannons out": "RNBA1ABNR/4K4/7C1/PP2P2PP/1C7/1c7/pp2p2pp/7c1/4k4/rnba1abnr b -",
+    "red in check": "1NBA1ABNR/5K3/1C5C1/1PP1P1P1P/9/5R3/p1p1p1p1p/2n3cc1/5k3/r1ba1abnr r -",
+    "cannon mate": "RNBA1AB1R/4K4/1C2C1N2/P1P1P1P1P/9/9/p1p1p1p1p/1c5c1/9/rnbakabnr r B",
+}
+
+# Known leaf node counts of each stored position, at depths 1, 2, 3 and 4.  The first two depths of the opening were
+# checked against the original trial-move generator.
+PERFT_COUNTS = {
+    "opening": (33, 1089, 37063, 1263736),
+    "soldiers advanced": (35, 1216, 43754, 1568914),
+    "chariots open": (63, 3961, 228767, 13130950),
+    "cannons out": (34, 1140, 39156, 1342619),
+    "red in check": (6, 280, 10760, 481300),
+    "cannon mate": (0, 0, 0, 0),
+}
+
+
+def perft(game, depth):
+    """Returns the number of leaf nodes of the legal move tree of the game's current position, to the given depth.
+    Passing is not counted as a move, and the position is left unchanged.
+
+    Parameters
+    ----------
+    game : JanggiGame
+        The game whose position is searched.
+    depth : int
+        The number of plies to search.
+    """
+    if depth == 0:
+        return 1
+    moves = game.get_legal_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        game.push(move)
+        nodes += perft(game, depth - 1)
+        game.pop()
+    return nodes
+
+
+def divide(game, depth):
+    """Returns a dict of the perft node count below each root move, keyed by the move as text ("c7-c6").  For
+    tracking down which root move a move generation bug is under."""
+    counts = dict()
+    for move in game.get_legal_moves():
+        game.push(move)
+        counts[game.move_to_text(move)] = perft(game, depth - 1)
+        game.pop()
+    return counts
+
+
+def load_position(name):
+    """Returns a new JanggiGame set up at the named stored position."""
+    return JanggiGame.from_fen(POSITIONS[name])
+
+
+def run(name, depth, split=False):
+    """Runs perft on a stored position, printing the node count and nodes per second.  Returns the node count."""
+    game = load_position(name)
+    start_time = time.perf_counter()
+    if split:
+        counts = divide(game, depth)
+        for move in sorted(counts):
+            print("  " + move + ": " + str(counts[move]))
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(game, depth)
+    elapsed = time.perf_counter() - start_time
+    rate = nodes / elapsed if elapsed > 0 else 0.0
+    print("%-20s depth %d  nodes %10d  %8.3f s  %10.0f nodes/s" % (name, depth, nodes, elapsed, rate))
+    return nodes
+
+
+def verify(name, depth):
+    """Checks the perft node counts of a stored position at every depth from 1 to the given depth (at most the
+    deepest known count) against PERFT_COUNTS, printing each result.  Returns True if they all match."""
+    game = load_position(name)
+    passed = True
+    for ply in range(1, min(depth, len(PERFT_COUNTS[name])) + 1):
+        nodes = perft(game, ply)
+        expected = PERFT_COUNTS[name][ply - 1]
+        print("%-20s depth %d  nodes %10d  expected %10d  %s" % (name, ply, nodes, expected,
+                                                                  "ok" if nodes == expected else "FAILED"))
+        passed = passed and nodes == expected
+    return passed
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Count Janggi legal move trees to a given depth.")
+    parser.add_argument("--depth", type=int, default=2, help="number of plies to search (default 2)")
+    parser.add_argument("--position", choices=sorted(POSITIONS), action="append",
+                        help="stored position to search, may be repeated (default all)")
+    parser.add_argument("--divide", action="store_true", help="split the node counts by root move")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the node counts at each depth up to --depth against the known counts, and exit "
+                             "with status 1 on any mismatch")
+    args = parser.parse_args()
+
+    if args.verify:
+        results = [verify(name, args.depth) for name in args.position or sorted(POSITIONS)]
+        if not all(results):
+            parser.exit(1, "perft node counts do not match\n")
+        return
+    for name in args.position or sorted(POSITIONS):
+        run(name, args.depth, args.divide)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Author: Sean Tyler
+# Description:  Batch replay and validation of recorded Janggi games.  Game files are read lazily, each game is
+#               replayed through JanggiGame.make_move across a pool of worker processes, and one JSON line is
+#               written per game with its first illegal move (if any) and its final state.
+#
+#               A game file holds one game per line, as moves separated by spaces, each move written as start and
+#               end squares joined by "-" (e.g. "c7-c6 c4-c5").  A move with the same start and end is a pass.  A
+#               line may begin with a game id followed by a tab.  Blank lines and lines starting with "#" are
+#               skipped.
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from janggi_game import JanggiGame
+
+# A board square in algebraic form, columns a to i and rows 1 to 10.
+SQUARE_PATTERN = re.compile(r"^[a-i]([1-9]|10)$")
+
+
+def read_games(paths):
+    """Yields (game id, list of move texts) for every game in the given files, one line at a time.  Games without
+    an id are named "file:line".  A path of "-" reads standard input."""
+    for path in paths:
+        file = sys.stdin if path == "-" else open(path)
+        try:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "\t" in line:
+                    game_id, line = line.split("\t", 1)
+                else:
+                    game_id = path + ":" + str(line_number)
+                yield game_id, line.split()
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+
+def replay_game(game_id, moves):
+    """Replays a game's moves from the opening, stopping at the first illegal one.  Returns a dict of the game id,
+    the number of moves played, whether every move was legal, the first illegal move and its index (or None), and
+    the final game state and position as FEN-like text."""
+    game = JanggiGame()
+    illegal_move = None
+    illegal_index = None
+    for index, text in enumerate(moves):
+        # Badly formed moves, such as squares off the board, are illegal too.
+        squares = text.split("-")
+        legal = len(squares) == 2 and all(SQUARE_PATTERN.match(square) for square in squares)
+        if not legal or not game.make_move(squares[0], squares[1]):
+            illegal_move = text
+            illegal_index = index
+            break
+
+    return {"game": game_id,
+            "moves": len(moves) if illegal_index is None else illegal_index,
+            "valid": illegal_index is None,
+            "illegal_move": illegal_move,
+            "illegal_index": illegal_index,
+            "state": game.get_game_state(),
+            "fen": game.to_fen()}
+
+
+def replay_chunk(chunk):
+    """Replays a list of (game id, moves) in a worker process, returning the list of result dicts."""
+    return [replay_game(game_id, moves) for game_id, moves in chunk]
+
+
+def replay_corpus(games, workers=None, chunk_size=64):
+    """Replays games across a process pool, yielding result dicts in input order.  Only a bounded number of chunks
+    is in flight at once, so memory stays flat however many games there are.
+
+    Parameters
+    ----------
+    games : iterable
+        The (game id, moves) pairs to replay, e.g. from read_games.
+    workers : int
+        The number of worker processes.  Defaults to the number of CPUs.
+    chunk_size : int
+        The number of games sent to a worker at a time.
+    """
+    workers = workers or os.cpu_count() or 1
+    games = iter(games)
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = deque()
+        while True:
+            # Keep a few chunks queued per worker, then hand back the oldest chunk's results.
+            while len(in_flight) < 2 * workers:
+                chunk = list(itertools.islice(games, chunk_size))
+                if not chunk:
+                    break
+                in_flight.append(pool.submit(replay_chunk, chunk))
+            if not in_flight:
+                return
+            for result in in_flight.popleft().result():
+                yield result
+
+
+def main():
+    """Command line entry point.  Writes one JSON line per game and prints a summary to standard error."""
+    parser = argparse.ArgumentParser(description="Replay and validate recorded Janggi games.")
+    parser.add_argument("paths", nargs="+", help='game files to replay, or "-" for standard input')
+    parser.add_argument("-o", "--output", help="JSON lines file to write (default standard output)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default, one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="games per worker task (default 64)")
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output is None else open(args.output, "w")
+    total = 0
+    invalid = 0
+    try:
+        for result in replay_corpus(read_games(args.paths), args.workers, args.chunk_size):
+            output.write(json.dumps(result) + "\n")
+            total += 1
+            invalid += not result["valid"]
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print("%d games replayed, %d with an illegal move" % (total, invalid), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
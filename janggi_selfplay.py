@@ -0,0 +1,302 @@
+# Author: Sean Tyler
+# Description:  Self-play data generation for JanggiGame.  Games are played against themselves across a pool of
+#               worker processes, with a random or engine-guided policy, and every position reached is written to a
+#               directory of NumPy .npy columns that can be loaded memory-mapped for training.
+#
+#               Each position row holds the board (one piece code per square, as in JanggiGame.to_bytes: 0 for
+#               empty, 1-7 BLUE, 9-15 RED), the side to move, the number of legal moves, the move played, the ply and
+#               game index, and the game's result.  Per game columns hold each game's seed, length and result.
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from janggi_engine import Searcher
+from janggi_game import JanggiGame, SQUARES
+from transposition import TranspositionTable
+
+# Position columns and their dtypes.  The board column is SQUARES wide (see POSITION_SHAPES), the rest are one value
+# per position.
+POSITION_COLUMNS = {"board": np.uint8, "turn": np.uint8, "legal_moves": np.uint16, "move": np.int16,
+                    "ply": np.uint16, "game": np.uint32, "result": np.int8}
+
+# Row shapes of the columns that hold more than one value per row.  The rest hold one value, with shape ().
+POSITION_SHAPES = {"board": (SQUARES,)}
+
+# Per game columns and their dtypes.
+GAME_COLUMNS = {"game_seed": np.int64, "game_length": np.uint16, "game_result": np.int8}
+
+# Game results, from BLUE's point of view.  Games stopped at the ply limit, or by both players passing, are draws.
+RESULTS = {"BLUE_WON": 1, "RED_WON": -1, "UNFINISHED": 0}
+
+POLICIES = ("random", "engine")
+
+# Per process state of a worker: its transposition table for the engine policy, kept between games.
+_worker_table = None
+
+
+def _init_worker(hash_mb):
+    """Sets up a worker process with its own transposition table."""
+    global _worker_table
+    _worker_table = TranspositionTable(hash_mb)
+
+
+def play_game(seed, policy="random", max_plies=200, depth=2, epsilon=0.1, table=None):
+    """Plays one game of self-play from the opening and returns its columns as a dict of NumPy arrays, with one row
+    per position reached before each move.  A player with no legal moves passes, and the game is a draw if both
+    pass in a row or it reaches the ply limit.
+
+    Parameters
+    ----------
+    seed : int
+        The seed of the game's random choices, so each game can be replayed exactly.
+    policy : string
+        "random" to pick uniformly from the legal moves, or "engine" to play the engine's best move.
+    max_plies : int
+        The number of plies after which the game is stopped as a draw.
+    depth : int
+        The engine's search depth, for the engine policy.
+    epsilon : float
+        The chance of the engine policy playing a random move instead, so that games differ.
+    table : TranspositionTable
+        The engine's transposition table, for the engine policy.  A small one is made if None.
+    """
+    rng = random.Random(seed)
+    game = JanggiGame()
+    searcher = None
+    if policy == "engine":
+        searcher = Searcher(game, TranspositionTable(1) if table is None else table)
+
+    states = []
+    counts = []
+    moves = []
+    passes = 0
+    while game.get_game_state() == "UNFINISHED" and len(states) < max_plies:
+        legal_moves = game.get_legal_moves()
+        states.append(game.to_bytes())
+        counts.append(len(legal_moves))
+        if not legal_moves:
+            move = None
+        elif searcher is None or rng.random() < epsilon:
+            move = rng.choice(legal_moves)
+        else:
+            move = searcher.search(max_depth=depth).get_best_move()
+
+        moves.append(-1 if move is None else move[0] * SQUARES + move[1])
+        game.push(move)
+        if move is None:
+            passes += 1
+            if passes == 2:
+                break
+        else:
+            passes = 0
+            game.end_turn()
+
+    # Unpack each position's 4-bit piece codes into one byte per square, all at once.
+    length = len(states)
+    packed = np.frombuffer(b"".join(states), dtype=np.uint8).reshape(length, 1 + SQUARES // 2)
+    board = np.empty((length, SQUARES), dtype=np.uint8)
+    board[:, 0::2] = packed[:, 1:] >> 4
+    board[:, 1::2] = packed[:, 1:] & 15
+
+    result = RESULTS[game.get_game_state()]
+    return {"board": board,
+            "turn": packed[:, 0] & 1,
+            "legal_moves": np.array(counts, dtype=np.uint16),
+            "move": np.array(moves, dtype=np.int16),
+            "ply": np.arange(length, dtype=np.uint16),
+            "game": np.zeros(length, dtype=np.uint32),
+            "result": np.full(length, result, dtype=np.int8),
+            "game_seed": np.array([seed], dtype=np.int64),
+            "game_length": np.array([length], dtype=np.uint16),
+            "game_result": np.array([result], dtype=np.int8)}
+
+
+def play_chunk(seeds, policy, max_plies, depth, epsilon):
+    """Plays a list of games in a worker process, returning their columns joined into one dict of arrays.  Game
+    indexes in the "game" column are relative to the chunk."""
+    games = [play_game(seed, policy, max_plies, depth, epsilon, _worker_table) for seed in seeds]
+    for index, columns in enumerate(games):
+        columns["game"][:] = index
+    return {name: np.concatenate([columns[name] for columns in games]) for name in games[0]}
+
+
+class ColumnWriter:
+    """Writes columns of rows to .npy files in a directory as they arrive, without holding them in memory.  Rows
+    are appended to raw files, and each is turned into an .npy file of the final length when the writer is closed.
+
+    Parameters
+    ----------
+    directory : string
+        The directory to write to, which is made if needed.
+    columns : dict
+        The dtype of each column, by name.
+    shapes : dict
+        The row shape of each column wider than one value, by name.  Columns not in it hold one value per row.
+    """
+
+    def __init__(self, directory, columns, shapes=None):
+        """Initializes the ColumnWriter class."""
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._columns = columns
+        self._files = {name: open(self.raw_path(name), "wb") for name in columns}
+        self._shapes = {name: tuple((shapes or dict()).get(name, ())) for name in columns}
+        self._rows = 0
+
+    def raw_path(self, name):
+        """Returns the path of a column's raw file, used until the writer is closed."""
+        return os.path.join(self._directory, name + ".raw")
+
+    def write(self, arrays):
+        """Appends rows to every column.  The arrays must all have the same number of rows, each of its column's row
+        shape."""
+        for name, dtype in self._columns.items():
+            array = np.ascontiguousarray(arrays[name], dtype=dtype)
+            if array.shape[1:] != self._shapes[name]:
+                raise ValueError("Column {} has rows of shape {}, expected {}".format(name, array.shape[1:],
+                                                                                     self._shapes[name]))
+            array.tofile(self._files[name])
+        self._rows += len(arrays[next(iter(self._columns))])
+
+    def get_rows(self):
+        """Returns the number of rows written so far."""
+        return self._rows
+
+    def close(self):
+        """Turns each raw file into a memory-mapped .npy file with the final shape, then removes the raw file."""
+        for name, dtype in self._columns.items():
+            self._files[name].close()
+            shape = (self._rows,) + self._shapes[name]
+            output = np.lib.format.open_memmap(os.path.join(self._directory, name + ".npy"), mode="w+", dtype=dtype,
+                                               shape=shape)
+            if self._rows:
+                output[:] = np.memmap(self.raw_path(name), dtype=dtype, mode="r", shape=shape)
+            output.flush()
+            del output
+            os.remove(self.raw_path(name))
+
+
+def run_selfplay(directory, games, policy="random", workers=None, chunk_size=8, seed=0, max_plies=200, depth=2,
+                 epsilon=0.1, hash_mb=4):
+    """Plays games of self-play across a process pool and writes their columns to a directory.  Only a bounded
+    number of chunks is in flight at once, so memory stays flat however many games are played.  Returns a dict of
+    throughput statistics, which is also written to the directory as stats.json.
+
+    Parameters
+    ----------
+    directory : string
+        The directory to write the .npy columns to.
+    games : int
+        The number of games to play.
+    policy : string
+        "random" or "engine" (see play_game).
+    workers : int
+        The number of worker processes.  Defaults to the number of CPUs.
+    chunk_size : int
+        The number of games sent to a worker at a time.
+    seed : int
+        The seed of the first game.  Game i is played with seed + i, whichever worker plays it.
+    max_plies : int
+        The number of plies after which a game is stopped as a draw.
+    depth : int
+        The engine's search depth, for the engine policy.
+    epsilon : float
+        The chance of the engine policy playing a random move instead.
+    hash_mb : float
+        The transposition table size of each worker, in MB, for the engine policy.
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = iter(range(seed, seed + games))
+    positions = ColumnWriter(directory, POSITION_COLUMNS, POSITION_SHAPES)
+    per_game = ColumnWriter(directory, GAME_COLUMNS)
+    results = {1: 0, -1: 0, 0: 0}
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(hash_mb,)) as pool:
+        in_flight = deque()
+        while True:
+            # Keep a few chunks queued per worker, then write out the oldest chunk's games.
+            while len(in_flight) < 2 * workers:
+                chunk = list(itertools.islice(seeds, chunk_size))
+                if not chunk:
+                    break
+                in_flight.append(pool.submit(play_chunk, chunk, policy, max_plies, depth, epsilon))
+            if not in_flight:
+                break
+            columns = in_flight.popleft().result()
+            columns["game"] += per_game.get_rows()
+            positions.write(columns)
+            per_game.write(columns)
+            for result in columns["game_result"]:
+                results[int(result)] += 1
+    elapsed = time.perf_counter() - start_time
+    positions.close()
+    per_game.close()
+
+    stats = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+             "policy": policy,
+             "games": per_game.get_rows(),
+             "positions": positions.get_rows(),
+             "blue_wins": results[1],
+             "red_wins": results[-1],
+             "draws": results[0],
+             "workers": workers,
+             "seconds": elapsed,
+             "games_per_sec": per_game.get_rows() / elapsed if elapsed > 0 else 0.0,
+             "games_per_sec_per_core": per_game.get_rows() / elapsed / workers if elapsed > 0 else 0.0,
+             "positions_per_sec": positions.get_rows() / elapsed if elapsed > 0 else 0.0}
+    with open(os.path.join(directory, "stats.json"), "w") as file:
+        json.dump(stats, file, indent=2)
+    return stats
+
+
+def load_selfplay(directory):
+    """Returns a dict of every column in a self-play directory, loaded as read-only memory-mapped arrays."""
+    columns = dict()
+    for name in itertools.chain(POSITION_COLUMNS, GAME_COLUMNS):
+        columns[name] = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+    return columns
+
+
+def main():
+    """Command line entry point.  Prints the throughput, and appends it to a JSON lines file to track it across
+    runs if asked."""
+    parser = argparse.ArgumentParser(description="Generate Janggi self-play data as NumPy columns.")
+    parser.add_argument("directory", help="directory to write the .npy columns to")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play (default 100)")
+    parser.add_argument("--policy", choices=POLICIES, default="random", help="move policy (default random)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default, one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=8, help="games per worker task (default 8)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game (default 0)")
+    parser.add_argument("--max-plies", type=int, default=200, help="plies before a game is drawn (default 200)")
+    parser.add_argument("--depth", type=int, default=2, help="engine search depth (default 2)")
+    parser.add_argument("--epsilon", type=float, default=0.1, help="engine policy random move chance (default 0.1)")
+    parser.add_argument("--hash", type=float, default=4, help="transposition table MB per worker (default 4)")
+    parser.add_argument("--track", help="JSON lines file to append the throughput statistics to")
+    args = parser.parse_args()
+
+    stats = run_selfplay(args.directory, args.games, args.policy, args.workers, args.chunk_size, args.seed,
+                         args.max_plies, args.depth, args.epsilon, args.hash)
+    print("%d games  %d positions  blue %d  red %d  draws %d" % (stats["games"], stats["positions"],
+                                                               stats["blue_wins"], stats["red_wins"],
+                                                               stats["draws"]), file=sys.stderr)
+    print("%.2f s  %.2f games/s  %.2f games/s per core  %.0f positions/s" % (stats["seconds"],
+                                                                            stats["games_per_sec"],
+                                                                            stats["games_per_sec_per_core"],
+                                                                            stats["positions_per_sec"]),
+          file=sys.stderr)
+    if args.track:
+        with open(args.track, "a") as file:
+            file.write(json.dumps(stats) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Author: Sean Tyler
+# Description:  Game-independent pieces shared by the alpha-beta engines (janggi_engine and builders_engine): score
+#               bounds, the search result and budget exception, and the conversion of mate scores for storing in a
+#               transposition table.
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+
+# How many nodes to search between checks of the time limit.
+CHECK_INTERVAL = 1024
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time or node budget runs out."""
+    pass
+
+
+class SearchResult:
+    """The result of a search: the best move, its score for the side to move, and the principal variation.
+
+    Parameters
+    ----------
+    best_move : tuple
+        The best move found, in the game's move format, or None if the side to move has no legal moves.
+    score : int
+        The score of the best move, from the point of view of the side to move.
+    depth : int
+        The deepest fully searched depth.
+    nodes : int
+        The number of positions searched.
+    pv : list
+        The principal variation, as a list of moves beginning with the best move.
+    """
+
+    def __init__(self, best_move, score, depth, nodes, pv):
+        """Initializes the SearchResult class."""
+        self._best_move = best_move
+        self._score = score
+        self._depth = depth
+        self._nodes = nodes
+        self._pv = pv
+
+    def get_best_move(self):
+        """Returns the best move, or None."""
+        return self._best_move
+
+    def get_score(self):
+        """Returns the score of the best move for the side to move."""
+        return self._score
+
+    def get_depth(self):
+        """Returns the deepest fully searched depth."""
+        return self._depth
+
+    def get_nodes(self):
+        """Returns the number of positions searched."""
+        return self._nodes
+
+    def get_pv(self):
+        """Returns the principal variation as a list of moves."""
+        return self._pv
+
+
+def score_to_table(score, ply):
+    """Converts a mate score from distance-to-root to distance-to-this-position, so it stays correct when the
+    position is found again at another ply."""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """Converts a stored mate score back to distance-to-root at the given ply.  The inverse of score_to_table."""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
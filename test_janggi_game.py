@@ -0,0 +1,32 @@
+# Author: Sean Tyler
+# Description:  Tests of the JanggiGame position formats.
+
+import pytest
+
+from janggi_game import JanggiGame
+
+OPENING = "RNBA1ABNR/4K4/1C5C1/P1P1P1P1P/9/9/p1p1p1p1p/1c5c1/4k4/rnba1abnr b -"
+
+
+def test_opening_round_trip():
+    """The opening survives FEN and binary round trips."""
+    game = JanggiGame()
+    assert game.to_fen() == OPENING
+    assert JanggiGame.from_fen(OPENING).to_fen() == OPENING
+    assert JanggiGame.from_bytes(game.to_bytes()).to_fen() == OPENING
+
+
+@pytest.mark.parametrize("fen", [OPENING.replace("4K4", "9"),  # No BLUE General.
+                                 OPENING.replace("4k4", "9"),  # No RED General.
+                                 OPENING.replace("4K4", "3K1K3"),  # Two BLUE Generals.
+                                 OPENING.replace("rnba1abnr", "rnbakabnr")])  # Two RED Generals.
+def test_from_fen_needs_one_general_per_side(fen):
+    """A position with no General, or two, for a side is rejected."""
+    with pytest.raises(ValueError):
+        JanggiGame.from_fen(fen)
+
+
+def test_from_bytes_needs_one_general_per_side():
+    """The binary format is checked the same way: an empty board has no Generals."""
+    with pytest.raises(ValueError):
+        JanggiGame.from_bytes(bytes(1 + 45))
@@ -0,0 +1,13 @@
+# Author: Sean Tyler
+# Description:  Tests of JanggiGame move generation against the known perft node counts.
+
+import pytest
+
+from janggi_perft import PERFT_COUNTS, load_position, perft
+
+
+@pytest.mark.parametrize("name", sorted(PERFT_COUNTS))
+def test_perft_counts(name):
+    """The leaf node counts of each stored position match the known counts to depth 2."""
+    game = load_position(name)
+    assert [perft(game, depth) for depth in (1, 2)] == list(PERFT_COUNTS[name][:2])
@@ -0,0 +1,115 @@
+# Author: Sean Tyler
+# Description:  A fixed-size transposition table for game tree searches, keyed by 64-bit position keys.  Memory is
+#               allocated once, in flat arrays sized in MB, so it stays flat however long a search runs.
+
+from array import array
+
+# Bound types of a stored score.
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# Each entry is two 64-bit words: the full position key, and a packed data word laid out as
+#   bits 0-19  best move + 1 (0 for no move)
+#   bits 20-27 depth
+#   bits 28-29 bound type (0 for an empty slot)
+#   bits 30-61 score + 2**31
+#   bits 62-63 search generation, for ageing out entries from earlier searches
+ENTRY_BYTES = 16
+MOVE_BITS = 20
+SCORE_OFFSET = 1 << 31
+
+
+class TranspositionTable:
+    """A transposition table of two-slot buckets.  The first slot of each bucket is depth-preferred: it is only
+    replaced by a search at least as deep, or by any entry once it is left over from an earlier search.  The second
+    slot is always replaced, so recent positions are kept too.
+
+    Parameters
+    ----------
+    size_mb : float
+        The size of the table in megabytes.
+    """
+
+    def __init__(self, size_mb=16):
+        """Initializes the TranspositionTable class."""
+        self._buckets = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_BYTES))
+        self._keys = array("Q", bytes(16 * self._buckets))
+        self._data = array("Q", bytes(16 * self._buckets))
+        self._generation = 0
+        self._probes = 0
+        self._hits = 0
+        self._stores = 0
+        self._replacements = 0
+
+    def probe(self, key):
+        """Looks up a position key.  Returns a tuple of (depth, bound, score, move) if the position is stored, where
+        move may be None, or None if it is not."""
+        self._probes += 1
+        slot = 2 * (key % self._buckets)
+        for index in (slot, slot + 1):
+            data = self._data[index]
+            if self._keys[index] == key and data >> 28 & 3:
+                self._hits += 1
+                move = (data & ((1 << MOVE_BITS) - 1)) - 1
+                return (data >> 20 & 255, data >> 28 & 3, (data >> 30 & 0xFFFFFFFF) - SCORE_OFFSET,
+                        None if move < 0 else move)
+        return None
+
+    def store(self, key, depth, bound, score, move=None):
+        """Stores a search result for a position key.
+
+        Parameters
+        ----------
+        key : int
+            The 64-bit position key.
+        depth : int
+            The depth searched below the position, from 0 to 255.
+        bound : int
+            EXACT, LOWER (the score is at least this) or UPPER (the score is at most this).
+        score : int
+            The score, which must fit in a signed 32-bit integer.
+        move : int
+            The best move found, as an integer below 2**20, or None.
+        """
+        self._stores += 1
+        data = ((0 if move is None else move + 1) | min(depth, 255) << 20 | bound << 28 |
+                (score + SCORE_OFFSET) << 30 | self._generation << 62)
+        slot = 2 * (key % self._buckets)
+
+        # Use the depth-preferred slot if it holds this position, is empty or stale, or is searched less deeply.
+        stored = self._data[slot]
+        if (self._keys[slot] == key or not stored >> 28 & 3 or stored >> 62 != self._generation or
+                depth >= (stored >> 20 & 255)):
+            index = slot
+        else:
+            index = slot + 1
+        if self._data[index] >> 28 & 3 and self._keys[index] != key:
+            self._replacements += 1
+        self._keys[index] = key
+        self._data[index] = data
+
+    def new_search(self):
+        """Marks the start of a new search, so entries from earlier searches can be replaced first."""
+        self._generation = (self._generation + 1) & 3
+
+    def clear(self):
+        """Empties the table and resets the counters."""
+        self._keys = array("Q", bytes(16 * self._buckets))
+        self._data = array("Q", bytes(16 * self._buckets))
+        self._generation = 0
+        self._probes = 0
+        self._hits = 0
+        self._stores = 0
+        self._replacements = 0
+
+    def get_stats(self):
+        """Returns a dict of counters for export: probes, hits, hit_rate, stores, replacements, entries (the
+        table capacity) and size_mb."""
+        return {"probes": self._probes,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._probes if self._probes else 0.0,
+                "stores": self._stores,
+                "replacements": self._replacements,
+                "entries": 2 * self._buckets,
+                "size_mb": 2 * self._buckets * ENTRY_BYTES / (1024 * 1024)}